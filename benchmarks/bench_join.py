@@ -0,0 +1,90 @@
+"""
+Benchmark: per-site filtered merge_asof (old join path) vs single-pass grouped merge_asof.
+
+Run from the repo root:
+  python -m benchmarks.bench_join --sites 500 --weather-rows 10000000 --rail-rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.join_weather_rail import _align_nearest_time
+from src.config import TIME_TOL_MINUTES
+from src.io_schema import WEATHER
+
+from .synthetic import make_sites, make_weather
+
+def make_synthetic(n_sites: int, weather_rows: int, rail_rows: int, seed: int = 0):
+    """synthetic.make_weather history (about weather_rows rows) plus rail events already assigned to a site."""
+    rng = np.random.default_rng(seed)
+    days = max(1, -(-weather_rows // (n_sites * 24)))
+    site_df = make_sites(n_sites, seed)
+    weather, _ = make_weather(site_df, days, missing_frac=0.0, seed=seed)
+    weather = weather.rename(columns={WEATHER["time"]: "_t"})
+
+    sites = site_df[WEATHER["site"]].to_numpy(dtype=object)
+    t0 = weather["_t"].min()
+    rail = pd.DataFrame({
+        "_t": t0 + pd.to_timedelta(rng.integers(0, days * 24 * 60, rail_rows), unit="min"),
+        "_nearest_site": sites[rng.integers(0, n_sites, rail_rows)],
+        "delay_minutes": rng.exponential(3.0, rail_rows),
+    })
+    return rail, weather
+
+def legacy_align_per_site(rail: pd.DataFrame, w: pd.DataFrame, time_tolerance_minutes: int):
+    """The pre-single-pass join: filter the whole weather frame once per site."""
+    rail = rail.sort_values("_t")
+    w = w.sort_values("_t")
+    tol = pd.Timedelta(minutes=int(time_tolerance_minutes))
+
+    joined_parts = []
+    dropped_time = 0
+    for site, rail_part in rail.groupby("_nearest_site", sort=False):
+        w_part = w[w[WEATHER["site"]] == site].copy()
+        if w_part.empty:
+            dropped_time += len(rail_part)
+            continue
+        keep_cols = ["_t", WEATHER["site"], WEATHER["lat"], WEATHER["lon"]] + WEATHER["features"]
+        w_part = w_part[keep_cols].dropna(subset=["_t"])
+        merged = pd.merge_asof(
+            rail_part.sort_values("_t"),
+            w_part.sort_values("_t"),
+            on="_t",
+            direction="nearest",
+            tolerance=tol,
+        )
+        ok = merged[WEATHER["features"][0]].notna()
+        dropped_time += int((~ok).sum())
+        joined_parts.append(merged[ok].copy())
+
+    joined = pd.concat(joined_parts, ignore_index=True) if joined_parts else rail.iloc[0:0].copy()
+    return joined, dropped_time
+
+def _timed(fn, *args):
+    t = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sites", type=int, default=500)
+    ap.add_argument("--weather-rows", type=int, default=10_000_000)
+    ap.add_argument("--rail-rows", type=int, default=1_000_000)
+    ap.add_argument("--skip-legacy", action="store_true", help="Only time the single-pass join")
+    args = ap.parse_args()
+
+    rail, weather = make_synthetic(args.sites, args.weather_rows, args.rail_rows)
+    print(f"sites={args.sites} weather_rows={len(weather)} rail_rows={len(rail)}")
+
+    (new, new_dropped), t_new = _timed(_align_nearest_time, rail, weather, TIME_TOL_MINUTES)
+    print(f"single-pass merge_asof(by=): {t_new:8.2f}s rows={len(new)} dropped_time={new_dropped}")
+
+    if not args.skip_legacy:
+        (old, old_dropped), t_old = _timed(legacy_align_per_site, rail, weather, TIME_TOL_MINUTES)
+        print(f"per-site filter + merge_asof: {t_old:8.2f}s rows={len(old)} dropped_time={old_dropped}")
+        print(f"speedup: {t_old / t_new:.1f}x")
+
+if __name__ == "__main__":
+    main()
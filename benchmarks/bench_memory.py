@@ -0,0 +1,76 @@
+"""
+Benchmark: peak traced memory of the join and make_xy, plus the size of what they return.
+make_xy is compared with the previous float64/object version that copied the frame three times.
+
+Run from the repo root:
+  python -m benchmarks.bench_memory --events 1000000 --sites 200 --days 420
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.config import TARGET_COL
+from src.features import make_xy, window_feature_names
+from src.io_schema import WEATHER
+from src.join_weather_rail import join_rail_with_weather
+
+from .synthetic import make_dataset
+
+def legacy_make_xy(df: pd.DataFrame):
+    """make_xy before the compact-dtype rewrite: full copies, int64/float64 throughout."""
+    out = df.copy()
+    t = pd.to_datetime(out["_t"], utc=True)
+    out["hour"] = t.dt.hour
+    out["dow"] = t.dt.dayofweek
+    out["month"] = t.dt.month
+    out["is_weekend"] = (out["dow"] >= 5).astype(int)
+
+    feats = [c for c in WEATHER["features"] + window_feature_names() if c in out.columns]
+    feats += ["hour", "dow", "month", "is_weekend", "_site_dist_km"]
+    X = out[feats].copy()
+    y = out[TARGET_COL].astype(float).copy()
+    X = X.replace([np.inf, -np.inf], np.nan).fillna(0.0)
+    return X, y
+
+def _measure(fn, *args):
+    gc.collect()
+    tracemalloc.start()
+    t = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak / 2**20
+
+def _frame_mb(*frames) -> float:
+    return sum(float(f.memory_usage(deep=True).sum()) for f in frames) / 2**20
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=1_000_000)
+    ap.add_argument("--sites", type=int, default=200)
+    ap.add_argument("--days", type=int, default=420)
+    args = ap.parse_args()
+
+    rail, weather = make_dataset(args.events, args.sites, args.days)
+    print(f"sites={args.sites} weather_rows={len(weather)} rail_rows={len(rail)} inputs={_frame_mb(rail, weather):.0f} MiB")
+
+    (joined, _), t_join, peak_join = _measure(join_rail_with_weather, rail, weather)
+    print(f"join_rail_with_weather: {t_join:6.2f}s peak={peak_join:7.0f} MiB output={_frame_mb(joined):6.0f} MiB rows={len(joined)}")
+    del rail, weather
+    gc.collect()
+
+    (X, y), t_new, peak_new = _measure(make_xy, joined)
+    new_mb = _frame_mb(X, y.to_frame())
+    del X, y
+    (X, y), t_old, peak_old = _measure(legacy_make_xy, joined)
+    old_mb = _frame_mb(X, y.to_frame())
+    print(f"make_xy (legacy):       {t_old:6.2f}s peak={peak_old:7.0f} MiB output={old_mb:6.0f} MiB")
+    print(f"make_xy (compact):      {t_new:6.2f}s peak={peak_new:7.0f} MiB output={new_mb:6.0f} MiB")
+
+if __name__ == "__main__":
+    main()
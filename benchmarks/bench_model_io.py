@@ -0,0 +1,87 @@
+"""
+Benchmark: size on disk and load time of saved models, comparing the plain joblib.dump the
+scripts used before with ModelArtifact files at several compression levels (and level 0
+loaded with mmap). Predictions from every reloaded model are checked against the original.
+
+Run from the repo root:
+  python -m benchmarks.bench_model_io --events 200000 --train-rows 20000 --trees 400
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+
+from src.config import RANDOM_SEED
+from src.features import make_xy
+from src.join_weather_rail import join_rail_with_weather
+from src.model import load_model, save_model, train_hist_gradient_boosting
+
+from .synthetic import make_dataset
+
+def _timed_load(fn, repeats: int):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        model = fn()
+        times.append(time.perf_counter() - t)
+    return model, statistics.median(times)
+
+def bench(name: str, model, X, tmp: str, repeats: int) -> None:
+    expected = model.predict(X)
+    variants = [
+        ("joblib.dump (before)", lambda p: joblib.dump(model, p), lambda p: joblib.load(p)),
+        ("artifact compress=0", lambda p: save_model(model, p, compress=0), lambda p: load_model(p)),
+        ("artifact compress=0 mmap", None, lambda p: load_model(p, mmap=True)),
+        ("artifact compress=1", lambda p: save_model(model, p, compress=1), lambda p: load_model(p)),
+        ("artifact compress=3", lambda p: save_model(model, p, compress=3), lambda p: load_model(p)),
+        ("artifact compress=9", lambda p: save_model(model, p, compress=9), lambda p: load_model(p)),
+    ]
+    print(f"\n{name}")
+    print(f"  {'format':<26} {'size MiB':>9} {'save s':>8} {'load s':>8}")
+    path = None
+    for label, save, load in variants:
+        if save is not None:
+            path = os.path.join(tmp, f"{name}-{label.split()[-1]}.joblib")
+            t = time.perf_counter()
+            save(path)
+            save_s = time.perf_counter() - t
+        else:
+            save_s = float("nan")
+        loaded, load_s = _timed_load(lambda: load(path), repeats)
+        if not np.array_equal(loaded.predict(X), expected):
+            raise AssertionError(f"{name} {label}: predictions changed after reload")
+        print(f"  {label:<26} {os.path.getsize(path) / 2**20:9.1f} {save_s:8.2f} {load_s:8.3f}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=200_000)
+    ap.add_argument("--sites", type=int, default=60)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--train-rows", type=int, default=20_000)
+    ap.add_argument("--trees", type=int, default=400, help="Forest size (train_random_forest uses 400)")
+    ap.add_argument("--repeats", type=int, default=3, help="Loads per format; the median is reported")
+    args = ap.parse_args()
+
+    rail, weather = make_dataset(args.events, args.sites, args.days)
+    joined, _ = join_rail_with_weather(rail, weather)
+    X, y = make_xy(joined)
+    n = min(args.train_rows, len(X))
+    sample = np.random.default_rng(RANDOM_SEED).choice(len(X), n, replace=False)
+    X, y = X.iloc[sample], y.iloc[sample]
+
+    # Same settings as train_random_forest, tree count aside
+    rf = RandomForestRegressor(n_estimators=args.trees, random_state=RANDOM_SEED, n_jobs=-1, min_samples_leaf=2).fit(X, y)
+    Xc, yc = make_xy(joined.iloc[sample], categorical=True)
+    hgb = train_hist_gradient_boosting(Xc, yc).model
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench(f"random_forest ({args.trees} trees, {n} rows)", rf, X, tmp, args.repeats)
+        bench(f"hist_gradient_boosting ({hgb.n_iter_} iterations)", hgb, Xc, tmp, args.repeats)
+
+if __name__ == "__main__":
+    main()
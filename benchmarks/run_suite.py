@@ -0,0 +1,135 @@
+"""
+Benchmark suite: times the pipeline stages on synthetic data and writes machine-readable results,
+so runs on different commits can be compared.
+
+Stages: join_rail_with_weather -> make_xy -> train_random_forest -> predict.
+Each records wall time, rows, rows/s and peak RSS growth; --tracemalloc also records the peak of
+Python/NumPy allocations (slower, so timings from such runs aren't comparable with plain ones).
+
+Run from the repo root:
+  python -m benchmarks.run_suite --events 500000 --sites 60 --days 365 --out bench/HEAD.json
+  python -m benchmarks.run_suite ... --compare bench/base.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from src.config import RANDOM_SEED
+from src.features import make_xy
+from src.join_weather_rail import join_rail_with_weather
+from src.model import train_random_forest
+from src.profiling import max_rss_mb
+
+from .synthetic import make_dataset
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Suite:
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.stages: dict[str, dict] = {}
+
+    def run(self, name: str, rows: int, fn, *args, **kwargs):
+        rss_before = max_rss_mb()
+        if self.trace_memory:
+            tracemalloc.start()
+        t = time.perf_counter()
+        out = fn(*args, **kwargs)
+        seconds = time.perf_counter() - t
+
+        rec = {
+            "seconds": round(seconds, 4),
+            "rows": int(rows),
+            "rows_per_s": round(rows / seconds, 1) if seconds > 0 else None,
+            # High-water mark of the process; growth is what this stage added on top of earlier ones
+            "peak_rss_mb": round(max_rss_mb(), 1),
+            "rss_growth_mb": round(max(0.0, max_rss_mb() - rss_before), 1),
+        }
+        if self.trace_memory:
+            rec["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            tracemalloc.stop()
+        self.stages[name] = rec
+        print(f"{name:<22} {seconds:8.2f}s rows={rows:<9} peak_rss={rec['peak_rss_mb']:.0f} MiB"
+              + (f" traced_peak={rec['traced_peak_mb']:.0f} MiB" if self.trace_memory else ""))
+        return out
+
+def compare(current: dict, baseline: dict) -> None:
+    print(f"\nvs {baseline.get('commit') or 'baseline'} (time ratio, >1 = slower now):")
+    for name, rec in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base or not base.get("seconds"):
+            print(f"  {name:<22} (no baseline)")
+            continue
+        ratio = rec["seconds"] / base["seconds"]
+        print(f"  {name:<22} {base['seconds']:8.2f}s -> {rec['seconds']:8.2f}s  x{ratio:.2f}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=500_000, help="Rail events")
+    ap.add_argument("--sites", type=int, default=60, help="Weather sites")
+    ap.add_argument("--days", type=int, default=365, help="Days of hourly weather per site")
+    ap.add_argument("--train-rows", type=int, default=50_000,
+                    help="Rows sampled for train_random_forest (the forest dominates otherwise)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tracemalloc", action="store_true", help="Also record traced allocation peaks (slower)")
+    ap.add_argument("--out", default=None, help="Write results JSON here")
+    ap.add_argument("--compare", default=None, help="Baseline results JSON to compare against")
+    args = ap.parse_args()
+
+    rail, weather = make_dataset(args.events, args.sites, args.days, seed=args.seed)
+    print(f"events={len(rail)} weather_rows={len(weather)} sites={args.sites} days={args.days}")
+
+    suite = Suite(trace_memory=args.tracemalloc)
+    joined, stats = suite.run("join_rail_with_weather", len(rail), join_rail_with_weather, rail, weather)
+    del rail, weather
+
+    X, y = suite.run("make_xy", len(joined), make_xy, joined)
+
+    n_train = min(args.train_rows, len(X))
+    sample = np.random.default_rng(RANDOM_SEED).choice(len(X), n_train, replace=False)
+    res = suite.run("train_random_forest", n_train, train_random_forest, X.iloc[sample], y.iloc[sample])
+    suite.run("predict", len(X), res.model.predict, X)
+
+    results = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "versions": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "sklearn": sklearn.__version__,
+        },
+        "params": vars(args),
+        "join": {k: int(v) for k, v in vars(stats).items()},
+        "metrics": {"mae": res.mae, "r2": res.r2},
+        "stages": suite.stages,
+    }
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
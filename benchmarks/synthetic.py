@@ -0,0 +1,166 @@
+"""
+Synthetic inputs at configurable scale: rail delay events at Welsh stations and MIDAS-like
+hourly weather, in the same CSV shapes fetchhsp.py and midas.py write.
+
+Delays respond to the weather at the nearest site (rain totals, wind) so trained models have
+signal to find. Write a dataset to disk with:
+  python -m benchmarks.synthetic --events 200000 --sites 60 --days 365 \\
+      --rail-out data/raw/rail_delays_wales.csv --weather-out data/raw/metoffice_weather_wales.csv
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from src.geo import SiteIndex
+from src.io_schema import RAIL, WEATHER
+
+# Rough bounding box for Wales
+LAT_RANGE = (51.35, 53.45)
+LON_RANGE = (-5.30, -2.65)
+
+# CRS code, approximate station coordinates
+WELSH_STATIONS = [
+    ("CDF", 51.4752, -3.1791), ("CDQ", 51.4821, -3.1701), ("NWP", 51.5885, -2.9981),
+    ("SWA", 51.6251, -3.9416), ("BGN", 51.5070, -3.5752), ("NTH", 51.6624, -3.8072),
+    ("PTA", 51.5917, -3.7810), ("LLE", 51.6738, -4.1615), ("CMN", 51.8530, -4.3059),
+    ("HVF", 51.8021, -4.9597), ("MFH", 51.7150, -5.0410), ("FGW", 51.9986, -4.9792),
+    ("PMD", 51.6937, -4.9382), ("TEN", 51.6726, -4.7065), ("WTS", 51.7963, -4.9255),
+    ("AYW", 52.4140, -4.0818), ("MCN", 52.5950, -3.8543), ("NWT", 52.5123, -3.3114),
+    ("WLP", 52.6576, -3.1398), ("BAN", 53.2224, -4.1359), ("HHD", 53.3077, -4.6310),
+    ("LLJ", 53.2840, -3.8090), ("RHL", 53.3183, -3.4893), ("PRT", 53.3366, -3.4072),
+    ("FLN", 53.2494, -3.1329), ("WRX", 53.0502, -3.0025), ("RUA", 52.9857, -3.0575),
+    ("CRV", 53.1394, -4.2769), ("MTH", 51.7440, -3.3778), ("ABA", 51.7150, -3.4430),
+    ("TRE", 51.6724, -3.5363), ("PPD", 51.5993, -3.3415), ("CPH", 51.5716, -3.2185),
+    ("RHY", 51.7589, -3.2898), ("EBV", 51.7770, -3.2040), ("BRY", 51.3968, -3.2850),
+    ("PNA", 51.4359, -3.1741), ("MST", 51.6101, -3.6546), ("AGV", 51.8167, -3.0097),
+    ("CWM", 51.6566, -3.0163), ("CPW", 51.6402, -2.6718), ("LLO", 52.2427, -3.3795),
+    ("BHR", 52.1693, -3.4269), ("LLW", 52.1055, -3.6387), ("PWL", 52.8878, -4.4168),
+    ("BMH", 52.7224, -4.0560), ("HLC", 52.8589, -4.1095), ("BLN", 52.9942, -3.9392),
+]
+
+def make_sites(n_sites: int, seed: int = 0) -> pd.DataFrame:
+    """Weather sites scattered over Wales, named like MIDAS station folders."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        WEATHER["site"]: [f"{i:05d}_synthetic-{i}" for i in range(n_sites)],
+        WEATHER["lat"]: rng.uniform(*LAT_RANGE, n_sites),
+        WEATHER["lon"]: rng.uniform(*LON_RANGE, n_sites),
+    })
+
+def _weather_grid(n_sites: int, hours: int, seed: int) -> dict[str, np.ndarray]:
+    """(n_sites, hours) arrays: diurnal/seasonal temperature, showery rain, gusty wind."""
+    rng = np.random.default_rng(seed + 1)
+    h = np.arange(hours)
+    day = np.sin(2 * np.pi * (h % 24 - 9) / 24)
+    year = -np.cos(2 * np.pi * h / (24 * 365.25))
+    temp = 10 + 6 * year + 3 * day + rng.normal(0, 1.5, (n_sites, hours))
+
+    # Wet spells: rain falls in runs of hours, heavier in winter
+    wet = rng.random((n_sites, hours)) < 0.12 + 0.06 * -year
+    wet |= np.roll(wet, 1, axis=1) & (rng.random((n_sites, hours)) < 0.6)
+    rain = np.where(wet, rng.gamma(1.2, 0.9, (n_sites, hours)), 0.0)
+    wind = rng.gamma(2.0, 2.2, (n_sites, hours)) * (1 + 0.3 * -year)
+    return {"air_temp_c": temp, "rain_mm": rain, "wind_speed_mps": wind}
+
+def make_weather(
+    sites: pd.DataFrame,
+    days: int,
+    start: str = "2023-01-01",
+    missing_frac: float = 0.03,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    """
+    Hourly observations for every site (midas.py output shape), with a fraction of readings
+    dropped as station gaps. Also returns the full (site, hour) grids the delays are drawn from.
+    """
+    rng = np.random.default_rng(seed + 2)
+    n_sites, hours = len(sites), int(days) * 24
+    grid = _weather_grid(n_sites, hours, seed)
+    times = pd.date_range(start, periods=hours, freq="h", tz="UTC")
+
+    keep = rng.random(n_sites * hours) >= missing_frac
+    weather = pd.DataFrame({
+        WEATHER["time"]: np.tile(times, n_sites)[keep],
+        WEATHER["site"]: np.repeat(sites[WEATHER["site"]].to_numpy(), hours)[keep],
+        WEATHER["lat"]: np.repeat(sites[WEATHER["lat"]].to_numpy(), hours)[keep],
+        WEATHER["lon"]: np.repeat(sites[WEATHER["lon"]].to_numpy(), hours)[keep],
+    })
+    for c in WEATHER["features"]:
+        if c in grid:
+            weather[c] = grid[c].ravel()[keep].astype(np.float32)
+    return weather, grid
+
+def make_rail(
+    sites: pd.DataFrame,
+    grid: dict[str, np.ndarray],
+    n_events: int,
+    start: str = "2023-01-01",
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Delay events at WELSH_STATIONS over the weather grid's time span (fetchhsp.py output shape).
+    Delay = heavy-tailed base + effects of 6h rain at the nearest site, wind and peak hours.
+    """
+    rng = np.random.default_rng(seed + 3)
+    hours = next(iter(grid.values())).shape[1]
+    crs = np.array([s[0] for s in WELSH_STATIONS], dtype=object)
+    st_lat = np.array([s[1] for s in WELSH_STATIONS])
+    st_lon = np.array([s[2] for s in WELSH_STATIONS])
+
+    # Busier stations (the first few) get more events
+    weights = 1.0 / np.arange(1, len(crs) + 1) ** 0.7
+    stn = rng.choice(len(crs), n_events, p=weights / weights.sum())
+    minutes = np.sort(rng.integers(0, hours * 60, n_events))
+    hour = minutes // 60
+
+    site_idx, _ = SiteIndex.from_frame(sites, WEATHER["site"], WEATHER["lat"], WEATHER["lon"]).nearest(st_lat, st_lon)
+    site = site_idx[stn]
+    rain_cum = np.cumsum(grid["rain_mm"], axis=1)
+    rain_6h = rain_cum[site, hour] - rain_cum[site, np.maximum(hour - 6, 0)]
+    wind = grid["wind_speed_mps"][site, hour]
+    hod = hour % 24
+    peak = ((hod >= 7) & (hod <= 9)) | ((hod >= 16) & (hod <= 18))
+
+    delay = (
+        rng.exponential(1.5, n_events)
+        + 2.0 * rain_6h
+        + 0.4 * np.maximum(wind - 8, 0) ** 1.5
+        + 2.5 * peak
+        + rng.normal(0, 1.0, n_events)
+    )
+    # Most services run roughly to time; early arrivals show up as small negatives
+    delay = np.where(rng.random(n_events) < 0.2, rng.normal(0, 0.7, n_events), delay)
+
+    return pd.DataFrame({
+        RAIL["time"]: pd.Timestamp(start, tz="UTC") + pd.to_timedelta(minutes, unit="min"),
+        RAIL["station"]: crs[stn],
+        RAIL["target"]: np.round(delay, 1),
+        RAIL["lat"]: st_lat[stn],
+        RAIL["lon"]: st_lon[stn],
+    })
+
+def make_dataset(n_events: int, n_sites: int, days: int, seed: int = 0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(rail, weather) frames ready for join_rail_with_weather."""
+    sites = make_sites(n_sites, seed)
+    weather, grid = make_weather(sites, days, seed=seed)
+    rail = make_rail(sites, grid, n_events, seed=seed)
+    return rail, weather
+
+def main():
+    ap = argparse.ArgumentParser(description="Write synthetic rail + weather CSVs")
+    ap.add_argument("--events", type=int, default=200_000)
+    ap.add_argument("--sites", type=int, default=60)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--rail-out", required=True)
+    ap.add_argument("--weather-out", required=True)
+    args = ap.parse_args()
+
+    rail, weather = make_dataset(args.events, args.sites, args.days, seed=args.seed)
+    rail.to_csv(args.rail_out, index=False)
+    weather.to_csv(args.weather_out, index=False)
+    print(f"Wrote: {args.rail_out} rows={len(rail)}, {args.weather_out} rows={len(weather)}")
+
+if __name__ == "__main__":
+    main()
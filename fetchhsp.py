@@ -1,15 +1,44 @@
 import os
 import csv
 import json
+import time
+import random
+import shutil
+import sqlite3
 import argparse
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, Container, Iterable, Iterator, List, Optional
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import requests
+from requests.adapters import HTTPAdapter
+
+from src.profiling import profile_run, stage
+
 
+HSP_BASE_URL = "https://hsp-prod.rockshore.net/api/v1"
+HSP_METRICS_URL = f"{HSP_BASE_URL}/serviceMetrics"
+HSP_DETAILS_URL = f"{HSP_BASE_URL}/serviceDetails"
 
-HSP_METRICS_URL = "https://hsp-prod.rockshore.net/api/v1/serviceMetrics"
-HSP_DETAILS_URL = "https://hsp-prod.rockshore.net/api/v1/serviceDetails"
+ROW_FIELDS = ["event_time", "station_name", "delay_minutes", "delay_basis", "rid", "lat", "lon"]
+
+# Calling points kept in batch mode when no --stations file is given: stations in Wales only
+# (border routes also call at English stations, which must not end up in the training data)
+WELSH_CRS = {
+    "ABA", "AGL", "AGV", "AMF", "AVY", "AYW", "BFF", "BGD", "BGN", "BNG", "BRY", "BYC",
+    "BYI", "CCC", "CDB", "CDF", "CDQ", "CDT", "CMN", "CNW", "CPH", "CPW", "CRK", "CWB",
+    "CWM", "EBB", "EBV", "FGH", "FLN", "HHD", "HRL", "HVF", "LLD", "LLE", "LLJ", "LLO",
+    "LLV", "LWM", "MCN", "MER", "MFH", "MST", "NTH", "NWP", "NWT", "PCD", "PMD", "PNA",
+    "PPD", "PPL", "PRT", "PTA", "PTM", "PWL", "PYL", "RDR", "RHL", "RHY", "RIA", "RUA",
+    "SHT", "STJ", "SWA", "TEN", "TRE", "TYW", "WLP", "WRX", "WTL", "YSM",
+}
 
 print("Running fetchhsp.py")
 def env_creds():
@@ -24,21 +53,21 @@ def env_creds():
         )
     return user, pw
 
+def make_session(pool_size: int = 8) -> requests.Session:
+    """Keep-alive session whose connection pool can serve pool_size concurrent requests."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-import time
-import requests
-
-import time, random
-import requests
-import json
 
-def post_json(url: str, payload: dict, auth, timeout=120, retries=6) -> dict:
+def post_json(url: str, payload: dict, auth, timeout=120, retries=6, session: Optional[requests.Session] = None) -> dict:
     retry_statuses = {502, 503, 504}
+    http = session or requests
     for attempt in range(1, retries + 1):
-        print("This is retry number"+retries)
         try:
-            print("try loop started")
-            r = requests.post(url, json=payload, auth=auth, timeout=timeout)
+            r = http.post(url, json=payload, auth=auth, timeout=timeout)
 
             # Retryable server errors
             if r.status_code in retry_statuses:
@@ -67,6 +96,264 @@ def post_json(url: str, payload: dict, auth, timeout=120, retries=6) -> dict:
     raise RuntimeError("HSP failed after retries (server 5xx / timeouts). Try smaller time windows or later.")
 
 
+def split_date_range(start: str, end: str, window_days: int) -> List[tuple]:
+    """Split an inclusive YYYY-MM-DD range into consecutive inclusive windows of window_days."""
+    d0 = datetime.strptime(start, "%Y-%m-%d").date()
+    d1 = datetime.strptime(end, "%Y-%m-%d").date()
+    step = timedelta(days=max(1, int(window_days)))
+    windows = []
+    while d0 <= d1:
+        w1 = min(d0 + step - timedelta(days=1), d1)
+        windows.append((d0.isoformat(), w1.isoformat()))
+        d0 = w1 + timedelta(days=1)
+    return windows
+
+
+def extract_services(metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+    for k in ["Services", "services", "serviceMetrics", "ServiceMetrics"]:
+        if k in metrics and isinstance(metrics[k], list):
+            return metrics[k]
+    for v in metrics.values():
+        if isinstance(v, list):
+            return v
+    return []
+
+
+def extract_rids(services: List[Dict[str, Any]]) -> List[str]:
+    """RIDs in first-seen order, without duplicates (windows and day types can overlap)."""
+    seen = {}
+    for s in services:
+        rid = s.get("rid") or s.get("RID") or s.get("serviceRid")
+        if rid:
+            seen.setdefault(rid, None)
+        # HSP nests a list of RIDs under serviceAttributesMetrics
+        attrs = s.get("serviceAttributesMetrics")
+        if isinstance(attrs, dict):
+            for rid in attrs.get("rids") or []:
+                seen.setdefault(rid, None)
+    return list(seen)
+
+
+def fetch_service_metrics(
+    url: str,
+    from_crs: str,
+    to_crs: str,
+    start: str,
+    end: str,
+    day_type: str,
+    auth,
+    session: Optional[requests.Session] = None,
+    retries: int = 3,
+) -> List[Dict[str, Any]]:
+    """
+    serviceMetrics for one inclusive date window. If the window keeps failing
+    (5xx / timeouts) it is split in half and each half is fetched on its own,
+    down to single days, which get the full retry budget before giving up.
+    """
+    payload = {
+        "from_loc": from_crs,
+        "to_loc": to_crs,
+        "from_time": "0600",
+        "to_time": "2200",
+        "from_date": start,
+        "to_date": end,
+        "days": day_type,
+    }
+    d0 = datetime.strptime(start, "%Y-%m-%d").date()
+    d1 = datetime.strptime(end, "%Y-%m-%d").date()
+    can_split = d0 < d1
+    try:
+        # A single day can't be split further, so give it the full retry budget
+        tries = retries if can_split else max(retries, 6)
+        return extract_services(post_json(url, payload, auth=auth, retries=tries, session=session))
+    except RuntimeError:
+        if not can_split:
+            raise
+        mid = d0 + (d1 - d0) // 2
+        print(f"[WARN] serviceMetrics {start}..{end} {day_type} failed; splitting at {mid.isoformat()}")
+        left = fetch_service_metrics(url, from_crs, to_crs, start, mid.isoformat(), day_type, auth, session, retries)
+        right = fetch_service_metrics(
+            url, from_crs, to_crs, (mid + timedelta(days=1)).isoformat(), end, day_type, auth, session, retries
+        )
+        return left + right
+
+
+def ordered_map(fn: Callable, items: Iterable, concurrency: int) -> Iterator:
+    """
+    Like map(fn, items) but runs up to `concurrency` calls at once on a thread pool.
+    Results come back in input order; at most 2 * concurrency calls are queued at a time,
+    so a slow request only holds back the results behind it, not the other workers.
+    """
+    if concurrency <= 1:
+        yield from map(fn, items)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= 2 * concurrency:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class DetailsCache:
+    """
+    Persistent serviceDetails cache keyed by RID (RIDs are immutable historic records).
+    Payloads are zlib-compressed JSON in a single SQLite file; once the total payload size
+    exceeds max_bytes the least recently used entries are evicted.
+    Safe to share between fetch threads.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS details ("
+            "rid TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS details_lru ON details(last_access)")
+        self._db.commit()
+        self.total_bytes = int(self._db.execute("SELECT COALESCE(SUM(size), 0) FROM details").fetchone()[0])
+
+    def get(self, rid: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM details WHERE rid = ?", (rid,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE details SET last_access = ? WHERE rid = ?", (time.time(), rid))
+            self._db.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, rid: str, details: dict) -> None:
+        blob = zlib.compress(json.dumps(details, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM details WHERE rid = ?", (rid,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO details (rid, payload, size, last_access) VALUES (?, ?, ?, ?)",
+                (rid, blob, len(blob), time.time()),
+            )
+            self.total_bytes += len(blob) - (old[0] if old else 0)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        # Drop least recently used entries until we're back under the cap
+        for rid, size in self._db.execute("SELECT rid, size FROM details ORDER BY last_access").fetchall():
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM details WHERE rid = ?", (rid,))
+            self.total_bytes -= size
+
+    def __iter__(self) -> Iterator[tuple]:
+        """(rid, details) for every cached payload, read a page at a time."""
+        last = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT rowid, rid, payload FROM details WHERE rowid > ? ORDER BY rowid LIMIT 1000", (last,)
+                ).fetchall()
+            if not rows:
+                return
+            for last, rid, blob in rows:
+                yield rid, json.loads(zlib.decompress(blob))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class RidCheckpoint:
+    """Append-only record of RIDs whose rows have already been flushed to the output."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def mark(self, rids: List[str]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{rid}\n" for rid in rids)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(rids)
+
+
+class CsvRowSink:
+    """
+    Appends row batches to a CSV, writing the header only when the file is new.
+    Appending to an existing file is refused unless its header matches fieldnames
+    (e.g. a CSV from before lat/lon/rid were added), so columns never end up misaligned.
+    """
+
+    def __init__(self, path: str, fieldnames: List[str]):
+        self.path = path
+        self.fieldnames = fieldnames
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+            if header != list(fieldnames):
+                raise SystemExit(
+                    f"{path} has columns {header}, expected {list(fieldnames)}.\n"
+                    "Rerun with --fresh to start a new file, or pass a different --out."
+                )
+
+    def rids(self) -> set:
+        """RIDs that already have rows in the file."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return set()
+        return set(pd.read_csv(self.path, usecols=["rid"], dtype=str)["rid"].dropna())
+
+    def write(self, rows: pd.DataFrame) -> None:
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            rows.reindex(columns=self.fieldnames).to_csv(f, header=new, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ParquetRowSink:
+    """Writes each row batch as a new part file in a Parquet dataset directory."""
+
+    def __init__(self, path: str, fieldnames: List[str]):
+        self.path = path
+        self.fieldnames = fieldnames
+        os.makedirs(path, exist_ok=True)
+        self.parts = len([p for p in os.listdir(path) if p.endswith(".parquet")])
+
+    def rids(self) -> set:
+        """RIDs that already have rows in the dataset."""
+        if not self.parts:
+            return set()
+        return set(pd.read_parquet(self.path, columns=["rid"])["rid"].dropna().astype(str))
+
+    def write(self, rows: pd.DataFrame) -> None:
+        df = rows.reindex(columns=self.fieldnames)
+        for c in ["delay_minutes", "lat", "lon"]:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        # Written under a dot-prefixed name first, so a crash never leaves half a part behind
+        name = f"part-{self.parts:05d}.parquet"
+        tmp = os.path.join(self.path, f".{name}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(self.path, name))
+        self.parts += 1
+
+
+def open_row_sink(path: str, fieldnames: List[str]):
+    if path.endswith(".parquet"):
+        return ParquetRowSink(path, fieldnames)
+    return CsvRowSink(path, fieldnames)
+
 
 def parse_hhmm(hhmm: Optional[str]) -> Optional[int]:
     """Convert 'HHMM' to minutes since midnight."""
@@ -95,11 +382,7 @@ def compute_delay_minutes(sched_hhmm: Optional[str], actual_hhmm: Optional[str])
     return float(d)
 
 
-def extract_delay_from_service_details(details: Dict[str, Any], station_crs: str) -> Optional[Dict[str, Any]]:
-    """
-    Find the calling point for station_crs and compute delay at arrival (preferred) or departure.
-    HSP details include 'serviceAttributes' and 'locations' style fields; structure varies slightly.
-    """
+def _find_locations(details: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
     # Typical HSP response has a top-level list under "serviceAttributesDetails" or "serviceDetails"
     # We'll robustly scan for a list of location/calling points.
     locations = None
@@ -118,27 +401,31 @@ def extract_delay_from_service_details(details: Dict[str, Any], station_crs: str
             if isinstance(v, list) and v and isinstance(v[0], dict):
                 locations = v
                 break
+    return locations
 
-    if not locations:
-        return None
 
-    # Search for matching CRS
-    match = None
-    for loc in locations:
-        crs = loc.get("crs") or loc.get("crsCode") or loc.get("stationCode")
-        if crs == station_crs:
-            match = loc
-            break
+def _location_crs(loc: Dict[str, Any]) -> Optional[str]:
+    # HSP serviceDetails calls the CRS field "location"
+    return loc.get("crs") or loc.get("crsCode") or loc.get("stationCode") or loc.get("location")
 
-    if not match:
-        return None
 
+def _service_date(details: Dict[str, Any]) -> Optional[str]:
+    service_date = details.get("serviceDate") or details.get("runDate") or details.get("date")
+    if not service_date:
+        attrs = details.get("serviceAttributesDetails")
+        if isinstance(attrs, dict):
+            service_date = attrs.get("date_of_service")
+    return service_date
+
+
+def _location_delay_row(loc: Dict[str, Any], service_date: Optional[str], station_crs: str) -> Optional[Dict[str, Any]]:
+    """Delay at one calling point: arrival (preferred) or departure."""
     # Scheduled vs actual times vary: gbttBookedArrival/Departure vs actual
-    sched_arr = match.get("gbttBookedArrival") or match.get("gbtt_pta") or match.get("pta")
-    actual_arr = match.get("actualArrival") or match.get("actual_ta") or match.get("arr")
+    sched_arr = loc.get("gbttBookedArrival") or loc.get("gbtt_pta") or loc.get("pta")
+    actual_arr = loc.get("actualArrival") or loc.get("actual_ta") or loc.get("arr")
 
-    sched_dep = match.get("gbttBookedDeparture") or match.get("gbtt_ptd") or match.get("ptd")
-    actual_dep = match.get("actualDeparture") or match.get("actual_td") or match.get("dep")
+    sched_dep = loc.get("gbttBookedDeparture") or loc.get("gbtt_ptd") or loc.get("ptd")
+    actual_dep = loc.get("actualDeparture") or loc.get("actual_td") or loc.get("dep")
 
     delay = compute_delay_minutes(sched_arr, actual_arr)
     used = "arrival"
@@ -150,7 +437,6 @@ def extract_delay_from_service_details(details: Dict[str, Any], station_crs: str
         return None
 
     # Event time: prefer actual arrival/departure with service date; fallback to service run date
-    service_date = details.get("serviceDate") or details.get("runDate") or details.get("date")
     # We'll just output ISO date + HH:MM for event_time for now
     t_hhmm = actual_arr or actual_dep or sched_arr or sched_dep
     if not service_date or not t_hhmm:
@@ -167,76 +453,340 @@ def extract_delay_from_service_details(details: Dict[str, Any], station_crs: str
     }
 
 
+def extract_delay_from_service_details(details: Dict[str, Any], station_crs: str) -> Optional[Dict[str, Any]]:
+    """
+    Find the calling point for station_crs and compute delay at arrival (preferred) or departure.
+    HSP details include 'serviceAttributes' and 'locations' style fields; structure varies slightly.
+    """
+    locations = _find_locations(details)
+    if not locations:
+        return None
+
+    # Search for matching CRS
+    match = None
+    for loc in locations:
+        if _location_crs(loc) == station_crs:
+            match = loc
+            break
+
+    if not match:
+        return None
+
+    return _location_delay_row(match, _service_date(details), station_crs)
+
+
+def extract_delays_at_stations(details: Dict[str, Any], stations: Container[str]) -> List[Dict[str, Any]]:
+    """Delay rows for every calling point in the response whose CRS is in `stations`."""
+    locations = _find_locations(details)
+    if not locations:
+        return []
+
+    service_date = _service_date(details)
+    rows = []
+    for loc in locations:
+        crs = _location_crs(loc)
+        if crs in stations:
+            row = _location_delay_row(loc, service_date, crs)
+            if row:
+                rows.append(row)
+    return rows
+
+
+def _hhmm_to_minutes(hhmm: pa.Array) -> np.ndarray:
+    """Vectorized parse_hhmm: minutes since midnight, NaN where not a 4-digit HHMM."""
+    s = pc.utf8_trim_whitespace(hhmm)
+    v = pc.cast(pc.if_else(pc.match_substring_regex(s, r"^[0-9]{4}$"), s, None), pa.int32())
+    v = v.to_numpy(zero_copy_only=False).astype(float)
+    return (v // 100) * 60 + v % 100
+
+
+def _delay_minutes(sched: pa.Array, actual: pa.Array) -> np.ndarray:
+    """Vectorized compute_delay_minutes, with the same +/-600 minute midnight wrap."""
+    d = _hhmm_to_minutes(actual) - _hhmm_to_minutes(sched)
+    d = np.where(d < -600, d + 1440, d)
+    return np.where(d > 600, d - 1440, d)
+
+
+def extract_delays_frame(
+    docs: Iterable[Dict[str, Any]],
+    station_crs: Optional[str] = None,
+    stations: Optional[Container[str]] = None,
+    rids: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    Bulk version of extract_delay_from_service_details / extract_delays_at_stations.
+    The documents are flattened once into columnar arrays (one entry per calling point);
+    HHMM parsing, delays, midnight wrap and event times are then computed with Arrow/NumPy
+    vector kernels. Pass station_crs for one row per document at that station, or stations
+    for every matching calling point. Returns a DataFrame with ROW_FIELDS columns (lat/lon empty).
+    """
+    if (station_crs is None) == (stations is None):
+        raise ValueError("pass exactly one of station_crs or stations")
+
+    rid_list = list(rids) if rids is not None else None
+    rid_col, crs_col, date_col = [], [], []
+    sched_arr, actual_arr, sched_dep, actual_dep = [], [], [], []
+
+    for i, details in enumerate(docs):
+        locations = _find_locations(details) or []
+        service_date = _service_date(details) or None
+        rid = rid_list[i] if rid_list is not None else None
+        for loc in locations:
+            crs = _location_crs(loc)
+            if station_crs is not None:
+                if crs != station_crs:
+                    continue
+            elif crs not in stations:
+                continue
+            rid_col.append(rid)
+            crs_col.append(crs)
+            date_col.append(service_date)
+            sched_arr.append(loc.get("gbttBookedArrival") or loc.get("gbtt_pta") or loc.get("pta") or None)
+            actual_arr.append(loc.get("actualArrival") or loc.get("actual_ta") or loc.get("arr") or None)
+            sched_dep.append(loc.get("gbttBookedDeparture") or loc.get("gbtt_ptd") or loc.get("ptd") or None)
+            actual_dep.append(loc.get("actualDeparture") or loc.get("actual_td") or loc.get("dep") or None)
+            if station_crs is not None:
+                # single-station mode uses the first match only
+                break
+
+    sa, aa, sd, ad = (pa.array(c, type=pa.string()) for c in (sched_arr, actual_arr, sched_dep, actual_dep))
+    dates = pa.array(date_col, type=pa.string())
+
+    arr = _delay_minutes(sa, aa)
+    dep = _delay_minutes(sd, ad)
+    use_arr = ~np.isnan(arr)
+    delay = np.where(use_arr, arr, dep)
+
+    t_hhmm = pc.coalesce(aa, ad, sa, sd)
+    ok = ~np.isnan(delay) & pc.is_valid(dates).to_numpy(zero_copy_only=False) & pc.is_valid(t_hhmm).to_numpy(zero_copy_only=False)
+    mask = pa.array(ok)
+    t = t_hhmm.filter(mask)
+    event_time = pc.binary_join_element_wise(
+        dates.filter(mask), "T", pc.utf8_slice_codeunits(t, 0, 2), ":", pc.utf8_slice_codeunits(t, 2), ":00", ""
+    )
+
+    out = pd.DataFrame({
+        "event_time": event_time.to_pandas(),
+        "station_name": pd.Series(crs_col, dtype=object)[ok].reset_index(drop=True),
+        "delay_minutes": delay[ok],
+        "delay_basis": np.where(use_arr, "arrival", "departure")[ok],
+        "rid": pd.Series(rid_col, dtype=object)[ok].reset_index(drop=True),
+    })
+    return out.reindex(columns=ROW_FIELDS)
+
+
+def load_routes(path: str) -> List[tuple]:
+    """(from_crs, to_crs) pairs from a CSV with from_crs,to_crs columns, duplicates dropped."""
+    with open(path, newline="", encoding="utf-8") as f:
+        pairs = [(r["from_crs"].strip().upper(), r["to_crs"].strip().upper()) for r in csv.DictReader(f)]
+    return list(dict.fromkeys(p for p in pairs if all(p)))
+
+
+def load_stations(path: str) -> Dict[str, Dict[str, Any]]:
+    """CRS -> {"lat", "lon"} from a CSV with crs,lat,lon columns."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {
+            r["crs"].strip().upper(): {"lat": r.get("lat") or None, "lon": r.get("lon") or None}
+            for r in csv.DictReader(f)
+            if r.get("crs")
+        }
+
+
+def reprocess_cache(cache_path: str, out: str, extract_rows: Callable, batch_size: int = 1000) -> int:
+    """Rewrite `out` from every cached serviceDetails payload, batch_size documents at a time."""
+    if not os.path.exists(cache_path):
+        raise SystemExit(f"No cache at {cache_path}")
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    elif os.path.exists(out):
+        os.remove(out)
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    cache = DetailsCache(cache_path)
+    sink = open_row_sink(out, ROW_FIELDS)
+    written = 0
+    docs, rids = [], []
+
+    def flush():
+        nonlocal written
+        rows = extract_rows(docs, rids)
+        if len(rows):
+            sink.write(rows)
+            written += len(rows)
+        docs.clear()
+        rids.clear()
+
+    for rid, details in cache:
+        docs.append(details)
+        rids.append(rid)
+        if len(docs) >= batch_size:
+            flush()
+    flush()
+    cache.close()
+    print(f"[OK] Reprocessed {cache_path} -> {written} rows in {out}")
+    return written
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--from-crs", required=True, help="Origin CRS (e.g. CDF)")
-    ap.add_argument("--to-crs", required=True, help="Destination CRS (e.g. SWA)")
-    ap.add_argument("--start", required=True, help="Start date YYYY-MM-DD")
-    ap.add_argument("--end", required=True, help="End date YYYY-MM-DD (inclusive)")
+    ap.add_argument("--from-crs", help="Origin CRS (e.g. CDF)")
+    ap.add_argument("--to-crs", help="Destination CRS (e.g. SWA)")
+    ap.add_argument("--routes", help="Batch mode: CSV of from_crs,to_crs route pairs (e.g. Welsh corridors)")
+    ap.add_argument("--stations", help="CSV of crs,lat,lon: calling points to emit in batch mode, and their coordinates")
+    ap.add_argument("--all-stops", action="store_true",
+                    help="Emit a row for every Welsh calling point, not just --to-crs (implied by --routes)")
+    ap.add_argument("--start", help="Start date YYYY-MM-DD")
+    ap.add_argument("--end", help="End date YYYY-MM-DD (inclusive)")
     ap.add_argument("--out", default="data/raw/rail_delays_wales.csv")
     ap.add_argument("--max-rids", type=int, default=500, help="Limit services for demo/testing")
+    ap.add_argument("--concurrency", type=int, default=4, help="Max in-flight HSP requests")
+    ap.add_argument("--window-days", type=int, default=7, help="Split --start..--end into serviceMetrics windows of this many days")
+    ap.add_argument("--days", default="WEEKDAY,SATURDAY,SUNDAY", help="Comma-separated HSP day types to query")
+    ap.add_argument("--window-retries", type=int, default=3, help="Retries per serviceMetrics window before halving it")
+    ap.add_argument("--base-url", default=HSP_BASE_URL, help="HSP API base URL (override to point at a stub server)")
+    ap.add_argument("--cache", default="data/cache/hsp_details.sqlite", help="serviceDetails cache file")
+    ap.add_argument("--cache-max-mb", type=float, default=1024, help="Evict least recently used payloads beyond this size")
+    ap.add_argument("--no-cache", action="store_true", help="Always fetch serviceDetails from the network")
+    ap.add_argument("--flush-every", type=int, default=100, help="Flush rows and checkpoint every N RIDs")
+    ap.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint and overwrite --out")
+    ap.add_argument("--reprocess-cache", action="store_true",
+                    help="Rebuild --out from every payload in --cache without touching the network")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
     args = ap.parse_args()
 
+    with profile_run(args.profile):
+        run(ap, args)
+
+
+def run(ap: argparse.ArgumentParser, args: argparse.Namespace):
+
+    stations = load_stations(args.stations) if args.stations else {}
+    all_stops = bool(args.routes or args.all_stops)
+    stop_crs = set(stations) or WELSH_CRS
+    station_lat = {crs: v["lat"] for crs, v in stations.items()}
+    station_lon = {crs: v["lon"] for crs, v in stations.items()}
+
+    def extract_rows(docs, rids):
+        with stage("hsp.extract", rows=len(docs)):
+            if all_stops:
+                rows = extract_delays_frame(docs, stations=stop_crs, rids=rids)
+            else:
+                rows = extract_delays_frame(docs, station_crs=args.to_crs, rids=rids)
+            if stations:
+                rows["lat"] = rows["station_name"].map(station_lat)
+                rows["lon"] = rows["station_name"].map(station_lon)
+        return rows
+
+    if args.reprocess_cache:
+        if not (all_stops or args.to_crs):
+            ap.error("--reprocess-cache needs --to-crs, --all-stops or --routes")
+        reprocess_cache(args.cache, args.out, extract_rows, batch_size=max(1, args.flush_every) * 10)
+        return
+
+    if args.routes:
+        routes = load_routes(args.routes)
+    elif args.from_crs and args.to_crs:
+        routes = [(args.from_crs, args.to_crs)]
+    else:
+        ap.error("give --from-crs and --to-crs, or --routes")
+    if not (args.start and args.end):
+        ap.error("--start and --end are required")
+
     user, pw = env_creds()
     auth = (user, pw)
+    session = make_session(pool_size=max(1, args.concurrency))
+    metrics_url = f"{args.base_url.rstrip('/')}/serviceMetrics"
+    details_url = f"{args.base_url.rstrip('/')}/serviceDetails"
+
+    # serviceMetrics: one query per (route, date window, day type), run concurrently.
+    # Windows that still fail after retries are halved and retried.
+    day_types = [d.strip().upper() for d in args.days.split(",") if d.strip()]
+    windows = split_date_range(args.start, args.end, args.window_days)
+    queries = [(r, w0, w1, d) for r in routes for w0, w1 in windows for d in day_types]
+
+    def fetch_window(q):
+        (from_crs, to_crs), w0, w1, day_type = q
+        return fetch_service_metrics(
+            metrics_url, from_crs, to_crs, w0, w1, day_type,
+            auth=auth, session=session, retries=args.window_retries,
+        )
 
-    # HSP serviceMetrics payload pattern (see HSP docs)
-    all_services = []
-    for day_type in ["WEEKDAY"]:
-        payload = {
-            "from_loc": args.from_crs,
-            "to_loc": args.to_crs,
-            "from_time": "0600",
-            "to_time": "2200",
-
-            "from_date": args.start,
-            "to_date": args.end,
-            "days": day_type,
-        }
-        metrics = post_json(HSP_METRICS_URL, payload, auth=auth)
-
-        services = None
-        for k in ["Services", "services", "serviceMetrics", "ServiceMetrics"]:
-            if k in metrics and isinstance(metrics[k], list):
-                services = metrics[k]
-                break
-        if services is None:
-            for v in metrics.values():
-                if isinstance(v, list):
-                    services = v
-                    break
-
-        if services:
-            all_services.extend(services)
+    services = []
+    with stage("hsp.service_metrics", rows=len(queries)):
+        for window_services in ordered_map(fetch_window, queries, args.concurrency):
+            services.extend(window_services)
 
-    services = all_services
-
-    # Extract RIDs
-    rids = []
-    for s in services:
-        rid = s.get("rid") or s.get("RID") or s.get("serviceRid")
-        if rid:
-            rids.append(rid)
+    rids = extract_rids(services)
+    print(f"[INFO] {len(queries)} serviceMetrics windows -> {len(services)} services, {len(rids)} unique RIDs")
 
     rids = rids[: args.max_rids]
-    os.makedirs(os.path.dirname(args.out), exist_ok=True)
-
-    rows = []
-    for rid in rids:
-        det_payload = {"rid": rid}
-        details = post_json(HSP_DETAILS_URL, det_payload, auth=auth)
-        row = extract_delay_from_service_details(details, station_crs=args.to_crs)
-        if row:
-            rows.append(row)
-
-    # Write CSV
-    with open(args.out, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["event_time", "station_name", "delay_minutes", "delay_basis"])
-        w.writeheader()
-        w.writerows(rows)
-
-    print(f"[OK] Wrote {len(rows)} rows to {args.out}")
-    print("Next: add lat/lon for stations (or join via a station lookup), then run make_features.py")
+    if os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+
+    # A RID that runs along several routes is fetched once (extract_rids dedups),
+    # and in all-stops mode yields a row for each matching calling point.
+    # Rows are flushed in batches as they arrive; <out>.done lists the RIDs already
+    # flushed so a rerun after a crash skips them and appends to the same output.
+    # RIDs whose rows reached the output just before a crash but were not yet marked
+    # are recovered from the output itself, so they are not fetched and appended twice.
+    checkpoint_path = args.out + ".done"
+    if args.fresh:
+        if os.path.isdir(args.out):
+            shutil.rmtree(args.out)
+        elif os.path.exists(args.out):
+            os.remove(args.out)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    checkpoint = RidCheckpoint(checkpoint_path)
+    sink = open_row_sink(args.out, ROW_FIELDS)
+    unmarked = sink.rids() - checkpoint.done
+    if unmarked:
+        checkpoint.mark(sorted(unmarked))
+    todo = [rid for rid in rids if rid not in checkpoint.done]
+    if checkpoint.done:
+        print(f"[RESUME] {len(rids) - len(todo)} RIDs already done, {len(todo)} to fetch")
+
+    cache = None if args.no_cache else DetailsCache(args.cache, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+
+    def fetch_details(rid):
+        if cache is not None:
+            details = cache.get(rid)
+            if details is not None:
+                return details
+        details = post_json(details_url, {"rid": rid}, auth=auth, session=session)
+        if cache is not None:
+            cache.put(rid, details)
+        return details
+
+    written = 0
+    batch_docs, batch_rids = [], []
+
+    def flush():
+        nonlocal written
+        rows = extract_rows(batch_docs, batch_rids)
+        if len(rows):
+            sink.write(rows)
+            written += len(rows)
+        checkpoint.mark(batch_rids)
+        batch_docs.clear()
+        batch_rids.clear()
+
+    # Payloads are buffered per batch and converted to rows in one vectorized pass
+    with stage("hsp.service_details", rows=len(todo)):
+        for rid, details in zip(todo, ordered_map(fetch_details, todo, args.concurrency)):
+            batch_docs.append(details)
+            batch_rids.append(rid)
+            if len(batch_rids) >= args.flush_every:
+                flush()
+        flush()
+
+    print(f"[OK] Wrote {written} rows to {args.out}")
+    if cache is not None:
+        print(f"[CACHE] hits={cache.hits} misses={cache.misses} size={cache.total_bytes / 1e6:.1f}MB ({args.cache})")
+        cache.close()
+    if not stations:
+        print("Next: add lat/lon for stations (or pass --stations), then run make_features.py")
 
 
 if __name__ == "__main__":
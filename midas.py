@@ -1,26 +1,214 @@
 import os
+import json
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+
+from src.profiling import profile_run, stage
+from src.weather_store import WeatherStore
+from src.io_schema import WEATHER
 
 CEDA_BASE = "https://dap.ceda.ac.uk/badc/ukmo-midas-open/data"
 
+KNOTS_TO_MPS = 0.514444
+
+# MIDAS column -> (WEATHER feature name, unit scale). MIDAS reports wind speed in knots.
+MIDAS_PROPS = {
+    "air_temperature": ("air_temp_c", 1.0),
+    "wind_speed": ("wind_speed_mps", KNOTS_TO_MPS),
+    "precipitation_amount": ("rain_mm", 1.0),
+}
+
 def require_env(name: str) -> str:
     v = os.getenv(name)
     if not v:
         raise SystemExit(f"Missing env var {name}. Set it and restart terminal.")
     return v
 
-def download_file(url: str, out_path: str, auth) -> None:
+def make_session(pool_size: int = 8) -> requests.Session:
+    """Keep-alive session whose connection pool can serve pool_size concurrent downloads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _read_meta(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_meta(path: str, meta: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+def download_file(url: str, out_path: str, auth, session: Optional[requests.Session] = None) -> bool:
+    """
+    Download url to out_path. Returns False if an existing copy was already complete.
+
+    A sidecar <out_path>.meta.json records the expected size and ETag, so complete
+    files are skipped without touching the network. Interrupted downloads are kept as
+    <out_path>.part and resumed with a Range request (If-Range on the ETag, so a file
+    that changed on the server is fetched again from scratch).
+    """
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    http = session or requests
+    meta_path = out_path + ".meta.json"
+    meta = _read_meta(meta_path)
+
     if os.path.exists(out_path):
-        return
-    r = requests.get(url, auth=auth, stream=True, timeout=120)
-    r.raise_for_status()
-    with open(out_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=1024 * 256):
-            if chunk:
-                f.write(chunk)
+        size = os.path.getsize(out_path)
+        if meta.get("complete") and meta.get("size") == size:
+            return False
+        if not meta:
+            # File from before sidecars existed: trust it if the server agrees on size
+            h = http.head(url, auth=auth, timeout=60, allow_redirects=True)
+            if h.ok and h.headers.get("Content-Length") == str(size):
+                _write_meta(meta_path, {"size": size, "etag": h.headers.get("ETag"), "complete": True})
+                return False
+
+    part = out_path + ".part"
+    have = os.path.getsize(part) if os.path.exists(part) else 0
+    headers = {}
+    if have:
+        headers["Range"] = f"bytes={have}-"
+        if meta.get("etag"):
+            headers["If-Range"] = meta["etag"]
+
+    with http.get(url, auth=auth, stream=True, timeout=120, headers=headers) as r:
+        if r.status_code == 416 and have and have == meta.get("size"):
+            # The .part already holds the whole file
+            pass
+        else:
+            r.raise_for_status()
+            if r.status_code == 206:
+                mode = "ab"
+                total = int(r.headers["Content-Range"].rsplit("/", 1)[-1]) if "Content-Range" in r.headers else None
+            else:
+                mode, have = "wb", 0
+                total = int(r.headers["Content-Length"]) if "Content-Length" in r.headers else None
+            _write_meta(meta_path, {"size": total, "etag": r.headers.get("ETag"), "complete": False})
+            with open(part, mode) as f:
+                for chunk in r.iter_content(chunk_size=1024 * 256):
+                    if chunk:
+                        f.write(chunk)
+            meta = _read_meta(meta_path)
+
+    size = os.path.getsize(part)
+    if meta.get("size") is not None and size != meta["size"]:
+        raise IOError(f"Incomplete download of {url}: {size} of {meta['size']} bytes (rerun to resume)")
+    os.replace(part, out_path)
+    _write_meta(meta_path, {"size": size, "etag": meta.get("etag"), "complete": True})
+    return True
+
+def _badc_data_start(f) -> None:
+    """Advance a BADC-CSV text handle past the metadata header to the column header line."""
+    for line in f:
+        if line.strip().lower() == "data":
+            return
+    raise ValueError("No 'data' section in BADC-CSV file")
+
+def read_badc_csv(path: str, **read_csv_kwargs) -> pd.DataFrame:
+    """Read the data section of a BADC-CSV file (MIDAS open format)."""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        _badc_data_start(f)
+        df = pd.read_csv(f, **read_csv_kwargs)
+    # The section is closed by an "end data" line
+    first = df.columns[0]
+    return df[df[first].astype(str).str.strip().str.lower() != "end data"]
+
+def _short_version(version: str) -> str:
+    return version.replace("dataset-version-", "")
+
+def station_metadata_url(base: str, dataset: str, version: str) -> str:
+    return f"{base}/{dataset}/{version}/midas-open_{dataset}_dv-{_short_version(version)}_station-metadata.csv"
+
+def station_year_url(base: str, dataset: str, version: str, qc: str, county: str, station_dir: str, year: int) -> str:
+    fname = (
+        f"midas-open_{dataset}_dv-{_short_version(version)}_{county}_{station_dir}"
+        f"_qcv-{qc.replace('qc-version-', '')}_{year}.csv"
+    )
+    return f"{base}/{dataset}/{version}/{county}/{station_dir}/{qc}/{fname}"
+
+def load_station_metadata(base: str, dataset: str, version: str, raw_dir: str, auth, session=None) -> pd.DataFrame:
+    """MIDAS station list (src_id -> folder name, county, coordinates), cached under raw_dir."""
+    url = station_metadata_url(base, dataset, version)
+    path = os.path.join(raw_dir, os.path.basename(url))
+    download_file(url, path, auth, session=session)
+    meta = read_badc_csv(path)
+    meta["src_id"] = pd.to_numeric(meta["src_id"], errors="coerce").astype("Int64")
+    return meta.dropna(subset=["src_id"])
+
+def resolve_stations(meta: pd.DataFrame, src_ids: list[int], county: Optional[str] = None) -> pd.DataFrame:
+    """Metadata rows for src_ids, with the station folder name ("00009_station-name")."""
+    rows = meta[meta["src_id"].isin(src_ids)].copy()
+    missing = sorted(set(src_ids) - set(rows["src_id"].astype(int)))
+    if missing:
+        raise SystemExit(f"src_id not found in MIDAS station metadata: {missing}")
+    if county:
+        rows["historic_county"] = county
+    rows["station_dir"] = [f"{int(s):05d}_{n}" for s, n in zip(rows["src_id"], rows["station_file_name"])]
+    return rows.reset_index(drop=True)
+
+def iter_midas_chunks(path: str, props: list[str], chunk_rows: int = 200_000) -> Iterator[pd.DataFrame]:
+    """
+    Stream the data section of a MIDAS BADC-CSV file in chunks. The metadata header is
+    skipped in the same pass, only ob_time and `props` are parsed (as float32), and the
+    columns come out renamed/converted to the WEATHER schema names.
+    """
+    with open(path, encoding="utf-8", errors="replace") as f:
+        _badc_data_start(f)
+        reader = pd.read_csv(
+            f,
+            usecols=lambda c: c == "ob_time" or c in props,
+            dtype={p: "float32" for p in props},
+            chunksize=int(chunk_rows),
+        )
+        for chunk in reader:
+            # the trailing "end data" line parses as a row with no valid timestamp
+            t = pd.to_datetime(chunk["ob_time"], errors="coerce", utc=True, format="ISO8601")
+            ok = t.notna().to_numpy()
+            out = pd.DataFrame({WEATHER["time"]: t[ok]})
+            for p in props:
+                if p not in chunk.columns:
+                    continue
+                name, scale = MIDAS_PROPS.get(p, (p, 1.0))
+                col = chunk[p][ok]
+                out[name] = col * np.float32(scale) if scale != 1.0 else col
+            yield out
+
+def convert_midas_file(
+    path: str,
+    site_name: str,
+    lat: float,
+    lon: float,
+    props: list[str],
+    csv_out: Optional[str] = None,
+    store: Optional[WeatherStore] = None,
+    chunk_rows: int = 200_000,
+) -> int:
+    """Stream one station-year file into a CSV (appended) and/or a WeatherStore. Returns rows written."""
+    rows = 0
+    tag = os.path.splitext(os.path.basename(path))[0]
+    if store is not None:
+        store.remove_source(tag)
+    for i, chunk in enumerate(iter_midas_chunks(path, props, chunk_rows)):
+        chunk[WEATHER["site"]] = site_name
+        chunk[WEATHER["lat"]] = lat
+        chunk[WEATHER["lon"]] = lon
+        if store is not None:
+            store.write(chunk, tag=f"{tag}-{i:05d}")
+        if csv_out is not None:
+            new = not os.path.exists(csv_out) or os.path.getsize(csv_out) == 0
+            chunk.to_csv(csv_out, mode="a", header=new, index=False)
+        rows += len(chunk)
+    return rows
 
 def main():
     ap = argparse.ArgumentParser()
@@ -28,36 +216,100 @@ def main():
     ap.add_argument("--version", default="dataset-version-202007", help="MIDAS dataset version folder")
     ap.add_argument("--qc", default="qc-version-1", help="qc-version-0 or qc-version-1")
     ap.add_argument("--stations", required=True, help="Comma-separated MIDAS src_id list, e.g. 123,456")
-    ap.add_argument("--county", required=True, help="historic_county folder name in MIDAS path")
+    ap.add_argument("--county", default=None,
+                    help="historic_county folder name in MIDAS path (default: from station metadata)")
     ap.add_argument("--years", required=True, help="Comma-separated years, e.g. 2023,2024")
     ap.add_argument("--out", default="data/raw/metoffice_weather_wales.csv")
     ap.add_argument("--props", default="air_temperature,wind_speed,precipitation_amount",
-                    help="Comma-separated column names to keep if present")
+                    help="Comma-separated MIDAS columns to keep if present (known ones are renamed to WEATHER features)")
+    ap.add_argument("--store", default=None,
+                    help="Also write a Parquet WeatherStore (partitioned by site and month) to this directory")
+    ap.add_argument("--raw-dir", default="data/raw/midas", help="Where downloaded MIDAS files are kept")
+    ap.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+    ap.add_argument("--base-url", default=CEDA_BASE, help="MIDAS open data root (override for a local mirror)")
+    ap.add_argument("--chunk-rows", type=int, default=200_000, help="Rows parsed per chunk when converting files")
+    ap.add_argument("--no-csv", action="store_true", help="Only write --store, skip the --out CSV")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
     args = ap.parse_args()
 
+    with profile_run(args.profile):
+        run(args)
+
+def run(args: argparse.Namespace):
+
     user = require_env("CEDA_USER")
     pw = require_env("CEDA_PASSWORD")
     auth = (user, pw)
+    session = make_session(pool_size=max(1, args.workers))
+    base = args.base_url.rstrip("/")
 
-    stations = [s.strip() for s in args.stations.split(",") if s.strip()]
+    src_ids = [int(s.strip()) for s in args.stations.split(",") if s.strip()]
     years = [int(y.strip()) for y in args.years.split(",") if y.strip()]
     props = [p.strip() for p in args.props.split(",") if p.strip()]
 
-    frames = []
-
-    for sid in stations:
-        # MIDAS uses 5-digit padded station id folder prefix like 00009_...
-        # The Julia script used stationList.csv to map src_id -> station_file_name.
-        # In Python, you should also use station metadata to get the station folder name.
-        #
-        # For now, this script expects you to provide the *full station folder name* once you know it.
-        # See note below on how to get it automatically.
-        raise SystemExit(
-            "This script needs the station folder name mapping (src_id -> station folder). "
-            "Next step below shows how to fetch station metadata and do this automatically."
-        )
+    meta = load_station_metadata(base, args.dataset, args.version, args.raw_dir, auth, session=session)
+    stations = resolve_stations(meta, src_ids, county=args.county)
+
+    jobs = []
+    for st in stations.itertuples(index=False):
+        first = pd.to_numeric(getattr(st, "first_year", None), errors="coerce")
+        last = pd.to_numeric(getattr(st, "last_year", None), errors="coerce")
+        for year in years:
+            if (pd.notna(first) and year < first) or (pd.notna(last) and year > last):
+                continue
+            url = station_year_url(base, args.dataset, args.version, args.qc, st.historic_county, st.station_dir, year)
+            path = os.path.join(args.raw_dir, st.historic_county, st.station_dir, os.path.basename(url))
+            jobs.append((st, year, url, path))
+
+    downloaded = skipped = 0
+    done = []
+    with stage("midas.download", rows=len(jobs)), ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(download_file, url, path, auth, session): (st, year, url, path)
+                   for st, year, url, path in jobs}
+        for fut in as_completed(futures):
+            st, year, url, path = futures[fut]
+            try:
+                fetched = fut.result()
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    print(f"[WARN] No {year} file for {st.station_dir}")
+                    continue
+                raise
+            downloaded += int(fetched)
+            skipped += int(not fetched)
+            done.append((st, year, path))
+    print(f"[OK] {downloaded} files downloaded, {skipped} already complete ({args.raw_dir})")
+
+    if not done:
+        raise SystemExit("No MIDAS files available for the requested stations/years")
+
+    # Stream every file straight to the outputs; nothing is concatenated in memory
+    csv_out = None if args.no_csv else args.out
+    if csv_out:
+        os.makedirs(os.path.dirname(csv_out) or ".", exist_ok=True)
+        if os.path.exists(csv_out):
+            os.remove(csv_out)
+    store = WeatherStore(args.store) if args.store else None
+
+    rows = 0
+    with stage("midas.convert") as rec:
+        for st, year, path in sorted(done, key=lambda d: (int(d[0].src_id), d[1])):
+            rows += convert_midas_file(
+                path,
+                site_name=st.station_name,
+                lat=float(pd.to_numeric(getattr(st, "station_latitude", None), errors="coerce")),
+                lon=float(pd.to_numeric(getattr(st, "station_longitude", None), errors="coerce")),
+                props=props,
+                csv_out=csv_out,
+                store=store,
+                chunk_rows=args.chunk_rows,
+            )
+        rec["rows"] = rows
 
-    # If you implement mapping, you'd concatenate frames and write args.out.
+    if csv_out:
+        print(f"[OK] Wrote {rows} rows to {csv_out}")
+    if store is not None:
+        print(f"[OK] Wrote {rows} rows to store {args.store}")
 
 if __name__ == "__main__":
     main()
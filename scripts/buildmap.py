@@ -2,28 +2,19 @@ import argparse
 import pandas as pd
 import folium
 
-from src.features import make_xy
-from src.model import train_random_forest
+from src.config import PREDICTIONS_PATH, TARGET_COL
+from src.predict import PRED_COL
+from src.profiling import profile_run, stage
 from src.io_schema import RAIL
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--data", required=True)
-    ap.add_argument("--out", required=True)
-    ap.add_argument("--top-n", type=int, default=300)
-    args = ap.parse_args()
-
-    df = pd.read_parquet(args.data)
-
-    # Train quickly on all joined data (simple demo approach)
-    X, y = make_xy(df)
-    res = train_random_forest(X, y)
-
-    df = df.copy()
-    df["pred_delay"] = res.model.predict(X)
+def run(args):
+    # Predictions come from predict.py, so drawing the map never pays for training
+    with stage("read_predictions") as st:
+        df = pd.read_parquet(args.predictions)
+        st["rows"] = len(df)
 
     # Choose top predicted delays
-    df_top = df.sort_values("pred_delay", ascending=False).head(args.top_n)
+    df_top = df.nlargest(args.top_n, PRED_COL)
 
     # Center map on Wales-ish mean
     center_lat = float(df_top[RAIL["lat"]].mean())
@@ -31,14 +22,28 @@ def main():
     m = folium.Map(location=[center_lat, center_lon], zoom_start=7)
 
     for _, r in df_top.iterrows():
+        actual = f"<br>actual={float(r[TARGET_COL]):.1f}" if TARGET_COL in r else ""
         folium.CircleMarker(
             location=[float(r[RAIL["lat"]]), float(r[RAIL["lon"]])],
             radius=5,
-            popup=f"{r.get(RAIL['station'], 'station')}<br>pred={r['pred_delay']:.1f} min<br>actual={float(r['delay_minutes']):.1f}",
+            popup=f"{r.get(RAIL['station'], 'station')}<br>pred={r[PRED_COL]:.1f} min{actual}",
         ).add_to(m)
 
-    m.save(args.out)
+    with stage("write_map", rows=len(df_top)):
+        m.save(args.out)
     print(f"Wrote map: {args.out}")
 
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--predictions", default=PREDICTIONS_PATH, help="Predictions Parquet from predict.py")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--top-n", type=int, default=300)
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
+    ap.add_argument("--profile-memory", action="store_true", help="Also trace Python/NumPy allocation peaks (slower)")
+    args = ap.parse_args()
+
+    with profile_run(args.profile, trace_memory=args.profile_memory):
+        run(args)
+
 if __name__ == "__main__":
     main()
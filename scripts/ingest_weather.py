@@ -0,0 +1,19 @@
+import argparse
+
+from src.weather_store import ingest_csv
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert a weather CSV (e.g. midas.py output) into a Parquet WeatherStore")
+    ap.add_argument("--weather", required=True, nargs="+", help="One or more weather CSVs")
+    ap.add_argument("--store", required=True, help="WeatherStore directory (created or extended)")
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    for path in args.weather:
+        store = ingest_csv(path, args.store, chunk_rows=args.chunk_rows)
+        print(f"Ingested: {path}")
+
+    print(f"Wrote store: {args.store} rows={store.count_rows()} sites={len(store.sites())}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Load test for serve.py: concurrent keep-alive clients request /score for random stations,
+then client-side and server-side latency percentiles are printed.
+
+  python scripts/loadtest.py --url http://127.0.0.1:8080 --clients 16 --requests 5000
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+import numpy as np
+
+def _get(conn: http.client.HTTPConnection, path: str):
+    conn.request("GET", path)
+    resp = conn.getresponse()
+    body = resp.read()
+    if resp.status != 200:
+        raise RuntimeError(f"{path}: HTTP {resp.status} {body[:200]!r}")
+    return json.loads(body)
+
+def _client(host, port, stations, n, seed, latencies, errors):
+    rng = np.random.default_rng(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    for station in rng.choice(stations, n):
+        t = time.perf_counter()
+        try:
+            _get(conn, f"/score?station={quote(str(station))}")
+        except (OSError, RuntimeError, http.client.HTTPException):
+            errors.append(station)
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - t)
+    conn.close()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8080")
+    ap.add_argument("--clients", type=int, default=16, help="Concurrent connections")
+    ap.add_argument("--requests", type=int, default=5000, help="Total requests across clients")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+    stations = _get(http.client.HTTPConnection(host, port, timeout=30), "/stations")
+    if not stations:
+        raise SystemExit("Server has no scorable stations")
+
+    latencies: list[float] = []
+    errors: list[str] = []
+    per_client = max(1, args.requests // args.clients)
+    threads = [
+        threading.Thread(target=_client, args=(host, port, stations, per_client, args.seed + i, latencies, errors))
+        for i in range(args.clients)
+    ]
+    t0 = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t0
+
+    lat = np.array(latencies) * 1000
+    print(f"requests={len(lat)} errors={len(errors)} clients={args.clients} wall={wall:.2f}s "
+          f"throughput={len(lat) / wall:.0f} req/s")
+    if len(lat):
+        p50, p99 = np.percentile(lat, [50, 99])
+        print(f"client latency: p50={p50:.2f} ms p99={p99:.2f} ms max={lat.max():.2f} ms")
+    print("server:", _get(http.client.HTTPConnection(host, port, timeout=30), "/stats"))
+
+if __name__ == "__main__":
+    main()
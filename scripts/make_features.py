@@ -1,33 +1,109 @@
 import argparse
 import pandas as pd
 
+from src.geo import SiteIndex
 from src.join_weather_rail import join_rail_with_weather
+from src.incremental import update_features
+from src.site_lookup import open_site_lookup
+from src.streaming import stream_join_csv
+from src.weather_store import WeatherStore
+from src.profiling import profile_run, stage
+from src.config import TIME_TOL_MINUTES, SITE_LOOKUP_K, SITE_LOOKUP_PATH
 from src.io_schema import RAIL, WEATHER
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--rail", required=True)
-    ap.add_argument("--weather", required=True)
-    ap.add_argument("--out", required=True)
-    ap.add_argument("--time-tol-min", type=int, default=None)
-    ap.add_argument("--max-dist-km", type=float, default=None)
-    args = ap.parse_args()
+def run(args):
+    time_tol = args.time_tol_min if args.time_tol_min is not None else TIME_TOL_MINUTES
+
+    if args.chunk_rows:
+        stats = stream_join_csv(
+            args.rail,
+            args.weather,
+            args.out,
+            chunk_rows=args.chunk_rows,
+            time_tolerance_minutes=time_tol,
+            max_station_distance_km=args.max_dist_km,
+            tmp_dir=args.tmp_dir,
+            site_lookup_path=args.site_lookup,
+            fallback_k=args.fallback_k,
+        )
+        print("JOIN STATS:", stats)
+        print(f"Wrote: {args.out}/ rows={stats.joined_rows}")
+        return
 
-    rail = pd.read_csv(args.rail)
-    weather = pd.read_csv(args.weather)
+    # A store is read lazily by the join: only the sites/time range the events touch
+    with stage("read_weather") as st:
+        weather = WeatherStore(args.weather) if WeatherStore.is_store(args.weather) else pd.read_csv(args.weather)
+        if isinstance(weather, WeatherStore):
+            site_index = weather.site_index
+        else:
+            site_index = SiteIndex.from_frame(weather, WEATHER["site"], WEATHER["lat"], WEATHER["lon"])
+            st["rows"] = len(weather)
+        site_lookup = open_site_lookup(args.site_lookup, site_index, k=args.fallback_k)
 
+    if args.incremental:
+        stats, months = update_features(
+            args.rail,
+            weather,
+            args.out,
+            time_tolerance_minutes=time_tol,
+            max_station_distance_km=args.max_dist_km,
+            site_index=site_index,
+            site_lookup=site_lookup,
+            fallback_k=args.fallback_k,
+        )
+        if args.site_lookup and site_lookup.dirty:
+            site_lookup.save(args.site_lookup)
+        print("JOIN STATS:", stats)
+        print(f"Updated: {args.out}/ months={','.join(months) if months else 'none (up to date)'}")
+        return
+
+    with stage("read_rail") as st:
+        rail = pd.read_csv(args.rail)
+        st["rows"] = len(rail)
     joined, stats = join_rail_with_weather(
         rail,
         weather,
-        time_tolerance_minutes=args.time_tol_min if args.time_tol_min is not None else 60,
+        time_tolerance_minutes=time_tol,
         max_station_distance_km=args.max_dist_km,
+        site_index=site_index,
+        site_lookup=site_lookup,
+        fallback_k=args.fallback_k,
     )
+    if args.site_lookup and site_lookup.dirty:
+        site_lookup.save(args.site_lookup)
 
     print("JOIN STATS:", stats)
 
     # Save as parquet for speed + types
-    joined.to_parquet(args.out, index=False)
+    with stage("write_output", rows=len(joined)):
+        joined.to_parquet(args.out, index=False)
     print(f"Wrote: {args.out} rows={len(joined)}")
 
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rail", required=True)
+    ap.add_argument("--weather", required=True, help="Weather CSV or WeatherStore directory (see ingest_weather.py)")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--time-tol-min", type=int, default=None)
+    ap.add_argument("--max-dist-km", type=float, default=None)
+    ap.add_argument("--chunk-rows", type=int, default=None,
+                    help="Stream the join in chunks of this many rail rows; --out becomes a directory of Parquet parts")
+    ap.add_argument("--tmp-dir", default=None, help="Where to spool a weather CSV in streaming mode (default: system temp)")
+    ap.add_argument("--site-lookup", default=SITE_LOOKUP_PATH,
+                    help="Persisted station -> weather site table, rebuilt when the site list changes ('' to disable)")
+    ap.add_argument("--fallback-k", type=int, default=SITE_LOOKUP_K,
+                    help="Try up to this many nearest sites when the nearer ones have no observation in tolerance (1 = nearest only)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="--out is a month-partitioned directory; re-join only months with changed rail or new weather data")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
+    ap.add_argument("--profile-memory", action="store_true", help="Also trace Python/NumPy allocation peaks (slower)")
+    args = ap.parse_args()
+
+    if args.incremental and args.chunk_rows:
+        ap.error("--incremental and --chunk-rows are mutually exclusive")
+
+    with profile_run(args.profile, trace_memory=args.profile_memory):
+        run(args)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+import argparse
+
+from src.config import MODEL_PATH, PREDICTIONS_PATH
+from src.model import load_artifact
+from src.predict import BATCH_ROWS, predict_parquet
+from src.profiling import profile_run, stage
+
+def run(args):
+    with stage("load_model"):
+        artifact = load_artifact(args.model)
+    model = artifact.model
+    print(f"Model: {type(model).__name__}, {len(artifact.feature_names)} features, "
+          f"data={artifact.data_fingerprint or '?'} metrics={artifact.metrics or '?'}")
+
+    with stage("predict") as st:
+        rows = predict_parquet(model, args.data, args.out, batch_rows=args.batch_rows, n_jobs=args.n_jobs)
+        st["rows"] = rows
+    print(f"Wrote: {args.out} rows={rows}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Score a joined dataset with a saved model")
+    ap.add_argument("--data", required=True, help="Joined Parquet file or directory from make_features.py")
+    ap.add_argument("--model", default=MODEL_PATH, help="Model saved by trainandviz.py")
+    ap.add_argument("--out", default=PREDICTIONS_PATH)
+    ap.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="Rows read and scored per record batch")
+    ap.add_argument("--n-jobs", type=int, default=-1, help="Threads predicting chunks of each batch (-1 = all cores)")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
+    ap.add_argument("--profile-memory", action="store_true", help="Also trace Python/NumPy allocation peaks (slower)")
+    args = ap.parse_args()
+
+    with profile_run(args.profile, trace_memory=args.profile_memory):
+        run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import pandas as pd
+
+from src.config import MAX_STATION_DISTANCE_KM, MODEL_PATH, SITE_LOOKUP_K, SITE_LOOKUP_PATH
+from src.geo import SiteIndex
+from src.io_schema import RAIL, WEATHER
+from src.model import load_model
+from src.serving import Scorer, ScoringService, WeatherState, make_server
+from src.site_lookup import open_site_lookup
+from src.weather_store import WeatherStore
+
+def _stations(args) -> pd.DataFrame:
+    cols = [RAIL["station"], RAIL["lat"], RAIL["lon"]]
+    if args.stations:
+        return pd.read_csv(args.stations, usecols=cols).dropna().drop_duplicates(subset=[RAIL["station"]])
+    if not (args.site_lookup and os.path.exists(args.site_lookup)):
+        raise SystemExit("No stations: pass --stations (e.g. the rail CSV) or build a site lookup with make_features.py")
+    df = pd.read_parquet(args.site_lookup, columns=["station_name", "lat", "lon"]).dropna()
+    return df.rename(columns={"station_name": RAIL["station"], "lat": RAIL["lat"], "lon": RAIL["lon"]})
+
+def run(args):
+    model = load_model(args.model)
+    weather = WeatherStore(args.weather) if WeatherStore.is_store(args.weather) else pd.read_csv(args.weather)
+    if isinstance(weather, WeatherStore):
+        site_index = weather.site_index
+    else:
+        site_index = SiteIndex.from_frame(weather, WEATHER["site"], WEATHER["lat"], WEATHER["lon"])
+    state = WeatherState.from_source(weather)
+    del weather
+
+    site_lookup = open_site_lookup(args.site_lookup, site_index, k=args.fallback_k)
+    scorer = Scorer(model, state, _stations(args), site_index, k=args.fallback_k,
+                    max_station_distance_km=args.max_dist_km, site_lookup=site_lookup)
+    if args.site_lookup and site_lookup.dirty:
+        site_lookup.save(args.site_lookup)
+
+    service = ScoringService(scorer, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    # Warm up: the first predict call pays for lazy imports and thread-pool start-up
+    if scorer.stations:
+        service.score([(scorer.stations[0], None)])
+
+    server = make_server(service, args.host, args.port)
+    print(f"Serving {len(scorer.stations)} stations, {len(state.sites)} weather sites on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print("Latency:", service.stats())
+
+def main():
+    ap = argparse.ArgumentParser(description="Local HTTP delay-risk scoring service")
+    ap.add_argument("--model", default=MODEL_PATH, help="Model saved by trainandviz.py")
+    ap.add_argument("--weather", required=True, help="Weather CSV or WeatherStore directory; the latest readings seed the cache")
+    ap.add_argument("--stations", default=None, help="CSV with station_name/lat/lon (e.g. the rail CSV); default: stations in --site-lookup")
+    ap.add_argument("--site-lookup", default=SITE_LOOKUP_PATH)
+    ap.add_argument("--fallback-k", type=int, default=SITE_LOOKUP_K)
+    ap.add_argument("--max-dist-km", type=float, default=MAX_STATION_DISTANCE_KM)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--max-batch", type=int, default=64, help="Most requests scored by one predict call")
+    ap.add_argument("--max-wait-ms", type=float, default=2.0, help="How long a batch waits for more requests")
+    args = ap.parse_args()
+    run(args)
+
+if __name__ == "__main__":
+    main()
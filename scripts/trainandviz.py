@@ -2,37 +2,73 @@ import argparse
 import os
 import pandas as pd
 
-from src.features import make_xy
-from src.model import train_random_forest
+from src.feature_cache import load_features
+from src.features import CATEGORICAL_FEATURES
+from src.model import compare_models, save_model, train_hist_gradient_boosting, train_random_forest
+from src.profiling import profile_run, stage
 from src.viz import plot_actual_vs_pred, plot_feature_importance, plot_residuals
-from src.config import TARGET_COL
+from src.config import FEATURE_CACHE_DIR, MODEL_PATH, TARGET_COL
 from src.io_schema import WEATHER
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--data", required=True, help="Joined parquet from make_features.py")
-    ap.add_argument("--outdir", required=True)
-    args = ap.parse_args()
+def run(args):
+    # The categorical matrix is the numeric one plus CATEGORICAL_FEATURES, so one cached build serves both models
+    fm = load_features(args.data, categorical=args.model != "rf", cache_dir=args.feature_cache)
+    print(f"Features: {len(fm.X)} rows x {fm.X.shape[1]} ({'cached' if fm.cached else 'built'} {fm.key})")
+    X, y = fm.X, fm.y
 
-    df = pd.read_parquet(args.data)
-    X, y = make_xy(df)
-
-    res = train_random_forest(X, y)
-    print(f"MAE={res.mae:.3f} minutes, R2={res.r2:.3f}")
+    results = {}
+    if args.model in ("rf", "compare"):
+        results["rf"] = train_random_forest(X.drop(columns=[c for c in CATEGORICAL_FEATURES if c in X.columns]), y)
+    if args.model in ("hgb", "compare"):
+        results["hgb"] = train_hist_gradient_boosting(X, y)
 
     os.makedirs(args.outdir, exist_ok=True)
+    for name, res in results.items():
+        print(f"{name}: MAE={res.mae:.3f} minutes, R2={res.r2:.3f}")
+    if len(results) > 1:
+        report = compare_models(results)
+        print(report.to_string())
+        report.to_csv(os.path.join(args.outdir, "model_report.csv"))
+
+    # Plot (and save) the more accurate model
+    res = min(results.values(), key=lambda r: r.mae)
+    if args.model_out:
+        save_model(res.model, args.model_out, feature_names=res.feature_names,
+                   metrics={"mae": res.mae, "r2": res.r2}, data_fingerprint=res.data_fingerprint)
+        print(f"Saved model: {args.model_out}")
+    with stage("plots"):
+        _plots(args, X, y, res)
+
+    print(f"Wrote figures to: {args.outdir}")
+
+def _plots(args, X, y, res):
     plot_actual_vs_pred(res.y_true, res.y_pred, os.path.join(args.outdir, "actual_vs_pred.png"))
     plot_residuals(res.y_true, res.y_pred, os.path.join(args.outdir, "residuals.png"))
     plot_feature_importance(res.model, res.feature_names, os.path.join(args.outdir, "feature_importance.png"))
 
     # Optional: a “story” plot for one key weather variable if present
     for f in WEATHER["features"]:
-        if f in df.columns:
+        if f in X.columns:
             from src.viz import plot_weather_sensitivity
+            df = pd.DataFrame({f: X[f], TARGET_COL: y})
             plot_weather_sensitivity(df, f, TARGET_COL, os.path.join(args.outdir, "weather_sensitivity.png"))
             break
 
-    print(f"Wrote figures to: {args.outdir}")
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", required=True, help="Joined parquet from make_features.py")
+    ap.add_argument("--outdir", required=True)
+    ap.add_argument("--model", choices=["rf", "hgb", "compare"], default="rf",
+                    help="Random forest, histogram gradient boosting, or train both and write model_report.csv")
+    ap.add_argument("--feature-cache", default=FEATURE_CACHE_DIR,
+                    help="Reuse make_xy output across runs, keyed by the data files and feature config ('' to disable)")
+    ap.add_argument("--model-out", default=MODEL_PATH, help="Save the trained model here for predict.py ('' to skip)")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
+    ap.add_argument("--profile-memory", action="store_true", help="Also trace Python/NumPy allocation peaks (slower)")
+    args = ap.parse_args()
+
+    with profile_run(args.profile, trace_memory=args.profile_memory):
+        run(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import pandas as pd
+
+from src.config import CV_CACHE_DIR, FEATURE_CACHE_DIR
+from src.feature_cache import load_features
+from src.model import HGB_GRID, RF_GRID, search_hyperparameters
+from src.profiling import profile_run, stage
+
+def run(args):
+    fm = load_features(args.data, categorical=args.model == "hgb", cache_dir=args.feature_cache)
+    X, y, t = fm.X, fm.y, fm.t
+
+    grid = json.loads(args.grid) if args.grid else (RF_GRID if args.model == "rf" else HGB_GRID)
+    gap = pd.Timedelta(hours=args.gap_hours) if args.gap_hours else None
+    with stage("search", rows=len(X)):
+        summary, folds = search_hyperparameters(
+            X, y, t, grid, kind=args.model, n_folds=args.folds, gap=gap, n_jobs=args.n_jobs, cache_dir=args.cache_dir,
+        )
+
+    ran = int((~folds["cached"]).sum())
+    print(f"Search: {len(summary)} parameter sets x {folds['fold'].nunique()} folds, {ran} run ({len(folds) - ran} cached)")
+    print(summary.to_string())
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        summary.to_csv(args.out)
+        folds.to_csv(os.path.splitext(args.out)[0] + "_folds.csv", index=False)
+        print(f"Wrote: {args.out}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Hyperparameter search with time-ordered (rolling-origin) CV")
+    ap.add_argument("--data", required=True, help="Joined parquet from make_features.py")
+    ap.add_argument("--model", choices=["rf", "hgb"], default="rf")
+    ap.add_argument("--grid", default=None, help='JSON parameter grid, e.g. \'{"max_depth": [10, null]}\' (default: RF_GRID/HGB_GRID)')
+    ap.add_argument("--folds", type=int, default=5)
+    ap.add_argument("--gap-hours", type=float, default=0.0, help="Leave out training rows this close before each test block")
+    ap.add_argument("--n-jobs", type=int, default=-1, help="Worker processes (-1 = all cores)")
+    ap.add_argument("--feature-cache", default=FEATURE_CACHE_DIR, help="make_xy output cache ('' to disable)")
+    ap.add_argument("--cache-dir", default=CV_CACHE_DIR, help="Shared arrays and per-fold results; rerun to resume")
+    ap.add_argument("--out", default=None, help="Write the summary CSV here (and per-fold results next to it)")
+    ap.add_argument("--profile", default=None, help="Write a JSON trace of per-stage time and memory to this path")
+    ap.add_argument("--profile-memory", action="store_true", help="Also trace Python/NumPy allocation peaks (slower)")
+    args = ap.parse_args()
+
+    with profile_run(args.profile, trace_memory=args.profile_memory):
+        run(args)
+
+if __name__ == "__main__":
+    main()
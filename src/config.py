@@ -0,0 +1,33 @@
+TIME_COL_RAIL = "event_time"
+TIME_COL_WEATHER = "obs_time"
+
+# Tolerance for time alignment (minutes)
+TIME_TOL_MINUTES = 60
+
+# If weather is sparse, you can allow farther stations; set to None to disable
+MAX_STATION_DISTANCE_KM = 50.0
+
+# Rail station -> weather site lookup: how many nearest sites to keep per station, and where it lives
+SITE_LOOKUP_K = 3
+SITE_LOOKUP_PATH = "data/processed/site_lookup.parquet"
+
+# Rolling weather windows, computed per site on its observation series before the join:
+# column -> (kind, window lengths in hours); kinds are "sum", "max" and "delta" (change over the window)
+WEATHER_WINDOWS = {
+    "rain_mm": ("sum", [3, 6, 24]),
+    "wind_speed_mps": ("max", [3, 24]),
+    "air_temp_c": ("delta", [3, 24]),
+}
+
+# Model saved by trainandviz.py and scored by predict.py; predictions consumed by buildmap.py
+MODEL_PATH = "data/processed/delay_model.joblib"
+PREDICTIONS_PATH = "data/processed/predictions.parquet"
+
+# make_xy outputs kept as memory-mappable arrays, keyed by input dataset and feature config
+FEATURE_CACHE_DIR = "data/cache/features"
+
+# Per-fold results of hyperparameter searches, so an interrupted search resumes where it stopped
+CV_CACHE_DIR = "data/cache/cv"
+
+TARGET_COL = "delay_minutes"
+RANDOM_SEED = 42
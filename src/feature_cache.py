@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from . import features
+from .config import FEATURE_CACHE_DIR, TARGET_COL, TIME_TOL_MINUTES, WEATHER_WINDOWS
+from .features import make_xy
+from .io_schema import RAIL, WEATHER
+from .profiling import stage
+
+META_FILE = "meta.json"
+
+@dataclass
+class FeatureMatrix:
+    X: pd.DataFrame
+    y: Optional[pd.Series]
+    t: pd.Series
+    key: str
+    cached: bool
+
+def _dataset_files(path: str) -> list[str]:
+    if os.path.isdir(path):
+        # Dot-prefixed names are in-progress writes (see incremental._write_partition)
+        files = glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)
+        return sorted(f for f in files if not os.path.basename(f).startswith("."))
+    return [path]
+
+def dataset_fingerprint(path: str) -> str:
+    """Cheap identity of a Parquet file or directory: relative names, sizes and mtimes of its files."""
+    h = hashlib.sha1()
+    for f in _dataset_files(path):
+        st = os.stat(f)
+        h.update(f"{os.path.relpath(f, path) if os.path.isdir(path) else os.path.abspath(f)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def feature_config(categorical: bool) -> dict:
+    """Everything besides the data that decides make_xy's output, including the feature code itself."""
+    with open(features.__file__, "rb") as f:
+        code = hashlib.sha1(f.read()).hexdigest()
+    return {
+        "weather_features": WEATHER["features"],
+        "windows": WEATHER_WINDOWS,
+        "time_tol_minutes": TIME_TOL_MINUTES,
+        "target": TARGET_COL,
+        "categorical": categorical,
+        "features_py": code,
+    }
+
+def cache_key(data_path: str, categorical: bool = False) -> str:
+    spec = json.dumps([dataset_fingerprint(data_path), feature_config(categorical)], sort_keys=True)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()[:20]
+
+def _write(entry: str, X: pd.DataFrame, y: Optional[pd.Series], t: pd.Series) -> None:
+    tmp = f"{entry}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    cols = []
+    for j, c in enumerate(X.columns):
+        col = X[c]
+        rec = {"name": c, "file": f"x{j}.npy"}
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp, rec["file"]), col.cat.codes.to_numpy())
+            rec["categories"] = [str(v) for v in col.cat.categories]
+        else:
+            np.save(os.path.join(tmp, rec["file"]), col.to_numpy())
+        cols.append(rec)
+    if y is not None:
+        np.save(os.path.join(tmp, "y.npy"), y.to_numpy(dtype=np.float64))
+    np.save(os.path.join(tmp, "t.npy"), pd.to_datetime(t, utc=True).dt.tz_convert(None).to_numpy("datetime64[ns]"))
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"rows": len(X), "columns": cols, "has_y": y is not None}, f)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+def _read(entry: str, key: str) -> FeatureMatrix:
+    with open(os.path.join(entry, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    def _map(name: str) -> np.ndarray:
+        # Plain ndarray views of the mapping; the np.memmap subclass would leak into results
+        return np.asarray(np.load(os.path.join(entry, name), mmap_mode="r"))
+
+    cols = {}
+    for rec in meta["columns"]:
+        arr = _map(rec["file"])
+        cols[rec["name"]] = pd.Categorical.from_codes(arr, categories=rec["categories"]) if "categories" in rec else arr
+    # copy=False keeps the numeric columns backed by the mapped files
+    X = pd.DataFrame(cols, copy=False)
+    y = pd.Series(_map("y.npy"), name=TARGET_COL, copy=False) if meta["has_y"] else None
+    t = pd.Series(pd.DatetimeIndex(np.load(os.path.join(entry, "t.npy")), tz="UTC"), name="_t")
+    return FeatureMatrix(X=X, y=y, t=t, key=key, cached=True)
+
+def load_features(
+    data_path: str,
+    categorical: bool = False,
+    cache_dir: Optional[str] = FEATURE_CACHE_DIR,
+) -> FeatureMatrix:
+    """
+    make_xy(read_parquet(data_path)) plus event times, from cache_dir when a previous run
+    built them from the same files with the same feature config. Cached columns are memory-mapped
+    .npy files (categoricals as codes), so a hit skips reading the dataset and building features.
+    cache_dir=None or '' disables the cache.
+    """
+    key = cache_key(data_path, categorical)
+    entry = os.path.join(cache_dir, key) if cache_dir else None
+    if entry and os.path.exists(os.path.join(entry, META_FILE)):
+        with stage("feature_cache.read") as st:
+            fm = _read(entry, key)
+            st["rows"] = len(fm.X)
+        return fm
+
+    with stage("read_data") as st:
+        df = pd.read_parquet(data_path)
+        st["rows"] = len(df)
+    X, y = make_xy(df, categorical=categorical)
+    t = df["_t"] if "_t" in df.columns else pd.to_datetime(df[RAIL["time"]], utc=True)
+    del df
+    if entry:
+        with stage("feature_cache.write", rows=len(X)):
+            os.makedirs(cache_dir, exist_ok=True)
+            _write(entry, X, y, t)
+    return FeatureMatrix(X=X, y=y, t=t.reset_index(drop=True), key=key, cached=False)
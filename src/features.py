@@ -1,33 +1,144 @@
 from __future__ import annotations
+from typing import Optional
 import pandas as pd
 import numpy as np
 
-from .config import TARGET_COL
-from .io_schema import WEATHER
+from .config import TARGET_COL, TIME_TOL_MINUTES, WEATHER_WINDOWS
+from .io_schema import RAIL, WEATHER
+from .profiling import profiled
+
+def window_feature_names(columns=None) -> list[str]:
+    """Names of the WEATHER_WINDOWS features (only for base columns in `columns`, if given)."""
+    names = []
+    for col, (kind, hours) in WEATHER_WINDOWS.items():
+        if columns is None or col in columns:
+            names += [f"{col}_{kind}_{h}h" for h in hours]
+    return names
+
+def window_lookback(time_tolerance_minutes: int = TIME_TOL_MINUTES) -> pd.Timedelta:
+    """
+    History a window feature needs before the first observation it is reported for:
+    h for sums and maxes, h plus the time tolerance for deltas (their lagged reading may be
+    up to that much older than t - h).
+    """
+    need = [
+        pd.Timedelta(hours=h) + (pd.Timedelta(minutes=int(time_tolerance_minutes)) if kind == "delta" else pd.Timedelta(0))
+        for kind, hours in WEATHER_WINDOWS.values()
+        for h in hours
+    ]
+    return max(need, default=pd.Timedelta(0))
+
+@profiled("weather_window_features")
+def add_weather_window_features(
+    w: pd.DataFrame,
+    time_col: str = "_t",
+    time_tolerance_minutes: int = TIME_TOL_MINUTES,
+) -> pd.DataFrame:
+    """
+    Rolling WEATHER_WINDOWS features per site, over windows (t - h, t] of each site's own
+    observation series. Computed once on the weather frame (sorted by site, then time) so
+    the join attaches them to events with everything else:
+      sum   - cumulative-sum difference between searchsorted window bounds (NaN if no readings)
+      max   - time-based rolling max per site
+      delta - value minus the latest reading at least h hours earlier (NaN if that reading
+              is more than time_tolerance_minutes older than t - h)
+    """
+    w = w.sort_values([WEATHER["site"], time_col], kind="stable")
+    if w.empty:
+        for name in window_feature_names(w.columns):
+            w[name] = np.float32(np.nan)
+        return w
+
+    site = pd.factorize(w[WEATHER["site"]])[0].astype(np.int64)
+    secs = w[time_col].dt.tz_convert(None).to_numpy().astype("datetime64[s]").astype(np.int64)
+    secs = secs - secs.min()
+    max_h = max(max(hours) for _, hours in WEATHER_WINDOWS.values())
+    # One sorted key over all sites: each site's times are shifted past the previous site's
+    # window reach, so a single searchsorted never crosses a site boundary
+    tol_s = int(time_tolerance_minutes) * 60
+    span = int(secs.max()) + max_h * 3600 + tol_s + 1
+    key = site * span + secs
+    right = np.searchsorted(key, key, side="right")
+
+    for col, (kind, hours) in WEATHER_WINDOWS.items():
+        if col not in w.columns:
+            continue
+        vals = w[col].to_numpy(dtype=np.float64)
+        for h in hours:
+            name = f"{col}_{kind}_{h}h"
+            lo = key - h * 3600
+            if kind == "sum":
+                ok = ~np.isnan(vals)
+                csum = np.concatenate([[0.0], np.cumsum(np.where(ok, vals, 0.0))])
+                ccnt = np.concatenate([[0], np.cumsum(ok)])
+                left = np.searchsorted(key, lo, side="right")
+                out = csum[right] - csum[left]
+                out[(ccnt[right] - ccnt[left]) == 0] = np.nan
+            elif kind == "max":
+                out = (
+                    pd.Series(vals, index=w[time_col].dt.tz_convert(None).to_numpy())
+                    .groupby(site)
+                    .rolling(f"{h}h")
+                    .max()
+                    .to_numpy()
+                )
+            elif kind == "delta":
+                j = np.searchsorted(key, lo, side="right") - 1
+                jc = np.clip(j, 0, None)
+                ok = (j >= 0) & (key[jc] >= lo - tol_s) & (site[jc] == site)
+                out = np.where(ok, vals - vals[jc], np.nan)
+            else:
+                raise ValueError(f"Unknown window kind {kind!r} for {col}")
+            w[name] = out.astype(np.float32)
+    return w
 
 def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
+    # Shallow copy: the caller's columns are shared, only the new int8 columns are allocated
+    out = df.copy(deep=False)
     t = pd.to_datetime(out["_t"], utc=True)
-    out["hour"] = t.dt.hour
-    out["dow"] = t.dt.dayofweek  # 0=Mon
-    out["month"] = t.dt.month
-    out["is_weekend"] = (out["dow"] >= 5).astype(int)
+    out["hour"] = t.dt.hour.astype(np.int8)
+    out["dow"] = t.dt.dayofweek.astype(np.int8)  # 0=Mon
+    out["month"] = t.dt.month.astype(np.int8)
+    out["is_weekend"] = (out["dow"] >= 5).astype(np.int8)
     return out
 
-def make_xy(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+def _float32_filled(s: pd.Series) -> np.ndarray:
+    # One float32 copy per column; inf/NaN -> 0 in place on that copy
+    vals = s.to_numpy(dtype=np.float32, copy=True)
+    vals[~np.isfinite(vals)] = 0.0
+    return vals
+
+# Station and weather-site identity, for models that split on categories natively
+CATEGORICAL_FEATURES = [RAIL["station"], "_nearest_site"]
+
+@profiled("make_xy")
+def make_xy(df: pd.DataFrame, categorical: bool = False) -> tuple[pd.DataFrame, Optional[pd.Series]]:
+    """
+    Model matrix: float32 weather/distance features (trees fit on float32, so sklearn
+    doesn't have to convert), int8 calendar features, float64 target.
+    With categorical=True, CATEGORICAL_FEATURES present in df are appended as pandas
+    categoricals (for HistGradientBoosting; the random forest needs numeric X).
+    y is None when df has no target column (rows being scored rather than trained on).
+    """
     out = add_time_features(df)
 
     base_feats = []
-    for c in WEATHER["features"]:
+    for c in WEATHER["features"] + window_feature_names():
         if c in out.columns:
             base_feats.append(c)
 
-    engineered = ["hour", "dow", "month", "is_weekend", "_site_dist_km"]
-    feats = base_feats + engineered
-
-    X = out[feats].copy()
-    y = out[TARGET_COL].astype(float).copy()
+    time_feats = ["hour", "dow", "month", "is_weekend"]
+    feats = base_feats + time_feats + ["_site_dist_km"]
 
     # Fill small missing values (ideally you shouldn't have many after join)
-    X = X.replace([np.inf, -np.inf], np.nan).fillna(0.0)
+    cols = {c: _float32_filled(out[c]) for c in base_feats}
+    cols.update({c: out[c].to_numpy() for c in time_feats})
+    cols["_site_dist_km"] = _float32_filled(out["_site_dist_km"])
+    if categorical:
+        for c in CATEGORICAL_FEATURES:
+            if c in out.columns:
+                cols[c] = out[c] if isinstance(out[c].dtype, pd.CategoricalDtype) else out[c].astype("category")
+                feats.append(c)
+    X = pd.DataFrame(cols, index=out.index)[feats]
+    y = out[TARGET_COL].astype(float) if TARGET_COL in out.columns else None
     return X, y
@@ -1,5 +1,7 @@
 from __future__ import annotations
+import hashlib
 import numpy as np
+from typing import Optional
 
 def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
     """
@@ -22,3 +24,72 @@ def nearest_site_index(event_lat: float, event_lon: float, site_lats: np.ndarray
     d = haversine_km(event_lat, event_lon, site_lats, site_lons)
     idx = int(np.argmin(d))
     return idx, float(d[idx])
+
+class SiteIndex:
+    """
+    Spatial index over weather site coordinates (BallTree, haversine metric).
+    Build once from the site list, then query whole coordinate arrays at a time.
+    """
+    EARTH_RADIUS_KM = 6371.0
+
+    def __init__(self, names, lats, lons):
+        self.names = np.asarray(names, dtype=object)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        if len(self.names) == 0:
+            raise ValueError("SiteIndex needs at least one site")
+        if not (len(self.names) == len(self.lats) == len(self.lons)):
+            raise ValueError("names, lats and lons must have the same length")
+
+        from sklearn.neighbors import BallTree
+        self._tree = BallTree(np.radians(np.column_stack([self.lats, self.lons])), metric="haversine")
+
+    @classmethod
+    def from_frame(cls, df, site_col: str, lat_col: str, lon_col: str) -> "SiteIndex":
+        sites = (
+            df[[site_col, lat_col, lon_col]]
+            .dropna()
+            .drop_duplicates(subset=[site_col])
+            .reset_index(drop=True)
+        )
+        return cls(sites[site_col].to_numpy(), sites[lat_col].to_numpy(), sites[lon_col].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of the site list (names + coordinates, order-independent); changes when sites change."""
+        order = np.argsort(self.names.astype(str), kind="stable")
+        h = hashlib.sha1()
+        h.update("\x1f".join(self.names[order].astype(str)).encode("utf-8"))
+        h.update(np.round(self.lats[order], 6).tobytes())
+        h.update(np.round(self.lons[order], 6).tobytes())
+        return h.hexdigest()
+
+    def query(self, lats, lons, k: int = 1, max_km: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        k-nearest sites for every (lat, lon) pair.
+        Returns (idx, dist_km), both shaped (n, k) and sorted by distance.
+        Neighbours farther than max_km get idx=-1 and dist=inf.
+        """
+        lats = np.asarray(lats, dtype=float).ravel()
+        lons = np.asarray(lons, dtype=float).ravel()
+        k = max(1, min(int(k), len(self)))
+        if len(lats) == 0:
+            return np.empty((0, k), dtype=np.int64), np.empty((0, k), dtype=float)
+
+        dist, idx = self._tree.query(np.radians(np.column_stack([lats, lons])), k=k)
+        dist = dist * self.EARTH_RADIUS_KM
+        idx = idx.astype(np.int64)
+
+        if max_km is not None:
+            far = dist > float(max_km)
+            idx[far] = -1
+            dist[far] = np.inf
+        return idx, dist
+
+    def nearest(self, lats, lons) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest site per point as flat (idx, dist_km) arrays."""
+        idx, dist = self.query(lats, lons, k=1)
+        return idx[:, 0], dist[:, 0]
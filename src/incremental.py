@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import TIME_TOL_MINUTES, MAX_STATION_DISTANCE_KM, SITE_LOOKUP_K
+from .features import window_lookback
+from .geo import SiteIndex
+from .io_schema import RAIL, WEATHER
+from .join_weather_rail import JoinStats, _to_utc, join_rail_with_weather
+from .site_lookup import SiteLookup
+from .streaming import part_schema
+from .weather_store import MONTH_COL, WeatherStore
+
+# Parquet schema-metadata key holding the high-water marks a partition was built with
+WATERMARK_KEY = b"watermark"
+# Key holding the row count and content hash of the rail rows a partition's month was built from
+RAIL_DIGEST_KEY = b"rail_digest"
+PART_FILE = "part-0.parquet"
+# Rail digests of months whose events all dropped in the join, so no partition holds them
+# (underscore-prefixed: dataset discovery skips it)
+EMPTY_MONTHS_FILE = "_empty_months.json"
+
+def _month_dir(out_dir: str, month: str) -> str:
+    return os.path.join(out_dir, f"{MONTH_COL}={month}")
+
+def _partition_files(out_dir: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(out_dir, f"{MONTH_COL}=*", PART_FILE)))
+
+def read_watermarks(out_dir: str) -> dict[str, pd.Timestamp]:
+    """
+    Latest rail event time and weather observation time any partition under out_dir was
+    built from ({} before the first run).
+    """
+    marks: dict[str, pd.Timestamp] = {}
+    for path in _partition_files(out_dir):
+        meta = pq.read_schema(path).metadata or {}
+        if WATERMARK_KEY not in meta:
+            continue
+        for key, value in json.loads(meta[WATERMARK_KEY]).items():
+            ts = pd.Timestamp(value)
+            marks[key] = max(marks.get(key, ts), ts)
+    return marks
+
+def _read_empty_months(out_dir: str) -> dict[str, str]:
+    path = os.path.join(out_dir, EMPTY_MONTHS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_empty_months(out_dir: str, empty: dict[str, str]) -> None:
+    path = os.path.join(out_dir, EMPTY_MONTHS_FILE)
+    tmp = os.path.join(out_dir, f".{EMPTY_MONTHS_FILE}.tmp")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(empty, f, sort_keys=True)
+    os.replace(tmp, path)
+
+def read_rail_digests(out_dir: str) -> dict[str, str]:
+    """Month -> digest of the rail input each month under out_dir was built from."""
+    digests = _read_empty_months(out_dir)
+    for path in _partition_files(out_dir):
+        month = os.path.basename(os.path.dirname(path)).split("=", 1)[1]
+        meta = pq.read_schema(path).metadata or {}
+        digests[month] = meta.get(RAIL_DIGEST_KEY, b"").decode("utf-8")
+    return digests
+
+def _rail_month_digests(rail: pd.DataFrame, months: pd.Series) -> dict[str, str]:
+    """Row count and order-independent content hash of the rail rows in each month."""
+    h = pd.util.hash_pandas_object(rail, index=False)
+    values = h.to_numpy()
+    out = {}
+    for month, idx in h.groupby(months.to_numpy()).indices.items():
+        # uint64 sum wraps around, which is fine for a fingerprint
+        out[month] = f"{len(idx)}:{int(values[idx].sum(dtype=np.uint64)):016x}"
+    return out
+
+def _weather_max_time(weather: Union[pd.DataFrame, WeatherStore]) -> Optional[pd.Timestamp]:
+    if isinstance(weather, WeatherStore):
+        return weather.max_time()
+    t = _to_utc(weather, WEATHER["time"]).max()
+    return None if pd.isna(t) else t
+
+def _write_partition(
+    df: pd.DataFrame, path: str, schema: Optional[pa.Schema], watermarks: dict, rail_digest: str
+) -> pa.Schema:
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    if schema is None:
+        table = table.cast(part_schema(table.schema))
+    meta = dict(table.schema.metadata or {})
+    meta[WATERMARK_KEY] = json.dumps({k: v.isoformat() for k, v in watermarks.items()}).encode("utf-8")
+    meta[RAIL_DIGEST_KEY] = rail_digest.encode("utf-8")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Dot-prefixed temp name: dataset discovery skips it if we die before the rename
+    tmp = os.path.join(os.path.dirname(path), f".{PART_FILE}.tmp")
+    pq.write_table(table.replace_schema_metadata(meta), tmp)
+    os.replace(tmp, path)
+    return table.schema
+
+def update_features(
+    rail_path: str,
+    weather: Union[pd.DataFrame, WeatherStore],
+    out_dir: str,
+    time_tolerance_minutes: int = TIME_TOL_MINUTES,
+    max_station_distance_km: Optional[float] = MAX_STATION_DISTANCE_KM,
+    site_index: Optional[SiteIndex] = None,
+    site_lookup: Optional[SiteLookup] = None,
+    fallback_k: int = SITE_LOOKUP_K,
+) -> tuple[JoinStats, list[str]]:
+    """
+    Incremental refresh of a month-partitioned joined dataset (out_dir/ym=YYYY-MM/part-0.parquet).
+
+    Each partition's Parquet metadata records the weather observation watermark and a digest
+    (row count and content hash) of the rail rows of its month; months whose events all dropped
+    in the join keep their digest in out_dir/_empty_months.json. A month is affected when its
+    rail digest changed, so appended and back-filled HSP ranges alike are picked up, or when it
+    holds events within the time tolerance of weather observed after the weather watermark.
+    Only affected months are re-joined and their partitions replaced; the first run (or one
+    over partitions without digests) rebuilds all. Weather back-filled before the watermark is
+    not detected; drop out_dir to rebuild.
+
+    Returns (join stats for the re-joined months, affected months).
+    """
+    tol = pd.Timedelta(minutes=int(time_tolerance_minutes))
+    marks = read_watermarks(out_dir)
+    built = read_rail_digests(out_dir)
+
+    rail = pd.read_csv(rail_path)
+    rail_times = _to_utc(rail, RAIL["time"])
+    rail_months = rail_times.dt.tz_convert(None).dt.strftime("%Y-%m")
+    weather_max = _weather_max_time(weather)
+    empty = JoinStats(rail_rows=0, weather_rows=0, joined_rows=0, dropped_time=0, dropped_distance=0)
+    if rail_times.isna().all() or weather_max is None:
+        return empty, []
+
+    # Months whose rail rows differ from what their partition was built with (new, changed or gone)
+    digests = _rail_month_digests(rail, rail_months)
+    affected = {m for m in set(digests) | set(built) if digests.get(m, "") != built.get(m)}
+    # Months whose join result can have changed because newer weather arrived
+    if "weather_max_t" not in marks:
+        affected |= set(digests)
+    elif weather_max > marks["weather_max_t"]:
+        since = (marks["weather_max_t"] - tol).tz_convert(None).strftime("%Y-%m")
+        affected |= {m for m in set(digests) | set(built) if m >= since}
+    affected = sorted(affected)
+    if not affected:
+        return empty, []
+
+    first_month = pd.Timestamp(affected[0], tz="UTC")
+    rail = rail[rail_months.isin(affected).to_numpy()]
+    if isinstance(weather, pd.DataFrame):
+        # Keep enough history before the first month for the rolling window features
+        weather = weather[_to_utc(weather, WEATHER["time"]) >= first_month - tol - window_lookback(time_tolerance_minutes)]
+
+    joined, stats = join_rail_with_weather(
+        rail,
+        weather,
+        time_tolerance_minutes=time_tolerance_minutes,
+        max_station_distance_km=max_station_distance_km,
+        site_index=site_index,
+        site_lookup=site_lookup,
+        fallback_k=fallback_k,
+    )
+
+    watermarks = {"rail_max_t": rail_times.max(), "weather_max_t": weather_max}
+    months = joined["_t"].dt.tz_convert(None).dt.strftime("%Y-%m")
+
+    # Keep new partitions on the schema of the ones already on disk
+    existing = _partition_files(out_dir)
+    schema = part_schema(pq.read_schema(existing[0]).remove_metadata()) if existing else None
+    empty = _read_empty_months(out_dir)
+    for month in affected:
+        path = os.path.join(_month_dir(out_dir, month), PART_FILE)
+        part = joined[months == month]
+        empty.pop(month, None)
+        if part.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            if month in digests:
+                # Every event dropped: remember the digest, or the month would be re-joined on every run
+                empty[month] = digests[month]
+            continue
+        schema = _write_partition(part, path, schema, watermarks, digests[month]).remove_metadata()
+    _write_empty_months(out_dir, empty)
+    return stats, affected
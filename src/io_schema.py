@@ -1,22 +1,3 @@
-
----
-
-## Source code
-
-### `src/config.py`
-
-```python
-TIME_COL_RAIL = "event_time"
-TIME_COL_WEATHER = "obs_time"
-
-# Tolerance for time alignment (minutes)
-TIME_TOL_MINUTES = 60
-
-# If weather is sparse, you can allow farther stations; set to None to disable
-MAX_STATION_DISTANCE_KM = 50.0
-
-TARGET_COL = "delay_minutes"
-RANDOM_SEED = 42
 # If your CSV headers differ, change them here.
 
 RAIL = {
@@ -2,11 +2,15 @@ from __future__ import annotations
 
 import pandas as pd
 import numpy as np
-from dataclasses import dataclass
-from typing import Optional
-
-from .geo import nearest_site_index
-from .config import TIME_TOL_MINUTES, MAX_STATION_DISTANCE_KM
+from dataclasses import dataclass, fields
+from typing import Optional, Union
+
+from .features import add_weather_window_features, window_feature_names, window_lookback
+from .geo import SiteIndex
+from .profiling import profiled, stage
+from .site_lookup import SiteLookup
+from .weather_store import WeatherStore
+from .config import TIME_TOL_MINUTES, MAX_STATION_DISTANCE_KM, SITE_LOOKUP_K
 from .io_schema import RAIL, WEATHER
 
 @dataclass
@@ -16,109 +20,181 @@ class JoinStats:
     joined_rows: int
     dropped_time: int
     dropped_distance: int
+    # Joined via a farther site because the nearer ones had no observation within tolerance
+    fallback_rows: int = 0
+
+    def __add__(self, other: "JoinStats") -> "JoinStats":
+        return JoinStats(**{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)})
 
 def _to_utc(df: pd.DataFrame, col: str) -> pd.Series:
     # Convert timestamps robustly; keep as UTC
     ts = pd.to_datetime(df[col], errors="coerce", utc=True)
     return ts
 
+@profiled("join.align")
+def _align_nearest_time(
+    rail: pd.DataFrame,
+    w: pd.DataFrame,
+    time_tolerance_minutes: int,
+) -> tuple[pd.DataFrame, int]:
+    """
+    Nearest-time alignment of every rail event with its `_nearest_site` weather history.
+    All sites are handled in one merge_asof pass: each side is sorted once by `_t`
+    and by= restricts matches to the event's site.
+    Returns (joined rows, number of events with no observation within tolerance).
+    """
+    tol = pd.Timedelta(minutes=int(time_tolerance_minutes))
+
+    keep_cols = ["_t", WEATHER["site"], WEATHER["lat"], WEATHER["lon"]] + WEATHER["features"]
+    keep_cols += [c for c in window_feature_names() if c in w.columns]
+    w = w[keep_cols].sort_values("_t", kind="stable")
+    rail = rail.sort_values("_t", kind="stable")
+
+    joined = pd.merge_asof(
+        rail,
+        w,
+        on="_t",
+        left_by="_nearest_site",
+        right_by=WEATHER["site"],
+        direction="nearest",
+        tolerance=tol,
+    )
+
+    # Rows with no match have NaNs in weather features
+    ok = joined[WEATHER["features"][0]].notna() if WEATHER["features"] else joined[WEATHER["site"]].notna()
+    dropped_time = int((~ok).sum())
+    return joined[ok].reset_index(drop=True), dropped_time
+
+@profiled("join.prepare_weather")
+def _prepare_weather(weather_df: pd.DataFrame, time_tolerance_minutes: int = TIME_TOL_MINUTES) -> pd.DataFrame:
+    # Shallow copy: only the new _t column is added, the caller's columns are shared, not copied
+    w = weather_df.copy(deep=False)
+    w["_t"] = _to_utc(w, WEATHER["time"])
+    w = w.dropna(subset=["_t", WEATHER["lat"], WEATHER["lon"]])
+    for c in WEATHER["features"]:
+        if c in w.columns and w[c].dtype != np.float32:
+            w[c] = w[c].astype(np.float32)
+    return add_weather_window_features(w, time_tolerance_minutes=time_tolerance_minutes)
+
+@profiled("join_rail_with_weather")
 def join_rail_with_weather(
     rail_df: pd.DataFrame,
-    weather_df: pd.DataFrame,
+    weather_df: Union[pd.DataFrame, WeatherStore],
     time_tolerance_minutes: int = TIME_TOL_MINUTES,
     max_station_distance_km: Optional[float] = MAX_STATION_DISTANCE_KM,
+    site_index: Optional[SiteIndex] = None,
+    site_lookup: Optional[SiteLookup] = None,
+    fallback_k: int = SITE_LOOKUP_K,
 ) -> tuple[pd.DataFrame, JoinStats]:
     """
     Steps:
       1) For each rail event, find nearest weather site by haversine distance.
-      2) Within that site's weather history, join by nearest timestamp (merge_asof) with tolerance.
+         Sites are resolved once per distinct station coordinate through a SiteLookup and
+         gathered onto the events; pass site_lookup (see open_site_lookup) to reuse and extend
+         a persisted table, and site_index to reuse a prebuilt spatial index.
+      2) Within that site's weather history, join by nearest timestamp (merge_asof) with tolerance,
+         for all sites in a single pass grouped by site. The matched observation carries the
+         site's rolling window features (WEATHER_WINDOWS), computed once on the weather frame.
+      3) Events with no observation within tolerance retry against their next-nearest sites,
+         up to fallback_k sites and within max_station_distance_km. `_site_rank` records the
+         rank used (0 = nearest), `_nearest_site`/`_site_dist_km` the site actually joined.
+
+    weather_df may also be a WeatherStore; then only the assigned sites over the events'
+    time span (+/- tolerance) are read from disk, and weather_rows counts the rows read.
     """
-    rail = rail_df.copy()
-    w = weather_df.copy()
+    rail = rail_df.copy(deep=False)
 
     # Normalize timestamps
     rail["_t"] = _to_utc(rail, RAIL["time"])
-    w["_t"] = _to_utc(w, WEATHER["time"])
-
     rail = rail.dropna(subset=["_t", RAIL["lat"], RAIL["lon"], RAIL["target"]])
-    w = w.dropna(subset=["_t", WEATHER["lat"], WEATHER["lon"]])
-
-    # Pre-extract site coords
-    site_coords = (
-        w[[WEATHER["site"], WEATHER["lat"], WEATHER["lon"]]]
-        .dropna()
-        .drop_duplicates(subset=[WEATHER["site"]])
-        .reset_index(drop=True)
-    )
-    site_lats = site_coords[WEATHER["lat"]].to_numpy()
-    site_lons = site_coords[WEATHER["lon"]].to_numpy()
 
-    # For each rail event, pick nearest site
-    nearest_sites = []
-    nearest_dists = []
-    for lat, lon in zip(rail[RAIL["lat"]].to_numpy(), rail[RAIL["lon"]].to_numpy()):
-        idx, dist_km = nearest_site_index(lat, lon, site_lats, site_lons)
-        nearest_sites.append(site_coords.loc[idx, WEATHER["site"]])
-        nearest_dists.append(dist_km)
+    store = weather_df if isinstance(weather_df, WeatherStore) else None
+    if store is None:
+        w = _prepare_weather(weather_df, time_tolerance_minutes)
+        if site_index is None:
+            site_index = SiteIndex.from_frame(w, WEATHER["site"], WEATHER["lat"], WEATHER["lon"])
+    elif site_index is None:
+        site_index = store.site_index
+
+    # Nearest site per distinct station, gathered onto every event
+    if site_lookup is None:
+        site_lookup = SiteLookup(site_index.fingerprint, k=fallback_k)
+    with stage("join.assign_sites", rows=len(rail)):
+        sites, dist_km = site_lookup.gather(
+            site_index,
+            rail[RAIL["lat"]].to_numpy(),
+            rail[RAIL["lon"]].to_numpy(),
+            stations=rail[RAIL["station"]].to_numpy() if RAIL["station"] in rail.columns else None,
+        )
 
-    rail["_nearest_site"] = nearest_sites
-    rail["_site_dist_km"] = nearest_dists
+    rail["_cand"] = np.arange(len(rail))
+    rail["_nearest_site"] = sites[:, 0]
+    rail["_site_dist_km"] = dist_km[:, 0]
 
     # Optional distance filtering
-    dropped_distance = 0
-    if max_station_distance_km is not None:
-        before = len(rail)
-        rail = rail[rail["_site_dist_km"] <= float(max_station_distance_km)].copy()
-        dropped_distance = before - len(rail)
-
-    # Now time-align per site using merge_asof
-    # Sort for merge_asof
-    rail = rail.sort_values("_t")
-    w = w.sort_values("_t")
-
-    # We'll merge weather features by nearest time, grouped by nearest site.
-    # Approach: split rail by site; merge_asof with weather filtered to that site.
-    joined_parts = []
-    dropped_time = 0
+    max_km = np.inf if max_station_distance_km is None else float(max_station_distance_km)
+    near = rail["_site_dist_km"].to_numpy() <= max_km
+    dropped_distance = int((~near).sum())
+    if dropped_distance:
+        rail = rail[near].copy()
 
     tol = pd.Timedelta(minutes=int(time_tolerance_minutes))
+    if store is not None:
+        w_parts, loaded = [], set()
+        # Rolling windows look back from each observation, so read that much extra history
+        start, end = (rail["_t"].min() - tol - window_lookback(time_tolerance_minutes), rail["_t"].max() + tol) if len(rail) else (None, None)
 
-    for site, rail_part in rail.groupby("_nearest_site", sort=False):
-        w_part = w[w[WEATHER["site"]] == site].copy()
-        if w_part.empty:
-            # no weather for that site
-            dropped_time += len(rail_part)
-            continue
-
-        # Keep only relevant columns from weather
-        keep_cols = ["_t", WEATHER["site"], WEATHER["lat"], WEATHER["lon"]] + WEATHER["features"]
-        w_part = w_part[keep_cols].dropna(subset=["_t"])
-
-        merged = pd.merge_asof(
-            rail_part.sort_values("_t"),
-            w_part.sort_values("_t"),
-            on="_t",
-            direction="nearest",
-            tolerance=tol,
-        )
-
-        # Rows with no match have NaNs in weather features
-        ok = merged[WEATHER["features"][0]].notna() if WEATHER["features"] else merged[WEATHER["site"]].notna()
-        dropped_time += int((~ok).sum())
-        merged = merged[ok].copy()
-
-        joined_parts.append(merged)
-
-    if joined_parts:
-        joined = pd.concat(joined_parts, ignore_index=True)
-    else:
-        joined = rail.iloc[0:0].copy()
+    # Rank 0 is the nearest site; events it can't serve within tolerance move on to the next
+    # nearest (still within max_station_distance_km), one vectorized merge_asof per rank
+    joined_parts = []
+    pending = rail
+    dropped_time = 0
+    for rank in range(min(int(fallback_k), sites.shape[1])):
+        if rank > 0:
+            cand = pending["_cand"].to_numpy()
+            site, dist = sites[cand, rank], dist_km[cand, rank]
+            usable = pd.notna(site) & (dist <= max_km)
+            dropped_time += int((~usable).sum())
+            pending = pending[usable].copy()
+            pending["_nearest_site"] = site[usable]
+            pending["_site_dist_km"] = dist[usable]
+        if pending.empty:
+            break
+        pending["_site_rank"] = np.int8(rank)
+
+        if store is not None:
+            new_sites = [x for x in pd.unique(pending["_nearest_site"]) if x not in loaded]
+            if new_sites:
+                with stage("join.read_store") as st:
+                    part = store.read(sites=new_sites, start=start, end=end)
+                    st["rows"] = len(part)
+                w_parts.append(_prepare_weather(part, time_tolerance_minutes))
+                loaded.update(new_sites)
+            w = pd.concat(w_parts, ignore_index=True) if len(w_parts) > 1 else w_parts[0]
+
+        matched, _ = _align_nearest_time(pending, w, time_tolerance_minutes)
+        joined_parts.append(matched)
+        pending = pending[~pending["_cand"].isin(matched["_cand"])]
+
+    if store is not None and not w_parts:
+        w = _prepare_weather(store.read(sites=[]), time_tolerance_minutes)
+    if not joined_parts:
+        joined_parts.append(_align_nearest_time(rail.assign(_site_rank=np.int8(0)), w, time_tolerance_minutes)[0])
+
+    joined = pd.concat(joined_parts, ignore_index=True) if len(joined_parts) > 1 else joined_parts[0]
+    joined = joined.sort_values("_t", kind="stable").drop(columns="_cand").reset_index(drop=True)
+    # A few hundred distinct stations/sites repeated over millions of rows: store them as codes
+    for c in (RAIL["station"], WEATHER["site"], "_nearest_site"):
+        if c in joined.columns:
+            joined[c] = joined[c].astype("category")
+    joined["_site_dist_km"] = joined["_site_dist_km"].astype(np.float32)
 
     stats = JoinStats(
         rail_rows=int(len(rail_df)),
-        weather_rows=int(len(weather_df)),
+        weather_rows=int(len(w) if store is not None else len(weather_df)),
         joined_rows=int(len(joined)),
-        dropped_time=int(dropped_time),
+        dropped_time=int(dropped_time + len(pending)),
         dropped_distance=int(dropped_distance),
+        fallback_rows=int((joined["_site_rank"] > 0).sum()),
     )
     return joined, stats
@@ -1,37 +1,69 @@
 from __future__ import annotations
+import hashlib
+import io
+import json
+import os
+import time
+import warnings
 import joblib
 import numpy as np
-from dataclasses import dataclass
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+import pandas as pd
+import sklearn
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+from joblib import effective_n_jobs
+from sklearn.model_selection import ParameterGrid, train_test_split
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
+from threadpoolctl import threadpool_limits
 
-from .config import RANDOM_SEED
+from .config import CV_CACHE_DIR, RANDOM_SEED
+from .profiling import profiled, stage
+
+# HistGradientBoosting bins each categorical feature into at most this many categories
+HGB_MAX_CATEGORIES = 255
+
+# Saved model layout version, and the zlib level save_model uses by default
+# (0 writes raw arrays, which load_model(mmap=True) maps instead of reading)
+ARTIFACT_FORMAT = 1
+MODEL_COMPRESS = 3
 
 @dataclass
 class TrainResult:
-    model: RandomForestRegressor
+    model: object
     mae: float
     r2: float
     y_true: np.ndarray
     y_pred: np.ndarray
     feature_names: list[str]
+    fit_seconds: float = 0.0
+    predict_rows_per_s: float = 0.0
+    data_fingerprint: Optional[str] = None
 
-def train_random_forest(X, y) -> TrainResult:
+def data_fingerprint(X: pd.DataFrame, y: Optional[pd.Series] = None) -> str:
+    """Hash of the feature names and every row of X (and y), to tell which data a model saw."""
+    h = hashlib.sha1(json.dumps([str(c) for c in X.columns]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    if y is not None:
+        h.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+def _fit_and_score(model, X, y) -> TrainResult:
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=RANDOM_SEED
     )
 
-    model = RandomForestRegressor(
-        n_estimators=400,
-        random_state=RANDOM_SEED,
-        n_jobs=-1,
-        max_depth=None,
-        min_samples_leaf=2,
-    )
-    model.fit(X_train, y_train)
+    with stage("train.fit", rows=len(X_train)):
+        t = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_seconds = time.perf_counter() - t
 
-    y_pred = model.predict(X_test)
+    with stage("train.predict_holdout", rows=len(X_test)):
+        t = time.perf_counter()
+        y_pred = model.predict(X_test)
+        predict_seconds = time.perf_counter() - t
 
     mae = float(mean_absolute_error(y_test, y_pred))
     r2 = float(r2_score(y_test, y_pred))
@@ -43,10 +75,344 @@ def train_random_forest(X, y) -> TrainResult:
         y_true=y_test.to_numpy(),
         y_pred=y_pred,
         feature_names=list(X.columns),
+        fit_seconds=fit_seconds,
+        predict_rows_per_s=len(X_test) / predict_seconds if predict_seconds > 0 else float("inf"),
+        data_fingerprint=data_fingerprint(X, y),
+    )
+
+@profiled("train_random_forest")
+def train_random_forest(X, y) -> TrainResult:
+    model = RandomForestRegressor(
+        n_estimators=400,
+        random_state=RANDOM_SEED,
+        n_jobs=-1,
+        max_depth=None,
+        min_samples_leaf=2,
     )
+    return _fit_and_score(model, X, y)
+
+def cap_categories(X: pd.DataFrame, max_categories: int = HGB_MAX_CATEGORIES) -> pd.DataFrame:
+    """
+    Keep the most frequent max_categories - 1 values of each categorical column and turn the
+    rest into missing values, which HistGradientBoosting bins separately (as it does categories
+    unseen at fit time). Only over-limit columns are copied.
+    """
+    out = X
+    for c in X.columns:
+        if not isinstance(X[c].dtype, pd.CategoricalDtype):
+            continue
+        counts = X[c].value_counts()
+        counts = counts[counts > 0]
+        if len(counts) < max_categories:
+            continue
+        if out is X:
+            out = X.copy(deep=False)
+        keep = counts.index[: max_categories - 1]
+        out[c] = X[c].where(X[c].isin(keep)).cat.remove_unused_categories()
+    return out
+
+@profiled("train_hist_gradient_boosting")
+def train_hist_gradient_boosting(
+    X,
+    y,
+    max_iter: int = 1000,
+    learning_rate: float = 0.1,
+    max_leaf_nodes: int = 63,
+    validation_fraction: float = 0.1,
+    n_iter_no_change: int = 20,
+) -> TrainResult:
+    """
+    Histogram gradient boosting: categorical columns of X (see make_xy(categorical=True)) are
+    split on natively, and boosting stops once the loss on a validation_fraction slice of the
+    training rows hasn't improved for n_iter_no_change iterations.
+    """
+    model = HistGradientBoostingRegressor(
+        max_iter=max_iter,
+        learning_rate=learning_rate,
+        max_leaf_nodes=max_leaf_nodes,
+        early_stopping=True,
+        validation_fraction=validation_fraction,
+        n_iter_no_change=n_iter_no_change,
+        categorical_features="from_dtype",
+        random_state=RANDOM_SEED,
+    )
+    return _fit_and_score(model, cap_categories(X), y)
+
+def model_size_bytes(model) -> int:
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    return buf.tell()
+
+def compare_models(results: dict[str, TrainResult]) -> pd.DataFrame:
+    """Side-by-side fit time, holdout predict throughput, serialized size and accuracy."""
+    rows = []
+    for name, res in results.items():
+        rows.append({
+            "model": name,
+            "fit_s": round(res.fit_seconds, 2),
+            "predict_rows_per_s": round(res.predict_rows_per_s),
+            "size_mb": round(model_size_bytes(res.model) / 2**20, 2),
+            "mae": round(res.mae, 3),
+            "r2": round(res.r2, 3),
+        })
+        if hasattr(res.model, "n_iter_"):
+            rows[-1]["iterations"] = int(res.model.n_iter_)
+    return pd.DataFrame(rows).set_index("model")
 
-def save_model(model, path: str) -> None:
-    joblib.dump(model, path)
+def model_features(model) -> Optional[list[str]]:
+    """Feature names the model was fitted on (None for models fitted on bare arrays)."""
+    names = getattr(model, "feature_names_in_", None)
+    return None if names is None else [str(c) for c in names]
 
-def load_model(path: str):
-    return joblib.load(path)
+@dataclass
+class ModelArtifact:
+    model: object
+    feature_names: list[str]
+    metrics: dict = field(default_factory=dict)
+    data_fingerprint: Optional[str] = None
+    sklearn_version: Optional[str] = None
+    created: Optional[str] = None
+    format: int = ARTIFACT_FORMAT
+
+def save_model(
+    model,
+    path: str,
+    feature_names: Optional[list[str]] = None,
+    metrics: Optional[dict] = None,
+    data_fingerprint: Optional[str] = None,
+    compress: int = MODEL_COMPRESS,
+) -> None:
+    """
+    Write a ModelArtifact: the model plus its feature order, training-data fingerprint,
+    metrics and sklearn version. compress is a zlib level; 0 stores the tree arrays raw so
+    load_model(mmap=True) can map them instead of reading and inflating the file.
+    """
+    names = feature_names if feature_names is not None else model_features(model)
+    if names is None:
+        raise ValueError("feature_names is required for models fitted without column names")
+    artifact = ModelArtifact(
+        model=model,
+        feature_names=[str(c) for c in names],
+        metrics={k: float(v) for k, v in (metrics or {}).items()},
+        data_fingerprint=data_fingerprint,
+        sklearn_version=sklearn.__version__,
+        created=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    )
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    joblib.dump(asdict(artifact), tmp, compress=compress)
+    os.replace(tmp, path)
+
+def load_artifact(path: str, mmap: bool = False, feature_names: Optional[list[str]] = None) -> ModelArtifact:
+    """
+    Load a saved model with its metadata. Plain joblib dumps from before ModelArtifact load
+    with empty metadata. Raises ValueError if the stored feature list disagrees with the
+    model's fitted columns or with feature_names (when given, order included).
+    """
+    # mmap only applies to uncompressed files; joblib reads compressed ones normally
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=".*mmap_mode.*compressed.*")
+        obj = joblib.load(path, mmap_mode="r" if mmap else None)
+
+    if isinstance(obj, dict) and "format" in obj and "model" in obj:
+        if obj["format"] > ARTIFACT_FORMAT:
+            raise ValueError(f"{path}: artifact format {obj['format']} is newer than supported ({ARTIFACT_FORMAT})")
+        artifact = ModelArtifact(**obj)
+    else:
+        artifact = ModelArtifact(model=obj, feature_names=model_features(obj) or [], format=0)
+
+    fitted = model_features(artifact.model)
+    if fitted is not None and fitted != artifact.feature_names:
+        raise ValueError(f"{path}: stored feature list doesn't match the model's fitted columns")
+    if feature_names is not None and list(feature_names) != artifact.feature_names:
+        missing = [c for c in artifact.feature_names if c not in feature_names]
+        raise ValueError(
+            f"{path}: feature order differs from the model's"
+            + (f" (missing {missing})" if missing else "")
+        )
+    if artifact.sklearn_version and artifact.sklearn_version != sklearn.__version__:
+        warnings.warn(f"{path} was saved with scikit-learn {artifact.sklearn_version}, running {sklearn.__version__}")
+    return artifact
+
+def load_model(path: str, mmap: bool = False, feature_names: Optional[list[str]] = None):
+    return load_artifact(path, mmap=mmap, feature_names=feature_names).model
+
+# Default search spaces for search_hyperparameters
+RF_GRID = {"n_estimators": [200, 400], "max_depth": [None, 20], "min_samples_leaf": [2, 5]}
+HGB_GRID = {"learning_rate": [0.05, 0.1], "max_leaf_nodes": [31, 63], "l2_regularization": [0.0, 1.0]}
+
+@dataclass
+class Fold:
+    """Positions in time order: train on [0, train_end), test on [test_start, test_end)."""
+    index: int
+    train_end: int
+    test_start: int
+    test_end: int
+
+def rolling_origin_folds(t: pd.Series, n_folds: int = 5, gap: Optional[pd.Timedelta] = None) -> tuple[np.ndarray, list[Fold]]:
+    """
+    Expanding-window folds over event time: rows sorted by t are cut into n_folds + 1 equal
+    blocks, and fold i trains on blocks 0..i and tests on block i + 1, so no fold learns from
+    weather later than the events it is scored on. Training rows within `gap` before the test
+    block are left out (e.g. window_lookback(), so rolling features don't straddle the cut).
+
+    Returns (order, folds): order sorts the rows by time, fold bounds index into that order.
+    """
+    times = pd.to_datetime(t, utc=True).to_numpy()
+    order = np.argsort(times, kind="stable")
+    sorted_t = times[order]
+    bounds = np.linspace(0, len(order), n_folds + 2).astype(int)
+    folds = []
+    for i in range(n_folds):
+        test_start, test_end = int(bounds[i + 1]), int(bounds[i + 2])
+        train_end = test_start
+        if gap is not None and gap > pd.Timedelta(0):
+            cut = sorted_t[test_start] - np.timedelta64(gap.value, "ns")
+            train_end = int(np.searchsorted(sorted_t, cut, side="left"))
+        if train_end == 0 or test_end == test_start:
+            continue
+        folds.append(Fold(i, train_end, test_start, test_end))
+    return order, folds
+
+def _estimator(kind: str, params: dict, categorical: Optional[np.ndarray]):
+    if kind == "rf":
+        return RandomForestRegressor(random_state=RANDOM_SEED, n_jobs=1, **params)
+    if kind == "hgb":
+        return HistGradientBoostingRegressor(
+            categorical_features=categorical if categorical is not None and categorical.any() else None,
+            early_stopping=True,
+            max_iter=params.pop("max_iter", 1000),
+            random_state=RANDOM_SEED,
+            **params,
+        )
+    raise ValueError(f"Unknown model kind {kind!r} (expected 'rf' or 'hgb')")
+
+def _run_fold(data_dir: str, kind: str, params: dict, fold: Fold, categorical: Optional[np.ndarray]) -> dict:
+    # Workers map the shared arrays read-only; the folds are contiguous row ranges of them,
+    # so fit and predict see views of the mapping rather than per-worker copies
+    X = np.load(os.path.join(data_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+    model = _estimator(kind, dict(params), categorical)
+    with threadpool_limits(1):
+        t = time.perf_counter()
+        model.fit(X[: fold.train_end], y[: fold.train_end])
+        fit_s = time.perf_counter() - t
+        y_test = y[fold.test_start: fold.test_end]
+        y_pred = model.predict(X[fold.test_start: fold.test_end])
+    return {
+        "fold": fold.index,
+        "n_train": fold.train_end,
+        "n_test": fold.test_end - fold.test_start,
+        "mae": float(mean_absolute_error(y_test, y_pred)),
+        "r2": float(r2_score(y_test, y_pred)),
+        "fit_s": round(fit_s, 3),
+    }
+
+def _shared_arrays(X: pd.DataFrame, y: pd.Series, order: np.ndarray, root: str, fingerprint: str) -> tuple[str, np.ndarray]:
+    """
+    Time-ordered float32 X and float64 y saved once as .npy under root/data-<fingerprint>
+    (categoricals as codes, missing as NaN). Returns (directory, categorical column mask).
+    """
+    categorical = np.array([isinstance(X[c].dtype, pd.CategoricalDtype) for c in X.columns])
+    data_dir = os.path.join(root, f"data-{fingerprint}")
+    x_path, y_path = os.path.join(data_dir, "X.npy"), os.path.join(data_dir, "y.npy")
+    # Both files appear only via os.replace, so an interrupted save never looks complete
+    if not (os.path.exists(x_path) and os.path.exists(y_path)):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp = os.path.join(data_dir, ".y.npy")
+        with open(tmp, "wb") as f:
+            np.save(f, y.to_numpy(dtype=np.float64)[order])
+        os.replace(tmp, y_path)
+        tmp = os.path.join(data_dir, ".X.npy")
+        arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=X.shape)
+        for j, c in enumerate(X.columns):
+            col = X[c]
+            if categorical[j]:
+                codes = col.cat.codes.to_numpy().astype(np.float32)
+                codes[codes < 0] = np.nan
+                arr[:, j] = codes[order]
+            else:
+                arr[:, j] = col.to_numpy(dtype=np.float32)[order]
+        arr.flush()
+        del arr
+        os.replace(tmp, x_path)
+    return data_dir, categorical
+
+def _result_key(kind: str, params: dict, fold: Fold, fingerprint: str) -> str:
+    spec = json.dumps([kind, params, asdict(fold), fingerprint], sort_keys=True, default=str)
+    return hashlib.sha1(spec.encode("utf-8")).hexdigest()
+
+def search_hyperparameters(
+    X: pd.DataFrame,
+    y: pd.Series,
+    t: pd.Series,
+    grid: dict[str, list],
+    kind: str = "rf",
+    n_folds: int = 5,
+    gap: Optional[pd.Timedelta] = None,
+    n_jobs: int = -1,
+    cache_dir: str = CV_CACHE_DIR,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Grid search scored by rolling_origin_folds, one (params, fold) task per process.
+
+    X/y are written once, time-ordered, as .npy files that the workers memory-map, so no
+    worker gets its own copy of the feature matrix. Each finished fold is appended to
+    cache_dir/results.jsonl keyed by (kind, params, fold, data fingerprint); rerunning an
+    interrupted search only runs the folds not recorded there.
+
+    Returns (summary per parameter set sorted by mean MAE, per-fold results); the per-fold
+    `cached` column marks folds taken from results.jsonl rather than run now.
+    """
+    X = cap_categories(X)
+    order, folds = rolling_origin_folds(t, n_folds=n_folds, gap=gap)
+    if not folds:
+        raise ValueError("Not enough rows for time-ordered folds")
+    # The shared arrays are stored time-ordered, so the order is part of the data's identity
+    fingerprint = hashlib.sha1((data_fingerprint(X, y) + hashlib.sha1(order.tobytes()).hexdigest()).encode()).hexdigest()[:16]
+    data_dir, categorical = _shared_arrays(X, y, order, cache_dir, fingerprint)
+
+    results_path = os.path.join(cache_dir, "results.jsonl")
+    done: dict[str, dict] = {}
+    if os.path.exists(results_path):
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                done[rec["key"]] = rec
+
+    tasks = []
+    for params in ParameterGrid(grid):
+        for fold in folds:
+            key = _result_key(kind, params, fold, fingerprint)
+            if key not in done:
+                tasks.append((key, params, fold))
+    cached = set(done)
+    workers = max(1, min(effective_n_jobs(n_jobs), len(tasks)))
+    if tasks:
+        with open(results_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {pool.submit(_run_fold, data_dir, kind, params, fold, categorical): (key, params) for key, params, fold in tasks}
+            try:
+                for fut in as_completed(pending):
+                    key, params = pending[fut]
+                    rec = {"key": key, "kind": kind, "params": params, "data": fingerprint, **fut.result()}
+                    out.write(json.dumps(rec, default=str) + "\n")
+                    out.flush()
+                    done[key] = rec
+            except BaseException:
+                # Interrupted or a fold failed: drop queued folds rather than waiting for them
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    keys = {_result_key(kind, params, fold, fingerprint) for params in ParameterGrid(grid) for fold in folds}
+    per_fold = pd.DataFrame([done[k] for k in keys])
+    per_fold["cached"] = per_fold["key"].isin(cached)
+    per_fold["params"] = per_fold["params"].map(lambda p: json.dumps(p, sort_keys=True, default=str))
+    summary = (
+        per_fold.groupby("params")
+        .agg(mae=("mae", "mean"), mae_std=("mae", "std"), r2=("r2", "mean"), fit_s=("fit_s", "sum"), folds=("fold", "count"))
+        .sort_values("mae")
+    )
+    return summary, per_fold.drop(columns=["key"]).sort_values(["params", "fold"]).reset_index(drop=True)
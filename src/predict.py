@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from joblib import Parallel, delayed, effective_n_jobs
+
+from .config import TARGET_COL
+from .features import CATEGORICAL_FEATURES, make_xy
+from .io_schema import RAIL
+from .model import model_features
+from .profiling import stage
+
+PRED_COL = "pred_delay"
+BATCH_ROWS = 200_000
+# Below this many rows per chunk, thread start-up costs more than the parallel predict saves
+MIN_CHUNK_ROWS = 20_000
+
+def prepare_for_scoring(model, n_jobs: int) -> None:
+    # predict_frame parallelises across chunks; don't also fan out across trees inside each one
+    if n_jobs != 1 and "n_jobs" in model.get_params():
+        model.set_params(n_jobs=1)
+
+def feature_frame(model, df: pd.DataFrame) -> pd.DataFrame:
+    """make_xy features in the column order the model was fitted with."""
+    names = model_features(model)
+    categorical = names is not None and any(c in names for c in CATEGORICAL_FEATURES)
+    X, _ = make_xy(df, categorical=categorical)
+    if names is None:
+        return X
+    missing = [c for c in names if c not in X.columns]
+    if missing:
+        raise ValueError(f"Data lacks features the model was trained on: {missing}")
+    return X[names]
+
+def predict_frame(model, X: pd.DataFrame, n_jobs: int = 1, parallel: Optional[Parallel] = None) -> np.ndarray:
+    """Predict in row chunks on a thread pool (tree predict releases the GIL)."""
+    n_chunks = min(max(1, len(X) // MIN_CHUNK_ROWS), effective_n_jobs(n_jobs))
+    if n_chunks <= 1:
+        return model.predict(X)
+    bounds = np.linspace(0, len(X), n_chunks + 1).astype(int)
+    parallel = parallel or Parallel(n_jobs=n_jobs, prefer="threads")
+    parts = parallel(delayed(model.predict)(X.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:]))
+    return np.concatenate(parts)
+
+def _passthrough(columns: list[str]) -> list[str]:
+    # Rail columns pick up _x suffixes from the join when weather has the same names
+    keep = []
+    for c in [RAIL["time"], RAIL["station"], RAIL["lat"], RAIL["lon"], "_nearest_site", TARGET_COL]:
+        if c in columns:
+            keep.append(c)
+        elif f"{c}_x" in columns:
+            keep.append(f"{c}_x")
+    return keep
+
+def _output_schema(schema: pa.Schema) -> pa.Schema:
+    """Schema of the tables iter_predictions yields for a dataset with this schema."""
+    fields = [pa.field(c.removesuffix("_x"), schema.field(c).type) for c in _passthrough(schema.names)]
+    return pa.schema(fields + [pa.field(PRED_COL, pa.float32())])
+
+def iter_predictions(
+    model,
+    data_path: str,
+    batch_rows: int = BATCH_ROWS,
+    n_jobs: int = -1,
+) -> Iterator[pa.Table]:
+    """
+    Stream a joined Parquet file or directory (plain or month-partitioned) in record batches
+    and yield, per batch, the event identity columns plus PRED_COL.
+    """
+    dataset = ds.dataset(data_path, format="parquet", partitioning="hive")
+    keep = _passthrough(dataset.schema.names)
+    prepare_for_scoring(model, n_jobs)
+    with Parallel(n_jobs=n_jobs, prefer="threads") as parallel:
+        for batch in dataset.to_batches(batch_size=batch_rows):
+            if batch.num_rows == 0:
+                continue
+            with stage("predict.batch", rows=batch.num_rows):
+                X = feature_frame(model, batch.to_pandas())
+                pred = predict_frame(model, X, n_jobs=n_jobs, parallel=parallel)
+            cols = {c.removesuffix("_x"): batch.column(c) for c in keep}
+            cols[PRED_COL] = pa.array(pred.astype(np.float32))
+            yield pa.table(cols)
+
+def predict_parquet(
+    model,
+    data_path: str,
+    out_path: str,
+    batch_rows: int = BATCH_ROWS,
+    n_jobs: int = -1,
+) -> int:
+    """
+    Score data_path batch by batch into a single Parquet file at out_path; returns rows written.
+    The file is written under a temp name and renamed when complete, so out_path always holds
+    this run's output (an empty table with the output schema if there was nothing to score).
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    tmp = f"{out_path}.tmp"
+    rows = 0
+    writer = None
+    try:
+        for table in iter_predictions(model, data_path, batch_rows=batch_rows, n_jobs=n_jobs):
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            rows += table.num_rows
+        if writer is None:
+            schema = _output_schema(ds.dataset(data_path, format="parquet", partitioning="hive").schema)
+            pq.write_table(schema.empty_table(), tmp)
+        else:
+            writer.close()
+        os.replace(tmp, out_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return rows
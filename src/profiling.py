@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+# Set by enable(); stage() is a no-op while it is None, so library code can stay instrumented
+_active: Optional["Profiler"] = None
+
+def _page_size() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+_PAGE = _page_size()
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the process high-water mark off Linux."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE / 2**20
+    except (OSError, IndexError, ValueError):
+        return max_rss_mb()
+
+def max_rss_mb() -> float:
+    """Process high-water mark in MiB; 0.0 where the resource module is missing (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+class Profiler:
+    """
+    Collects nested stage records: wall time, rows, rows/s, RSS at start/end and the RSS peak
+    seen by a background sampler while the stage was open; with trace_memory, also the peak of
+    traced (Python/NumPy) allocations inside the stage.
+    """
+
+    def __init__(self, trace_memory: bool = False, sample_interval: float = 0.05):
+        self.trace_memory = trace_memory
+        self.sample_interval = sample_interval
+        self.started = datetime.now(timezone.utc)
+        self._t0 = time.perf_counter()
+        self.records: list[dict] = []
+        self._open: list[dict] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-rss", daemon=True)
+        if trace_memory:
+            tracemalloc.start()
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            rss = rss_mb()
+            with self._lock:
+                for frame in self._open:
+                    frame["rss_peak_mb"] = max(frame["rss_peak_mb"], rss)
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None) -> Iterator[dict]:
+        rss = rss_mb()
+        rec = {
+            "name": name,
+            "parent": self._open[-1]["name"] if self._open else None,
+            "depth": len(self._open),
+            "start_s": round(time.perf_counter() - self._t0, 4),
+            "rows": rows,
+            "rss_start_mb": round(rss, 1),
+            "rss_peak_mb": rss,
+        }
+        if self.trace_memory:
+            # Peaks are reset per stage; the enclosing stage's peak so far is carried in _traced
+            rec["_outer_peak"] = tracemalloc.get_traced_memory()[1]
+            rec["_traced"] = 0
+            tracemalloc.reset_peak()
+        with self._lock:
+            self._open.append(rec)
+            self.records.append(rec)
+
+        t = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec["seconds"] = round(time.perf_counter() - t, 4)
+            rss = rss_mb()
+            with self._lock:
+                self._open.remove(rec)
+                rec["rss_end_mb"] = round(rss, 1)
+                rec["rss_peak_mb"] = round(max(rec["rss_peak_mb"], rss), 1)
+            if rec.get("rows") is not None:
+                rec["rows"] = int(rec["rows"])
+                rec["rows_per_s"] = round(rec["rows"] / rec["seconds"], 1) if rec["seconds"] > 0 else None
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], rec.pop("_traced"))
+                rec["traced_peak_mb"] = round(peak / 2**20, 1)
+                outer = rec.pop("_outer_peak")
+                if self._open:
+                    self._open[-1]["_traced"] = max(self._open[-1]["_traced"], outer, peak)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def to_dict(self) -> dict:
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "total_seconds": round(time.perf_counter() - self._t0, 4),
+            "max_rss_mb": round(max_rss_mb(), 1),
+            "trace_memory": self.trace_memory,
+            "stages": self.records,
+        }
+
+    def write_json(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+def enable(trace_memory: bool = False) -> Profiler:
+    global _active
+    if _active is not None:
+        _active.close()
+    _active = Profiler(trace_memory=trace_memory)
+    return _active
+
+def disable() -> Optional[Profiler]:
+    global _active
+    prof, _active = _active, None
+    if prof is not None:
+        prof.close()
+    return prof
+
+@contextmanager
+def stage(name: str, rows: Optional[int] = None) -> Iterator[dict]:
+    """
+    Time a block as a named stage of the active profiler. Yields the stage record, so
+    `rows` (and any extra fields) can be filled in once known. A no-op when profiling is off.
+    """
+    if _active is None:
+        yield {}
+        return
+    with _active.stage(name, rows) as rec:
+        yield rec
+
+def profiled(name: str):
+    """Decorator: run the function as a stage; rows = len() of its first argument if it has one."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            rows = len(args[0]) if args and hasattr(args[0], "__len__") else None
+            with _active.stage(name, rows):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+@contextmanager
+def profile_run(path: Optional[str], trace_memory: bool = False) -> Iterator[Optional[Profiler]]:
+    """Profile the enclosed run and write the JSON trace to `path`, even if it fails. No-op without a path."""
+    if not path:
+        yield None
+        return
+    prof = enable(trace_memory=trace_memory)
+    try:
+        with prof.stage("total"):
+            yield prof
+    finally:
+        disable()
+        prof.write_json(path)
+        print(f"Wrote profile: {path}")
@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import json
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from .config import MAX_STATION_DISTANCE_KM, SITE_LOOKUP_K
+from .features import window_lookback
+from .geo import SiteIndex
+from .io_schema import RAIL, WEATHER
+from .join_weather_rail import _prepare_weather, _to_utc
+from .predict import feature_frame
+from .site_lookup import SiteLookup
+from .weather_store import WeatherStore
+
+class WeatherState:
+    """
+    Latest observation per weather site, with its rolling window features, kept from a
+    trimmed per-site history (window_lookback() before each site's latest reading).
+    New observations replace the state of just the sites they touch.
+    """
+
+    def __init__(self, history: pd.DataFrame):
+        self._lock = threading.Lock()
+        self._history: Optional[pd.DataFrame] = None
+        self.latest = pd.DataFrame()
+        self.update(history)
+
+    @classmethod
+    def from_source(cls, weather: Union[pd.DataFrame, WeatherStore]) -> "WeatherState":
+        if isinstance(weather, WeatherStore):
+            end = weather.max_time()
+            # Sites that stopped reporting long before the newest reading are too stale to score with
+            return cls(weather.read(start=None if end is None else end - 2 * window_lookback()))
+        return cls(weather)
+
+    @property
+    def sites(self) -> np.ndarray:
+        return self.latest.index.to_numpy()
+
+    def update(self, obs: pd.DataFrame) -> int:
+        """Add observations (WEATHER columns); returns how many sites were refreshed."""
+        site = WEATHER["site"]
+        obs = obs.copy(deep=False)
+        obs["_t"] = _to_utc(obs, WEATHER["time"])
+        obs = obs.dropna(subset=["_t", site])
+        # Parsed once here: re-parsing strings of mixed formats later would turn some into NaT
+        obs[WEATHER["time"]] = obs["_t"]
+        if obs.empty:
+            return 0
+        obs[site] = obs[site].astype(str)
+        # Pushed observations may leave out coordinates of sites already known
+        for c in (WEATHER["lat"], WEATHER["lon"]):
+            if c not in obs.columns:
+                obs[c] = obs[site].map(self.latest[c]) if c in self.latest.columns else np.nan
+        cols = [WEATHER["time"], site, WEATHER["lat"], WEATHER["lon"]] + [c for c in WEATHER["features"] if c in obs.columns]
+        touched = obs[site].unique()
+
+        with self._lock:
+            hist = self._history
+            if hist is not None:
+                mask = hist[site].isin(touched)
+                fresh = pd.concat([hist[mask], obs[cols + ["_t"]]], ignore_index=True)
+            else:
+                fresh = obs[cols + ["_t"]]
+            fresh = fresh.drop_duplicates(subset=[site, "_t"], keep="last")
+            newest = fresh.groupby(site)["_t"].transform("max")
+            fresh = fresh[fresh["_t"] >= newest - window_lookback()]
+            self._history = fresh if hist is None else pd.concat([hist[~mask], fresh], ignore_index=True)
+
+            # Window features only need recomputing over the touched sites' trimmed history
+            win = _prepare_weather(fresh.drop(columns=["_t"]))
+            last = win.groupby(site, sort=False).tail(1).set_index(site)
+            rest = self.latest.drop(index=touched, errors="ignore")
+            self.latest = pd.concat([rest, last]) if len(rest) else last
+        return len(touched)
+
+class Scorer:
+    """
+    Scores (station, time) requests with a warm model. Every known rail station is assigned
+    once to its nearest weather site that has state (among the SITE_LOOKUP_K nearest, within
+    max_station_distance_km), so a request only gathers a prepared feature row.
+    """
+
+    def __init__(
+        self,
+        model,
+        state: WeatherState,
+        stations: pd.DataFrame,
+        site_index: SiteIndex,
+        k: int = SITE_LOOKUP_K,
+        max_station_distance_km: Optional[float] = MAX_STATION_DISTANCE_KM,
+        site_lookup: Optional[SiteLookup] = None,
+    ):
+        self.model = model
+        self.state = state
+        self.max_km = max_station_distance_km
+        st = stations.drop_duplicates(subset=[RAIL["station"]]).reset_index(drop=True)
+        self._lookup = site_lookup or SiteLookup(site_index.fingerprint, k=k)
+        self._ranked = self._lookup.gather(site_index, st[RAIL["lat"]], st[RAIL["lon"]], st[RAIL["station"]])
+        self._stations = st[RAIL["station"]].astype(str).to_numpy()
+        self.reassign()
+
+    @property
+    def stations(self) -> list[str]:
+        return list(self.assigned.index)
+
+    def reassign(self) -> None:
+        """Pick each station's site from the current weather state; call after state updates."""
+        sites, dist = self._ranked
+        ok = np.isin(sites, self.state.sites)
+        if self.max_km is not None:
+            ok &= dist <= self.max_km
+        has = ok.any(axis=1)
+        rank = ok.argmax(axis=1)
+        rows = np.flatnonzero(has)
+        self.assigned = pd.DataFrame(
+            {"_nearest_site": sites[rows, rank[rows]], "_site_dist_km": dist[rows, rank[rows]].astype(np.float32)},
+            index=pd.Index(self._stations[rows], name=RAIL["station"]),
+        )
+
+    def feature_rows(self, stations: list[str], times: list[pd.Timestamp]) -> pd.DataFrame:
+        assigned = self.assigned.loc[stations]
+        weather = self.state.latest.loc[assigned["_nearest_site"]]
+        out = weather.reset_index(drop=True).rename(columns={"_t": "obs_t"})
+        out[RAIL["station"]] = stations
+        out["_nearest_site"] = assigned["_nearest_site"].to_numpy()
+        out["_site_dist_km"] = assigned["_site_dist_km"].to_numpy()
+        out["_t"] = pd.DatetimeIndex(times)
+        return out
+
+    def score(self, requests: list[tuple[str, pd.Timestamp]]) -> list[dict]:
+        stations = [s for s, _ in requests]
+        rows = self.feature_rows(stations, [t for _, t in requests])
+        pred = self.model.predict(feature_frame(self.model, rows))
+        return [
+            {
+                "station": s,
+                "time": t.isoformat(),
+                "site": site,
+                "site_dist_km": round(float(d), 2),
+                "obs_time": o.isoformat(),
+                "pred_delay_minutes": round(float(p), 2),
+            }
+            for (s, t), site, d, o, p in zip(
+                requests, rows["_nearest_site"], rows["_site_dist_km"], rows["obs_t"], pred
+            )
+        ]
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and hands them to fn in batches: a batch
+    closes at max_batch items or max_wait_ms after its first item, whichever comes first.
+    """
+
+    def __init__(self, fn: Callable[[list], list], max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.fn = fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        fut: Future = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                # Retry one by one, so a bad item only fails its own request
+                for item, fut in batch:
+                    if len(batch) == 1:
+                        fut.set_exception(e)
+                        continue
+                    try:
+                        fut.set_result(self.fn([item])[0])
+                    except Exception as item_error:
+                        fut.set_exception(item_error)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+class LatencyStats:
+    """Rolling window of request latencies."""
+
+    def __init__(self, window: int = 100_000):
+        self._lat: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._lat.append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            lat = np.array(self._lat)
+        if not len(lat):
+            return {"requests": 0}
+        p50, p99 = np.percentile(lat, [50, 99]) * 1000
+        return {"requests": int(len(lat)), "p50_ms": round(float(p50), 3), "p99_ms": round(float(p99), 3),
+                "max_ms": round(float(lat.max() * 1000), 3)}
+
+def _parse_time(value: Optional[str]) -> pd.Timestamp:
+    # Default: the coming hour
+    if not value:
+        return pd.Timestamp.now(tz="UTC").ceil("h")
+    t = pd.Timestamp(value)
+    return t.tz_localize("UTC") if t.tzinfo is None else t.tz_convert("UTC")
+
+class ScoringService:
+    def __init__(self, scorer: Scorer, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self.scorer = scorer
+        self.batcher = MicroBatcher(scorer.score, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        self.latency = LatencyStats()
+
+    def score(self, requests: list[tuple[str, Optional[str]]]) -> list[dict]:
+        """
+        Validate, then score through the shared batcher. Raises ValueError for malformed
+        requests and KeyError for unknown stations.
+        """
+        t0 = time.perf_counter()
+        parsed = []
+        for station, when in requests:
+            if not isinstance(station, str):
+                raise ValueError(f"station must be a string, got {station!r}")
+            if when is not None and not isinstance(when, str):
+                raise ValueError(f"time must be an ISO timestamp string, got {when!r}")
+            if station not in self.scorer.assigned.index:
+                raise KeyError(station)
+            parsed.append((station, _parse_time(when)))
+        futures = [self.batcher.submit(r) for r in parsed]
+        out = [f.result() for f in futures]
+        self.latency.record(time.perf_counter() - t0)
+        return out
+
+    def update_weather(self, obs: pd.DataFrame) -> int:
+        n = self.scorer.state.update(obs)
+        self.scorer.reassign()
+        return n
+
+    def stats(self) -> dict:
+        b = self.batcher
+        return {**self.latency.summary(), "batches": b.batches,
+                "mean_batch": round(b.items / b.batches, 2) if b.batches else 0.0}
+
+    def close(self) -> None:
+        self.batcher.close()
+
+def _handler(service: ScoringService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"null")
+
+        def _score(self, requests) -> None:
+            try:
+                self._send(200, service.score(requests))
+            except KeyError as e:
+                self._send(404, {"error": f"unknown station or no weather site in range: {e.args[0]}"})
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+
+        def _guarded(self, handle) -> None:
+            # Always answer: an uncaught error would drop the connection and leave the client waiting
+            try:
+                handle()
+            except Exception as e:
+                # log_message is silenced for access logs, so report failures directly
+                traceback.print_exc()
+                try:
+                    self._send(500, {"error": f"internal error: {type(e).__name__}"})
+                except OSError:
+                    pass
+
+        def do_GET(self):
+            self._guarded(self._get)
+
+        def do_POST(self):
+            self._guarded(self._post)
+
+        def _get(self):
+            url = urlparse(self.path)
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            if url.path == "/score":
+                if "station" not in q:
+                    return self._send(400, {"error": "missing station"})
+                self._score([(q["station"], q.get("time"))])
+            elif url.path == "/stations":
+                self._send(200, service.scorer.stations)
+            elif url.path == "/stats":
+                self._send(200, service.stats())
+            elif url.path == "/health":
+                self._send(200, {"ok": True})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _post(self):
+            url = urlparse(self.path)
+            try:
+                body = self._body()
+            except ValueError:
+                return self._send(400, {"error": "invalid JSON"})
+            if url.path == "/score":
+                # {"requests": [{"station": ..., "time": ...}, ...]}
+                reqs = body.get("requests") if isinstance(body, dict) else None
+                if not isinstance(reqs, list) or not all(isinstance(r, dict) for r in reqs):
+                    return self._send(400, {"error": 'expected {"requests": [{"station": ..., "time": ...}, ...]}'})
+                self._score([(r.get("station"), r.get("time")) for r in reqs])
+            elif url.path == "/weather":
+                # List of observation records with WEATHER column names
+                try:
+                    n = service.update_weather(pd.DataFrame(body))
+                except (KeyError, ValueError, TypeError) as e:
+                    return self._send(400, {"error": f"bad observations: {e}"})
+                self._send(200, {"sites_updated": n})
+            else:
+                self._send(404, {"error": "not found"})
+
+    return Handler
+
+def make_server(service: ScoringService, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    server.daemon_threads = True
+    return server
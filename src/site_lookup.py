@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import SITE_LOOKUP_K
+from .geo import SiteIndex
+
+# Coordinates are matched after rounding, so float noise from CSV/Parquet round-trips doesn't miss
+COORD_DECIMALS = 6
+META_KEY = b"site_lookup"
+
+def _coord_keys(lats, lons) -> pd.MultiIndex:
+    return pd.MultiIndex.from_arrays([
+        np.round(np.asarray(lats, dtype=float), COORD_DECIMALS),
+        np.round(np.asarray(lons, dtype=float), COORD_DECIMALS),
+    ])
+
+class SiteLookup:
+    """
+    Rail station -> weather site table: for every distinct station coordinate, the k nearest
+    weather sites and their distances (nearest first). There are only a few hundred stations,
+    so assigning sites to millions of events becomes an array gather instead of a spatial query.
+
+    The table records the fingerprint of the site list it was built from; gathering against a
+    SiteIndex with a different fingerprint discards it and starts again.
+    """
+
+    def __init__(
+        self,
+        fingerprint: str,
+        k: int = SITE_LOOKUP_K,
+        lats=(),
+        lons=(),
+        sites: Optional[np.ndarray] = None,
+        dist_km: Optional[np.ndarray] = None,
+        stations=None,
+    ):
+        self.fingerprint = fingerprint
+        self.k = max(1, int(k))
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        n = len(self.lats)
+        self.sites = sites if sites is not None else np.empty((n, self.k), dtype=object)
+        self.dist_km = dist_km if dist_km is not None else np.empty((n, self.k), dtype=float)
+        self.stations = np.asarray(stations if stations is not None else [None] * n, dtype=object)
+        self.dirty = False
+        self._keys = _coord_keys(self.lats, self.lons)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @classmethod
+    def build(cls, site_index: SiteIndex, lats, lons, stations=None, k: int = SITE_LOOKUP_K) -> "SiteLookup":
+        lookup = cls(site_index.fingerprint, k=k)
+        lookup.gather(site_index, lats, lons, stations=stations)
+        return lookup
+
+    def _reset(self, site_index: SiteIndex) -> None:
+        self.__init__(site_index.fingerprint, k=self.k)
+        self.dirty = True
+
+    def _extend(self, site_index: SiteIndex, lats, lons, stations) -> None:
+        keys = _coord_keys(lats, lons)
+        new = ~keys.isin(self._keys) & ~keys.duplicated()
+        if not new.any():
+            return
+
+        add_lats = np.asarray(lats, dtype=float)[new]
+        add_lons = np.asarray(lons, dtype=float)[new]
+        idx, dist = site_index.query(add_lats, add_lons, k=self.k)
+
+        # Fewer sites than k: pad the missing ranks as "no site"
+        sites = np.full((len(idx), self.k), None, dtype=object)
+        dists = np.full((len(idx), self.k), np.inf)
+        sites[:, : idx.shape[1]] = site_index.names[idx]
+        dists[:, : idx.shape[1]] = dist
+
+        add_stations = np.asarray(stations, dtype=object)[new] if stations is not None else [None] * len(add_lats)
+
+        self.lats = np.concatenate([self.lats, add_lats])
+        self.lons = np.concatenate([self.lons, add_lons])
+        self.sites = np.concatenate([self.sites, sites])
+        self.dist_km = np.concatenate([self.dist_km, dists])
+        self.stations = np.concatenate([self.stations, np.asarray(add_stations, dtype=object)])
+        self._keys = _coord_keys(self.lats, self.lons)
+        self.dirty = True
+
+    def gather(self, site_index: SiteIndex, lats, lons, stations=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (sites, dist_km) for every (lat, lon), both shaped (n, k) and ordered nearest first.
+        Coordinates not yet in the table are queried once per distinct station and added.
+        """
+        if self.fingerprint != site_index.fingerprint:
+            self._reset(site_index)
+
+        keys = _coord_keys(lats, lons)
+        pos = self._keys.get_indexer(keys)
+        if (pos < 0).any():
+            self._extend(site_index, lats, lons, stations)
+            pos = self._keys.get_indexer(keys)
+        return self.sites[pos], self.dist_km[pos]
+
+    def to_frame(self) -> pd.DataFrame:
+        out = pd.DataFrame({"station_name": self.stations, "lat": self.lats, "lon": self.lons})
+        for r in range(self.k):
+            out[f"site_{r + 1}"] = self.sites[:, r]
+            out[f"dist_km_{r + 1}"] = self.dist_km[:, r]
+        return out
+
+    def save(self, path: str) -> None:
+        table = pa.Table.from_pandas(self.to_frame(), preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta[META_KEY] = json.dumps({"fingerprint": self.fingerprint, "k": self.k}).encode("utf-8")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        pq.write_table(table.replace_schema_metadata(meta), path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> "SiteLookup":
+        table = pq.read_table(path)
+        meta = json.loads(table.schema.metadata[META_KEY])
+        df = table.to_pandas()
+        k = int(meta["k"])
+        sites = df[[f"site_{r + 1}" for r in range(k)]].to_numpy(dtype=object)
+        dist_km = df[[f"dist_km_{r + 1}" for r in range(k)]].to_numpy(dtype=float)
+        return cls(meta["fingerprint"], k=k, lats=df["lat"], lons=df["lon"],
+                   sites=sites, dist_km=dist_km, stations=df["station_name"])
+
+def open_site_lookup(path: Optional[str], site_index: SiteIndex, k: int = SITE_LOOKUP_K) -> SiteLookup:
+    """
+    The persisted lookup at `path` if it was built for this site list with at least k ranks,
+    otherwise an empty one to be filled (and saved) on first use.
+    """
+    if path and os.path.exists(path):
+        lookup = SiteLookup.load(path)
+        if lookup.fingerprint == site_index.fingerprint and lookup.k >= k:
+            return lookup
+        print(f"Site list changed; rebuilding {path}")
+    lookup = SiteLookup(site_index.fingerprint, k=k)
+    lookup.dirty = True
+    return lookup
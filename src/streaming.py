@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import glob
+import os
+import tempfile
+from typing import Iterator, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .config import TIME_TOL_MINUTES, MAX_STATION_DISTANCE_KM, SITE_LOOKUP_K
+from .io_schema import RAIL
+from .join_weather_rail import JoinStats, join_rail_with_weather
+from .profiling import stage
+from .site_lookup import open_site_lookup
+from .weather_store import WeatherStore, ingest_csv
+
+def iter_csv_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    yield from pd.read_csv(path, chunksize=int(chunk_rows))
+
+def part_schema(schema: pa.Schema) -> pa.Schema:
+    """
+    schema with every dictionary (pandas category) field on int32 indices. pandas picks the
+    smallest code type that fits each frame, so a part pinned to an earlier part's int8
+    codes could not hold a later part with more distinct stations.
+    """
+    return pa.schema(
+        [f.with_type(pa.dictionary(pa.int32(), f.type.value_type, f.type.ordered))
+         if pa.types.is_dictionary(f.type) else f for f in schema],
+        metadata=schema.metadata,
+    )
+
+def stream_join_csv(
+    rail_path: str,
+    weather_path: str,
+    out_dir: str,
+    chunk_rows: int,
+    time_tolerance_minutes: int = TIME_TOL_MINUTES,
+    max_station_distance_km: Optional[float] = MAX_STATION_DISTANCE_KM,
+    tmp_dir: Optional[str] = None,
+    site_lookup_path: Optional[str] = None,
+    fallback_k: int = SITE_LOOKUP_K,
+) -> JoinStats:
+    """
+    Out-of-core join: rail events are read `chunk_rows` at a time, each chunk is joined
+    against just the weather window it spans (+/- the time tolerance) for its nearest sites,
+    read from a WeatherStore, and every joined chunk is written as its own part file under
+    out_dir. Peak memory is roughly one rail chunk plus its weather window, independent of
+    the total history length.
+    Works best when the rail CSV is time-ordered (as fetchhsp.py writes it); an unordered
+    file is still joined correctly, just with wider weather windows per chunk.
+
+    weather_path is either a WeatherStore directory or a CSV, which is first ingested
+    into a temporary store. Station -> site assignments are shared across chunks and, with
+    site_lookup_path, persisted for later runs.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for stale in glob.glob(os.path.join(out_dir, "part-*.parquet")):
+        os.remove(stale)
+
+    stats = JoinStats(rail_rows=0, weather_rows=0, joined_rows=0, dropped_time=0, dropped_distance=0)
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as spool_dir:
+        if WeatherStore.is_store(weather_path):
+            store = WeatherStore(weather_path)
+        else:
+            with stage("stream.ingest_weather"):
+                store = ingest_csv(weather_path, spool_dir, chunk_rows)
+        stats.weather_rows = store.count_rows()
+        if stats.weather_rows == 0:
+            raise SystemExit(f"No usable weather rows in {weather_path}")
+        site_index = store.site_index
+        site_lookup = open_site_lookup(site_lookup_path, site_index, k=fallback_k)
+
+        schema = None
+        for i, rail in enumerate(iter_csv_chunks(rail_path, chunk_rows)):
+            rail[RAIL["target"]] = pd.to_numeric(rail[RAIL["target"]], errors="coerce")
+            joined, part = join_rail_with_weather(
+                rail,
+                store,
+                time_tolerance_minutes=time_tolerance_minutes,
+                max_station_distance_km=max_station_distance_km,
+                site_index=site_index,
+                site_lookup=site_lookup,
+                fallback_k=fallback_k,
+            )
+            part.weather_rows = 0
+            stats = stats + part
+
+            if len(joined):
+                # Pin every part to the first part's schema so the directory reads back as one dataset
+                table = pa.Table.from_pandas(joined, schema=schema, preserve_index=False)
+                if schema is None:
+                    schema = part_schema(table.schema)
+                    table = table.cast(schema)
+                with stage("stream.write_part", rows=len(joined)):
+                    pq.write_table(table, os.path.join(out_dir, f"part-{i:05d}.parquet"))
+
+        if site_lookup_path and site_lookup.dirty:
+            site_lookup.save(site_lookup_path)
+
+    return stats
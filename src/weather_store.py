@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import os
+import re
+import uuid
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .geo import SiteIndex
+from .io_schema import WEATHER
+
+# Hive partition column holding the observation year-month ("2024-01")
+MONTH_COL = "ym"
+# Site coordinates live beside the partitions; the "_" prefix keeps dataset discovery away from it
+SITES_FILE = "_sites.parquet"
+
+def _partitioning() -> ds.Partitioning:
+    return ds.partitioning(pa.schema([(WEATHER["site"], pa.string()), (MONTH_COL, pa.string())]), flavor="hive")
+
+def _month_keys(start: pd.Timestamp, end: pd.Timestamp) -> list[str]:
+    return list(pd.period_range(start.tz_convert(None), end.tz_convert(None), freq="M").strftime("%Y-%m"))
+
+class WeatherStore:
+    """
+    Columnar weather history: a Parquet dataset partitioned by site and observation month,
+    with a UTC timestamp column and float32 feature columns. Site coordinates are kept once
+    in a side table rather than on every row.
+
+    Reads push site and time predicates down to the partition/row-group level, so only the
+    stations and months a query touches are read from disk.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._sites: Optional[pd.DataFrame] = None
+        self._site_index: Optional[SiteIndex] = None
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isdir(path) and os.path.exists(os.path.join(path, SITES_FILE))
+
+    def sites(self) -> pd.DataFrame:
+        if self._sites is None:
+            path = os.path.join(self.root, SITES_FILE)
+            if os.path.exists(path):
+                self._sites = pd.read_parquet(path)
+            else:
+                self._sites = pd.DataFrame({WEATHER["site"]: [], WEATHER["lat"]: [], WEATHER["lon"]: []})
+        return self._sites
+
+    @property
+    def site_index(self) -> SiteIndex:
+        if self._site_index is None:
+            self._site_index = SiteIndex.from_frame(self.sites(), WEATHER["site"], WEATHER["lat"], WEATHER["lon"])
+        return self._site_index
+
+    def _dataset(self) -> ds.Dataset:
+        return ds.dataset(self.root, format="parquet", partitioning=_partitioning())
+
+    def count_rows(self) -> int:
+        if not self.is_store(self.root):
+            return 0
+        return int(self._dataset().count_rows())
+
+    def max_time(self) -> Optional[pd.Timestamp]:
+        """Latest observation time in the store (None when empty); reads only the time column."""
+        if not self.is_store(self.root):
+            return None
+        t = pc.max(self._dataset().to_table(columns=[WEATHER["time"]])[WEATHER["time"]]).as_py()
+        return None if t is None else pd.Timestamp(t).tz_convert("UTC")
+
+    def write(self, df: pd.DataFrame, tag: Optional[str] = None) -> int:
+        """
+        Add observations (WEATHER column names, any timestamp format) to the store.
+        Files are named after `tag`, so re-ingesting the same source with the same tag
+        overwrites its earlier files instead of duplicating rows.
+        Returns the number of rows written.
+        """
+        cols = [WEATHER["time"], WEATHER["site"], WEATHER["lat"], WEATHER["lon"]] + WEATHER["features"]
+        out = df[[c for c in cols if c in df.columns]].copy()
+        out[WEATHER["time"]] = pd.to_datetime(out[WEATHER["time"]], errors="coerce", utc=True)
+        out = out.dropna(subset=[WEATHER["time"], WEATHER["site"], WEATHER["lat"], WEATHER["lon"]])
+        if out.empty:
+            return 0
+
+        out[WEATHER["site"]] = out[WEATHER["site"]].astype(str)
+        for c in WEATHER["features"]:
+            out[c] = out[c].astype(np.float32) if c in out.columns else np.float32(np.nan)
+        out[MONTH_COL] = out[WEATHER["time"]].dt.strftime("%Y-%m")
+
+        self._update_sites(out[[WEATHER["site"], WEATHER["lat"], WEATHER["lon"]]])
+
+        rows = out[[WEATHER["time"], WEATHER["site"], MONTH_COL] + WEATHER["features"]]
+        ds.write_dataset(
+            pa.Table.from_pandas(rows, preserve_index=False),
+            self.root,
+            format="parquet",
+            partitioning=_partitioning(),
+            basename_template=f"{tag or uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return int(len(rows))
+
+    def remove_source(self, source: str) -> int:
+        """
+        Delete every file written for `source` in chunks (tags "<source>-NNNNN"), so a source
+        re-ingested with a different chunk size replaces its earlier rows rather than adding to
+        them. Returns the number of files removed.
+        """
+        pattern = re.compile(rf"{re.escape(source)}-\d{{5}}-\d+\.parquet")
+        removed = 0
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if pattern.fullmatch(name):
+                    os.remove(os.path.join(dirpath, name))
+                    removed += 1
+        return removed
+
+    def _update_sites(self, coords: pd.DataFrame) -> None:
+        new = coords.drop_duplicates(subset=[WEATHER["site"]], keep="last")
+        merged = pd.concat([self.sites(), new], ignore_index=True)
+        merged = merged.drop_duplicates(subset=[WEATHER["site"]], keep="last").reset_index(drop=True)
+        merged[WEATHER["lat"]] = merged[WEATHER["lat"]].astype(float)
+        merged[WEATHER["lon"]] = merged[WEATHER["lon"]].astype(float)
+        os.makedirs(self.root, exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(merged, preserve_index=False), os.path.join(self.root, SITES_FILE))
+        self._sites = merged
+        self._site_index = None
+
+    def read(
+        self,
+        sites: Optional[Iterable[str]] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> pd.DataFrame:
+        """
+        Observations for `sites` with start <= obs_time <= end (each bound optional),
+        with site lat/lon attached from the side table.
+        """
+        schema = [WEATHER["time"], WEATHER["site"], WEATHER["lat"], WEATHER["lon"]] + WEATHER["features"]
+        if not self.is_store(self.root):
+            return pd.DataFrame(columns=schema)
+
+        flt = None
+
+        def _and(expr):
+            return expr if flt is None else flt & expr
+
+        if sites is not None:
+            flt = _and(ds.field(WEATHER["site"]).isin([str(s) for s in sites]))
+        if start is not None and end is not None:
+            flt = _and(ds.field(MONTH_COL).isin(_month_keys(start, end)))
+        if start is not None:
+            flt = _and(ds.field(WEATHER["time"]) >= pa.scalar(start, pa.timestamp("ns", "UTC")))
+        if end is not None:
+            flt = _and(ds.field(WEATHER["time"]) <= pa.scalar(end, pa.timestamp("ns", "UTC")))
+
+        cols = [WEATHER["time"], WEATHER["site"]] + WEATHER["features"]
+        out = self._dataset().to_table(columns=cols, filter=flt).to_pandas()
+
+        coords = self.sites().set_index(WEATHER["site"])
+        out[WEATHER["lat"]] = out[WEATHER["site"]].map(coords[WEATHER["lat"]]).astype(float)
+        out[WEATHER["lon"]] = out[WEATHER["site"]].map(coords[WEATHER["lon"]]).astype(float)
+        return out[schema]
+
+def ingest_csv(path: str, root: str, chunk_rows: int = 1_000_000) -> WeatherStore:
+    """Convert a weather CSV (e.g. midas.py output) into a WeatherStore, chunk by chunk."""
+    store = WeatherStore(root)
+    tag = os.path.splitext(os.path.basename(path))[0]
+    store.remove_source(tag)
+    for i, chunk in enumerate(pd.read_csv(path, chunksize=int(chunk_rows))):
+        store.write(chunk, tag=f"{tag}-{i:05d}")
+    return store
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Scripts and tests import the repo as `src.*`, run from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
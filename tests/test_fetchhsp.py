@@ -0,0 +1,162 @@
+import json
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import fetchhsp
+
+N_RIDS = 12
+FLAKY_RID = "R0001"
+FLAKY_STATUSES = [503, 502, 504]
+
+class StubHSP:
+    """Local stand-in for the HSP API: serviceMetrics lists N_RIDS services, serviceDetails
+    answers slower for early RIDs (so they finish out of order) and fails FLAKY_RID a few times."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.served = []  # (rid, status, monotonic time) per serviceDetails response
+        self.failures = list(FLAKY_STATUSES)
+
+    def handle(self, path, body):
+        if path.endswith("/serviceMetrics"):
+            rids = [f"R{i:04d}" for i in range(N_RIDS)]
+            return 200, {"Services": [{"serviceAttributesMetrics": {"rids": [rid]}} for rid in rids]}
+        rid = body["rid"]
+        i = int(rid[1:])
+        with self.lock:
+            self.calls[rid] = self.calls.get(rid, 0) + 1
+            status = self.failures.pop(0) if rid == FLAKY_RID and self.failures else 200
+        if status == 200:
+            time.sleep(0.01 * (N_RIDS - i))
+        with self.lock:
+            self.served.append((rid, status, time.monotonic()))
+        if status != 200:
+            return status, None
+        return 200, {
+            "serviceAttributesDetails": {"rid": rid},
+            "serviceDate": "2024-01-02",
+            "locations": [{"crs": "SWA", "gbttBookedArrival": f"{6 + i:02d}00", "actualArrival": f"{6 + i:02d}{i:02d}"}],
+        }
+
+@pytest.fixture
+def hsp(monkeypatch):
+    stub = StubHSP()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, payload = stub.handle(self.path, body)
+            data = b"" if payload is None else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("HSP_USER", "user")
+    monkeypatch.setenv("HSP_PASS", "pass")
+
+    # Keep the backoff schedule but make each wait short; the other workers carry on meanwhile
+    stub.waits = []
+
+    def short_sleep(seconds):
+        stub.waits.append(seconds)
+        time.sleep(0.2)
+
+    monkeypatch.setattr(fetchhsp, "time", types.SimpleNamespace(sleep=short_sleep, time=time.time))
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", stub
+    httpd.shutdown()
+    httpd.server_close()
+
+def _run(monkeypatch, base_url, out, concurrency, fresh=True):
+    monkeypatch.setattr(sys, "argv", [
+        "fetchhsp.py", "--from-crs", "CDF", "--to-crs", "SWA", "--start", "2024-01-02", "--end", "2024-01-02",
+        "--days", "WEEKDAY", "--base-url", base_url, "--out", str(out), "--concurrency", str(concurrency),
+        "--no-cache", "--flush-every", "5",
+    ] + (["--fresh"] if fresh else []))
+    fetchhsp.main()
+    return pd.read_parquet(out) if str(out).endswith(".parquet") else pd.read_csv(out)
+
+def test_concurrency_preserves_row_order(hsp, monkeypatch, tmp_path):
+    base_url, stub = hsp
+    serial = _run(monkeypatch, base_url, tmp_path / "serial.csv", concurrency=1)
+    stub.failures = list(FLAKY_STATUSES)
+    parallel = _run(monkeypatch, base_url, tmp_path / "parallel.csv", concurrency=4)
+
+    assert list(serial["rid"]) == [f"R{i:04d}" for i in range(N_RIDS)]
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert list(parallel["delay_minutes"]) == list(range(N_RIDS))
+
+def test_backoff_retries_one_request_without_stalling_others(hsp, monkeypatch, tmp_path):
+    base_url, stub = hsp
+    rows = _run(monkeypatch, base_url, tmp_path / "out.csv", concurrency=4)
+
+    assert len(rows) == N_RIDS
+    # 502, 503 and 504 are each retried, with a growing backoff, on that request only
+    assert stub.calls[FLAKY_RID] == len(FLAKY_STATUSES) + 1
+    assert all(n == 1 for rid, n in stub.calls.items() if rid != FLAKY_RID)
+    assert len(stub.waits) == len(FLAKY_STATUSES)
+    assert stub.waits == sorted(stub.waits) and stub.waits[0] >= 2
+
+    # While FLAKY_RID was backing off, the other workers kept fetching
+    flaky = [t for rid, _, t in stub.served if rid == FLAKY_RID]
+    others_during_backoff = [rid for rid, _, t in stub.served if rid != FLAKY_RID and flaky[0] < t < flaky[-1]]
+    assert len(others_during_backoff) >= 2 * 4 - 1
+
+def test_csv_sink_refuses_old_header(tmp_path):
+    path = tmp_path / "old.csv"
+    path.write_text("event_time,station_name,delay_minutes,delay_basis\n2024-01-02T08:00:00,SWA,3,arrival\n")
+    with pytest.raises(SystemExit, match="--fresh"):
+        fetchhsp.open_row_sink(str(path), fetchhsp.ROW_FIELDS)
+
+    ok = tmp_path / "new.csv"
+    sink = fetchhsp.open_row_sink(str(ok), fetchhsp.ROW_FIELDS)
+    sink.write(pd.DataFrame({"event_time": ["2024-01-02T08:00:00"], "station_name": ["SWA"], "delay_minutes": [3]}))
+    sink = fetchhsp.open_row_sink(str(ok), fetchhsp.ROW_FIELDS)
+    sink.write(pd.DataFrame({"event_time": ["2024-01-02T09:00:00"], "station_name": ["SWA"], "delay_minutes": [4]}))
+    assert list(pd.read_csv(ok).columns) == fetchhsp.ROW_FIELDS
+    assert len(pd.read_csv(ok)) == 2
+
+def test_default_stations_are_in_wales():
+    # Aberdeen, Severn Beach and White Hart Lane once slipped into the default set
+    assert not {"ABD", "SVB", "WHL"} & fetchhsp.WELSH_CRS
+    assert {"CDF", "SWA", "HHD", "STJ"} <= fetchhsp.WELSH_CRS
+
+@pytest.mark.parametrize("name", ["out.csv", "out.parquet"])
+def test_crash_between_write_and_checkpoint_does_not_duplicate_rows(hsp, monkeypatch, tmp_path, name):
+    base_url, stub = hsp
+    stub.failures = []
+    mark = fetchhsp.RidCheckpoint.mark
+    calls = []
+
+    def crash_on_second_batch(self, rids):
+        calls.append(list(rids))
+        if len(calls) == 2:
+            raise KeyboardInterrupt  # the batch's rows are in the output, its RIDs not yet marked
+        mark(self, rids)
+
+    monkeypatch.setattr(fetchhsp.RidCheckpoint, "mark", crash_on_second_batch)
+    with pytest.raises(KeyboardInterrupt):
+        _run(monkeypatch, base_url, tmp_path / name, concurrency=2)
+    monkeypatch.setattr(fetchhsp.RidCheckpoint, "mark", mark)
+
+    stub.calls.clear()
+    rows = _run(monkeypatch, base_url, tmp_path / name, concurrency=2, fresh=False)
+    assert sorted(rows["rid"]) == [f"R{i:04d}" for i in range(N_RIDS)]
+    # Only the RIDs after the crashed batch were fetched again
+    assert sorted(stub.calls) == [f"R{i:04d}" for i in range(10, N_RIDS)]
@@ -0,0 +1,53 @@
+import pandas as pd
+
+from benchmarks.synthetic import make_rail, make_sites, make_weather
+from src.incremental import update_features
+from src.io_schema import RAIL
+from src.join_weather_rail import join_rail_with_weather
+
+def _plain(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.drop(columns="ym", errors="ignore")
+    out = out.astype({c: object for c in out.columns if isinstance(out[c].dtype, pd.CategoricalDtype)})
+    out[RAIL["time"]] = pd.to_datetime(out[RAIL["time"]], utc=True)
+    return out.sort_values(["_t", RAIL["station"]], kind="stable").reset_index(drop=True)
+
+def test_rail_backfill_rejoins_only_changed_month(tmp_path):
+    sites = make_sites(20)
+    weather, grid = make_weather(sites, days=75)
+    rail = make_rail(sites, grid, n_events=4000)
+    t = pd.to_datetime(rail[RAIL["time"]], utc=True)
+    # First HSP fetch missed the second half of January
+    gap = (t >= pd.Timestamp("2023-01-15", tz="UTC")) & (t < pd.Timestamp("2023-02-01", tz="UTC"))
+    rail_csv, out = tmp_path / "rail.csv", tmp_path / "out"
+
+    rail[~gap].to_csv(rail_csv, index=False)
+    _, months = update_features(str(rail_csv), weather, str(out))
+    assert months == ["2023-01", "2023-02", "2023-03"]
+
+    rail.to_csv(rail_csv, index=False)
+    _, months = update_features(str(rail_csv), weather, str(out))
+    assert months == ["2023-01"]
+    _, months = update_features(str(rail_csv), weather, str(out))
+    assert months == []
+
+    expected, _ = join_rail_with_weather(pd.read_csv(rail_csv), weather)
+    result = pd.read_parquet(out)
+    pd.testing.assert_frame_equal(_plain(result)[expected.columns], _plain(expected), check_dtype=False)
+
+def test_month_with_no_joined_rows_is_not_rejoined(tmp_path):
+    sites = make_sites(20)
+    weather, grid = make_weather(sites, days=75)
+    rail = make_rail(sites, grid, n_events=3000)
+    t = pd.to_datetime(rail[RAIL["time"]], utc=True)
+    # All of February's events come from a station far from every weather site
+    feb = (t >= pd.Timestamp("2023-02-01", tz="UTC")) & (t < pd.Timestamp("2023-03-01", tz="UTC"))
+    rail.loc[feb, [RAIL["lat"], RAIL["lon"]]] = (57.5, -1.5)
+    rail_csv, out = tmp_path / "rail.csv", tmp_path / "out"
+    rail.to_csv(rail_csv, index=False)
+
+    _, months = update_features(str(rail_csv), weather, str(out), max_station_distance_km=50)
+    assert months == ["2023-01", "2023-02", "2023-03"]
+    assert not (out / "ym=2023-02").exists()
+    _, months = update_features(str(rail_csv), weather, str(out), max_station_distance_km=50)
+    assert months == []
+    assert len(pd.read_parquet(out)) == (~feb).sum()
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from src.io_schema import RAIL, WEATHER
+from src.join_weather_rail import join_rail_with_weather
+from src.weather_store import WeatherStore
+
+STATION = ("CDF", 52.0, -3.5)
+# Site, latitude offset from the station (~11 km per 0.1 deg), hours with no observation
+SITES = [("near", 0.0, range(10, 14)), ("mid", 0.09, range(12, 14)), ("far", 0.36, ())]
+
+def _weather():
+    hours = pd.date_range("2023-01-01", periods=24, freq="h", tz="UTC")
+    rows = []
+    for k, (site, dlat, gap) in enumerate(SITES):
+        for h, t in enumerate(hours):
+            if h not in gap:
+                rows.append((t, site, STATION[1] + dlat, STATION[2], 5.0, float(k), 3.0))
+    return pd.DataFrame(rows, columns=[WEATHER["time"], WEATHER["site"], WEATHER["lat"], WEATHER["lon"]]
+                        + WEATHER["features"])
+
+def _rail():
+    times = ["2023-01-01T08:05:00Z", "2023-01-01T10:10:00Z", "2023-01-01T12:40:00Z"]
+    return pd.DataFrame({
+        RAIL["time"]: times,
+        RAIL["station"]: STATION[0],
+        RAIL["lat"]: STATION[1],
+        RAIL["lon"]: STATION[2],
+        RAIL["target"]: [1.0, 2.0, 3.0],
+    })
+
+@pytest.fixture(params=["frame", "store"])
+def weather(request, tmp_path):
+    w = _weather()
+    if request.param == "frame":
+        return w
+    store = WeatherStore(str(tmp_path / "store"))
+    store.write(w, tag="w")
+    return store
+
+def test_gap_at_nearest_site_falls_back_to_next_rank(weather):
+    joined, stats = join_rail_with_weather(_rail(), weather, time_tolerance_minutes=30,
+                                           max_station_distance_km=None, fallback_k=3)
+    joined = joined.set_index(RAIL["target"])
+
+    assert list(joined["_site_rank"].loc[[1.0, 2.0, 3.0]]) == [0, 1, 2]
+    assert list(joined["_nearest_site"].astype(str).loc[[1.0, 2.0, 3.0]]) == ["near", "mid", "far"]
+    # Features come from the site actually joined (rain_mm encodes the site)
+    assert list(joined["rain_mm"].loc[[1.0, 2.0, 3.0]]) == [0.0, 1.0, 2.0]
+    assert joined.loc[2.0, "_site_dist_km"] == pytest.approx(10.0, abs=0.5)
+    assert stats.fallback_rows == 2 and stats.joined_rows == 3 and stats.dropped_time == 0
+
+def test_fallback_ranks_respect_max_distance(weather):
+    joined, stats = join_rail_with_weather(_rail(), weather, time_tolerance_minutes=30,
+                                           max_station_distance_km=20, fallback_k=3)
+
+    # The 12:40 event's only site with data in tolerance is ~40 km away: dropped, not joined there
+    assert sorted(joined[RAIL["target"]]) == [1.0, 2.0]
+    assert stats.fallback_rows == 1
+    assert stats.dropped_time == 1 and stats.dropped_distance == 0
+
+def test_fallback_disabled_with_k_1(weather):
+    joined, stats = join_rail_with_weather(_rail(), weather, time_tolerance_minutes=30,
+                                           max_station_distance_km=None, fallback_k=1)
+    assert list(joined[RAIL["target"]]) == [1.0]
+    assert (joined["_site_rank"] == 0).all()
+    assert stats.fallback_rows == 0 and stats.dropped_time == 2
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+import midas
+
+DATASET = "uk-hourly-weather-obs"
+VERSION = "dataset-version-202007"
+QC = "qc-version-1"
+STATIONS = [
+    # src_id, station_name, station_file_name, historic_county, lat, lon
+    (9, "CARDIFF", "cardiff", "south-glamorgan", 51.49, -3.18),
+    (20, "ABERPORTH", "aberporth", "dyfed", 52.14, -4.57),
+    (31, "VALLEY", "valley", "gwynedd", 53.25, -4.54),
+]
+
+def _badc(columns, rows):
+    lines = ["Conventions,G,BADC-CSV,1", "title,G,test file", "data", ",".join(columns)]
+    lines += [",".join(str(v) for v in r) for r in rows]
+    lines.append("end data")
+    return ("\n".join(lines) + "\n").encode()
+
+def _station_year(src_id, year):
+    rows = [(f"{year}-01-{1 + h // 24:02d} {h % 24:02d}:00:00", src_id, 5.0 + h % 7, 10 + h % 5, 0.2 * (h % 3))
+            for h in range(72)]
+    return _badc(["ob_time", "src_id", "air_temperature", "wind_speed", "precipitation_amount"], rows)
+
+def build_mirror(years):
+    """{url path: bytes} for a MIDAS open data tree with STATIONS and one file per station-year."""
+    files = {}
+    meta_url = midas.station_metadata_url("", DATASET, VERSION)
+    files[meta_url] = _badc(
+        ["src_id", "station_name", "station_file_name", "historic_county", "station_latitude", "station_longitude",
+         "first_year", "last_year"],
+        [(s, n, f, c, lat, lon, 1990, 2030) for s, n, f, c, lat, lon in STATIONS],
+    )
+    for src_id, _, file_name, county, _, _ in STATIONS:
+        for year in years:
+            files[midas.station_year_url("", DATASET, VERSION, QC, county, f"{src_id:05d}_{file_name}", year)] = (
+                _station_year(src_id, year))
+    return files
+
+class Mirror:
+    """Local CEDA stand-in: HEAD/GET with ETags and Range/If-Range, logging every request."""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []  # (method, path, Range, If-Range)
+        self.lock = threading.Lock()
+
+    def etag(self, path):
+        return '"%s"' % hashlib.md5(self.files[path]).hexdigest()
+
+def _handler(mirror):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *a):
+            pass
+
+        def _send(self, status, body=b"", headers=()):
+            self.send_response(status)
+            for k, v in headers:
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            with mirror.lock:
+                mirror.requests.append((self.command, self.path, self.headers.get("Range"), self.headers.get("If-Range")))
+            data = mirror.files.get(self.path)
+            if data is None:
+                return self._send(404)
+            etag = mirror.etag(self.path)
+            rng = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if rng and (if_range is None or if_range == etag):
+                start = int(rng.split("=")[1].split("-")[0])
+                if start >= len(data):
+                    return self._send(416, headers=[("Content-Range", f"bytes */{len(data)}")])
+                return self._send(206, data[start:], [("ETag", etag),
+                                                      ("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")])
+            self._send(200, data, [("ETag", etag)])
+
+    return Handler
+
+@pytest.fixture
+def mirror(monkeypatch):
+    m = Mirror(build_mirror([2023, 2024]))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _handler(m))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("CEDA_USER", "user")
+    monkeypatch.setenv("CEDA_PASSWORD", "pass")
+    m.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield m
+    httpd.shutdown()
+    httpd.server_close()
+
+def _run(monkeypatch, mirror, tmp_path, stations="9,31", years="2023,2024"):
+    monkeypatch.setattr(sys, "argv", [
+        "midas.py", "--stations", stations, "--years", years, "--base-url", mirror.base_url,
+        "--dataset", DATASET, "--version", VERSION, "--qc", QC, "--workers", "4",
+        "--raw-dir", str(tmp_path / "raw"), "--out", str(tmp_path / "weather.csv"),
+    ])
+    midas.main()
+    return pd.read_csv(tmp_path / "weather.csv")
+
+def _data_gets(mirror):
+    return sorted(p for method, p, _, _ in mirror.requests if method == "GET" and "station-metadata" not in p)
+
+def test_station_folders_resolved_from_metadata(mirror, monkeypatch, tmp_path):
+    out = _run(monkeypatch, mirror, tmp_path)
+
+    # Folder names and counties come from the metadata file, not from the command line
+    assert _data_gets(mirror) == sorted(
+        f"/{DATASET}/{VERSION}/{county}/{src:05d}_{name}/{QC}/"
+        f"midas-open_{DATASET}_dv-202007_{county}_{src:05d}_{name}_qcv-1_{year}.csv"
+        for src, _, name, county, _, _ in STATIONS if src in (9, 31) for year in (2023, 2024)
+    )
+    assert set(out["site_name"]) == {"CARDIFF", "VALLEY"}
+    assert len(out) == 4 * 72
+    valley = out[out["site_name"] == "VALLEY"]
+    assert valley["lat"].iloc[0] == pytest.approx(53.25)
+
+def test_unknown_station_is_rejected(mirror, monkeypatch, tmp_path):
+    with pytest.raises(SystemExit, match="999"):
+        _run(monkeypatch, mirror, tmp_path, stations="9,999")
+
+def test_resume_truncated_download(mirror, tmp_path):
+    path = midas.station_year_url("", DATASET, VERSION, QC, "dyfed", "00020_aberporth", 2023)
+    data = mirror.files[path]
+    out = tmp_path / "f.csv"
+    # An interrupted earlier run: .part holds the first 100 bytes, the sidecar the server's ETag
+    (tmp_path / "f.csv.part").write_bytes(data[:100])
+    (tmp_path / "f.csv.meta.json").write_text(json.dumps({"size": len(data), "etag": mirror.etag(path),
+                                                          "complete": False}))
+
+    assert midas.download_file(mirror.base_url + path, str(out), auth=("user", "pass"))
+    assert out.read_bytes() == data
+    assert not os.path.exists(str(out) + ".part")
+    assert mirror.requests == [("GET", path, "bytes=100-", mirror.etag(path))]
+
+def test_resume_restarts_when_file_changed(mirror, tmp_path):
+    path = midas.station_year_url("", DATASET, VERSION, QC, "dyfed", "00020_aberporth", 2023)
+    out = tmp_path / "f.csv"
+    (tmp_path / "f.csv.part").write_bytes(b"x" * 100)
+    (tmp_path / "f.csv.meta.json").write_text(json.dumps({"size": 500, "etag": '"stale"', "complete": False}))
+
+    assert midas.download_file(mirror.base_url + path, str(out), auth=("user", "pass"))
+    # If-Range did not match, so the server sent the whole file and the stale prefix was dropped
+    assert out.read_bytes() == mirror.files[path]
+
+def test_rerun_skips_complete_files(mirror, monkeypatch, tmp_path):
+    first = _run(monkeypatch, mirror, tmp_path)
+    mirror.requests.clear()
+    second = _run(monkeypatch, mirror, tmp_path)
+
+    # Every file (metadata included) is known complete from its size/ETag sidecar: no requests at all
+    assert mirror.requests == []
+    pd.testing.assert_frame_equal(first, second)
+
+    # A file that lost its sidecar is checked with a HEAD request only
+    path = midas.station_year_url("", DATASET, VERSION, QC, "south-glamorgan", "00009_cardiff", 2024)
+    os.remove(tmp_path / "raw" / "south-glamorgan" / "00009_cardiff" / (os.path.basename(path) + ".meta.json"))
+    _run(monkeypatch, mirror, tmp_path)
+    assert mirror.requests == [("HEAD", path, None, None)]
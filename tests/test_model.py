@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import model
+from src.model import search_hyperparameters
+
+def _data(n=400):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame({"rain_mm": rng.exponential(1, n), "wind_speed_mps": rng.gamma(2, 2, n)})
+    y = pd.Series(2 * X["rain_mm"] + rng.normal(0, 0.1, n))
+    t = pd.Series(pd.date_range("2023-01-01", periods=n, freq="h", tz="UTC"))
+    return X, y, t
+
+def test_interrupted_array_save_is_redone(tmp_path, monkeypatch):
+    X, y, t = _data()
+    real_save = np.save
+
+    def save_then_die(f, arr):
+        real_save(f, arr[: len(arr) // 2])
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(model.np, "save", save_then_die)
+    with pytest.raises(KeyboardInterrupt):
+        search_hyperparameters(X, y, t, {"max_depth": [3]}, n_folds=2, n_jobs=1, cache_dir=str(tmp_path))
+    monkeypatch.setattr(model.np, "save", real_save)
+
+    (data_dir,) = [p for p in tmp_path.iterdir() if p.name.startswith("data-")]
+    assert not os.path.exists(data_dir / "y.npy")
+    summary, folds = search_hyperparameters(X, y, t, {"max_depth": [3]}, n_folds=2, n_jobs=1, cache_dir=str(tmp_path))
+    assert len(np.load(data_dir / "y.npy")) == len(y)
+    assert len(folds) == 2 and np.isfinite(summary["mae"]).all()
+
+def test_rerun_reports_cached_folds(tmp_path, capsys):
+    X, y, t = _data()
+    grid = {"max_depth": [3, 5]}
+    _, first = search_hyperparameters(X, y, t, grid, n_folds=2, n_jobs=1, cache_dir=str(tmp_path))
+    _, second = search_hyperparameters(X, y, t, grid, n_folds=2, n_jobs=1, cache_dir=str(tmp_path))
+
+    assert not first["cached"].any() and second["cached"].all()
+    pd.testing.assert_frame_equal(first.drop(columns="cached"), second.drop(columns="cached"))
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from benchmarks.synthetic import make_rail, make_sites, make_weather
+from src.features import make_xy
+from src.join_weather_rail import join_rail_with_weather
+from src.predict import PRED_COL, predict_parquet
+
+@pytest.fixture(scope="module")
+def joined():
+    sites = make_sites(10)
+    weather, grid = make_weather(sites, days=10)
+    joined, _ = join_rail_with_weather(make_rail(sites, grid, n_events=800), weather)
+    return joined
+
+@pytest.fixture(scope="module")
+def model(joined):
+    X, y = make_xy(joined)
+    return RandomForestRegressor(n_estimators=5, max_depth=4, random_state=0).fit(X, y)
+
+class FailingModel:
+    """Wraps a model and fails on the second predict call, after the first batch is written."""
+
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    def predict(self, X):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("model exploded")
+        return self.model.predict(X)
+
+def test_empty_input_replaces_stale_output(joined, model, tmp_path):
+    data, empty = tmp_path / "joined.parquet", tmp_path / "empty.parquet"
+    joined.to_parquet(data)
+    joined.iloc[:0].to_parquet(empty)
+    out = tmp_path / "pred.parquet"
+
+    assert predict_parquet(model, str(data), str(out), batch_rows=300, n_jobs=1) == len(joined)
+    full_schema = pq.read_schema(out)
+    assert PRED_COL in full_schema.names
+
+    assert predict_parquet(model, str(empty), str(out), n_jobs=1) == 0
+    assert pq.read_metadata(out).num_rows == 0
+    assert pq.read_schema(out).remove_metadata().equals(full_schema.remove_metadata())
+
+def test_failed_run_leaves_no_temp_file(joined, model, tmp_path):
+    data, out = tmp_path / "joined.parquet", tmp_path / "pred.parquet"
+    joined.to_parquet(data)
+    with pytest.raises(RuntimeError, match="exploded"):
+        predict_parquet(FailingModel(model), str(data), str(out), batch_rows=300, n_jobs=1)
+    assert os.listdir(tmp_path) == ["joined.parquet"]
@@ -0,0 +1,25 @@
+import builtins
+import json
+
+from src import profiling
+
+def test_profiling_without_resource_module(monkeypatch, tmp_path):
+    # Windows has no resource module; instrumentation must keep working without it
+    real_import = builtins.__import__
+
+    def no_resource(name, *args, **kwargs):
+        if name == "resource":
+            raise ImportError("No module named 'resource'")
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_resource)
+    monkeypatch.setattr(profiling, "rss_mb", lambda: profiling.max_rss_mb())
+    assert profiling.max_rss_mb() == 0.0
+
+    path = tmp_path / "trace.json"
+    with profiling.profile_run(str(path)):
+        with profiling.stage("work", rows=3):
+            sum(range(1000))
+    trace = json.loads(path.read_text())
+    assert "work" in [s["name"] for s in trace["stages"]]
+    assert trace["max_rss_mb"] == 0.0
@@ -0,0 +1,92 @@
+import http.client
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import WELSH_STATIONS, make_sites, make_weather
+from src.geo import SiteIndex
+from src.io_schema import RAIL, WEATHER
+from src.serving import MicroBatcher, Scorer, ScoringService, WeatherState, make_server
+
+class ConstantModel:
+    """Stand-in model: predicts the rain feature, or fails when told to."""
+
+    def __init__(self):
+        self.fail = False
+
+    def predict(self, X):
+        if self.fail:
+            raise RuntimeError("model exploded")
+        return X["rain_mm"].to_numpy(dtype=float)
+
+@pytest.fixture
+def server():
+    sites = make_sites(10)
+    weather, _ = make_weather(sites, days=3)
+    stations = pd.DataFrame(WELSH_STATIONS, columns=[RAIL["station"], RAIL["lat"], RAIL["lon"]])
+    model = ConstantModel()
+    scorer = Scorer(model, WeatherState(weather), stations,
+                    SiteIndex.from_frame(sites, WEATHER["site"], WEATHER["lat"], WEATHER["lon"]),
+                    max_station_distance_km=None)
+    service = ScoringService(scorer, max_batch=8, max_wait_ms=1.0)
+    httpd = make_server(service, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_address[1], model, scorer.stations
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+def _request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request(method, path, body=None if body is None else json.dumps(body))
+    resp = conn.getresponse()
+    out = resp.status, json.loads(resp.read())
+    conn.close()
+    return out
+
+def test_score_ok(server):
+    port, _, stations = server
+    status, body = _request(port, "GET", f"/score?station={stations[0]}&time=2023-01-02T08:00")
+    assert status == 200 and body[0]["station"] == stations[0]
+    assert np.isfinite(body[0]["pred_delay_minutes"])
+
+@pytest.mark.parametrize("body", [
+    {"requests": [1]},
+    {"requests": [{"station": ["CDF"]}]},
+    {"requests": [{"station": "CDF", "time": 5}]},
+    {"requests": "CDF"},
+    [1, 2],
+])
+def test_malformed_score_requests_get_400(server, body):
+    port, _, _ = server
+    status, payload = _request(port, "POST", "/score", body)
+    assert status == 400 and "error" in payload
+
+def test_unknown_station_gets_404(server):
+    port, _, _ = server
+    assert _request(port, "GET", "/score?station=NOPE")[0] == 404
+
+def test_model_failure_gets_500_and_server_keeps_serving(server):
+    port, model, stations = server
+    model.fail = True
+    status, payload = _request(port, "POST", "/score", {"requests": [{"station": s} for s in stations[:3]]})
+    assert status == 500 and "error" in payload
+    model.fail = False
+    assert _request(port, "GET", f"/score?station={stations[0]}")[0] == 200
+
+def test_failing_item_only_fails_its_own_request():
+    def fn(items):
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [i.upper() for i in items]
+
+    batcher = MicroBatcher(fn, max_batch=8, max_wait_ms=50.0)
+    futures = [batcher.submit(i) for i in ["a", "bad", "c"]]
+    batcher.close()
+    assert futures[0].result() == "A" and futures[2].result() == "C"
+    with pytest.raises(ValueError):
+        futures[1].result()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import LAT_RANGE, LON_RANGE, make_rail, make_sites, make_weather
+from src.io_schema import RAIL
+from src.join_weather_rail import join_rail_with_weather
+from src.streaming import stream_join_csv
+
+def _plain(df: pd.DataFrame) -> pd.DataFrame:
+    # Parts carry their own category sets; compare values
+    out = df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+    out[RAIL["time"]] = pd.to_datetime(out[RAIL["time"]], utc=True)
+    return out.sort_values(["_t", RAIL["station"]], kind="stable").reset_index(drop=True)
+
+@pytest.mark.parametrize("chunk_rows", [700, 3000])
+def test_stream_join_matches_in_memory_join(tmp_path, chunk_rows):
+    # Gappy weather: deltas often lag to a reading up to the tolerance before t - h, which
+    # the per-chunk store reads have to include
+    sites = make_sites(30)
+    weather, grid = make_weather(sites, days=40, missing_frac=0.3)
+    rail = make_rail(sites, grid, n_events=6000)
+    rail_csv, weather_csv = tmp_path / "rail.csv", tmp_path / "weather.csv"
+    rail.to_csv(rail_csv, index=False)
+    weather.to_csv(weather_csv, index=False)
+
+    expected, expected_stats = join_rail_with_weather(pd.read_csv(rail_csv), pd.read_csv(weather_csv))
+    stats = stream_join_csv(str(rail_csv), str(weather_csv), str(tmp_path / "out"), chunk_rows=chunk_rows)
+    streamed = pd.read_parquet(tmp_path / "out")
+
+    assert stats.joined_rows == expected_stats.joined_rows
+    pd.testing.assert_frame_equal(_plain(streamed)[expected.columns], _plain(expected), check_dtype=False)
+
+def test_later_chunk_with_more_stations(tmp_path):
+    # The first chunk's station codes fit in int8, the second chunk's don't
+    sites = make_sites(20)
+    weather, _ = make_weather(sites, days=5)
+    rng = np.random.default_rng(0)
+    n = 300
+    rail = pd.DataFrame({
+        RAIL["time"]: pd.date_range("2023-01-01 06:00", periods=2 * n, freq="5min", tz="UTC"),
+        RAIL["station"]: ["CDF"] * n + [f"X{i:03d}" for i in range(n)],
+        RAIL["target"]: rng.exponential(3, 2 * n).round(1),
+        RAIL["lat"]: np.r_[np.full(n, 51.4752), rng.uniform(*LAT_RANGE, n)],
+        RAIL["lon"]: np.r_[np.full(n, -3.1791), rng.uniform(*LON_RANGE, n)],
+    })
+    rail_csv, weather_csv = tmp_path / "rail.csv", tmp_path / "weather.csv"
+    rail.to_csv(rail_csv, index=False)
+    weather.to_csv(weather_csv, index=False)
+
+    expected, _ = join_rail_with_weather(pd.read_csv(rail_csv), pd.read_csv(weather_csv), max_station_distance_km=None)
+    stream_join_csv(str(rail_csv), str(weather_csv), str(tmp_path / "out"), chunk_rows=n, max_station_distance_km=None)
+    streamed = pd.read_parquet(tmp_path / "out")
+
+    assert streamed[RAIL["station"]].nunique() == n + 1
+    pd.testing.assert_frame_equal(_plain(streamed)[expected.columns], _plain(expected), check_dtype=False)
@@ -0,0 +1,19 @@
+from benchmarks.synthetic import make_sites, make_weather
+from src.weather_store import WeatherStore, ingest_csv
+
+def test_reingest_with_other_chunk_size_replaces_rows(tmp_path):
+    weather, _ = make_weather(make_sites(5), days=10)
+    csv = tmp_path / "weather.csv"
+    weather.to_csv(csv, index=False)
+    other = tmp_path / "weather-2.csv"
+    weather.iloc[:50].to_csv(other, index=False)
+    root = str(tmp_path / "store")
+
+    ingest_csv(str(other), root, chunk_rows=20)
+    ingest_csv(str(csv), root, chunk_rows=100)
+    ingest_csv(str(csv), root, chunk_rows=333)
+    store = ingest_csv(str(csv), root, chunk_rows=5000)
+
+    # weather-2's files share the "weather" prefix and must survive
+    assert store.count_rows() == len(weather) + 50
+    assert len(store.read()) == len(weather) + 50